@@ -0,0 +1,38 @@
+-- Forecast service: per-series normal-equation state for incremental refits
+-- Idempotent creation with IF NOT EXISTS guards
+
+-- forecast_model_state
+-- counts/sums/sumsq are the 7 per-weekday aggregates (Monday=0) of the gap-filled
+-- daily units up to watermark, optionally weighted by decay^(watermark - date).
+-- One state per (account, product, country); country NULL is the all-countries series.
+DO $$ BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'forecast_model_state' AND table_schema = 'public') THEN
+    CREATE TABLE public.forecast_model_state (
+      account_id   TEXT NOT NULL,
+      product_code TEXT NOT NULL,
+      country      TEXT,
+      counts       DOUBLE PRECISION[] NOT NULL,
+      sums         DOUBLE PRECISION[] NOT NULL,
+      sumsq        DOUBLE PRECISION[] NOT NULL,
+      watermark    DATE NOT NULL,
+      decay        DOUBLE PRECISION NOT NULL DEFAULT 1.0,
+      run_id       TEXT,
+      updated_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+      CONSTRAINT uq_fms_series UNIQUE NULLS NOT DISTINCT (account_id, product_code, country),
+      CONSTRAINT fk_fms_account FOREIGN KEY (account_id) REFERENCES public.account(id) ON DELETE CASCADE,
+      CONSTRAINT fk_fms_product FOREIGN KEY (account_id, product_code) REFERENCES public.product(account_id, product_code) ON DELETE CASCADE
+    );
+  END IF;
+END $$;
+
+-- States created before country was part of the key: the old key let a run for one
+-- country start from (and overwrite) another's state, so those states cannot be
+-- trusted. Drop them (the next incremental run rebuilds each from a full load) and
+-- swap the key for the per-country one.
+DO $$ BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.table_constraints WHERE constraint_name = 'forecast_model_state_pkey' AND table_schema = 'public') THEN
+    DELETE FROM public.forecast_model_state;
+    ALTER TABLE public.forecast_model_state DROP CONSTRAINT forecast_model_state_pkey;
+    ALTER TABLE public.forecast_model_state ADD CONSTRAINT uq_fms_series UNIQUE NULLS NOT DISTINCT (account_id, product_code, country);
+  END IF;
+END $$;
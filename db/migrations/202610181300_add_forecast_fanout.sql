@@ -0,0 +1,41 @@
+-- Forecasting stage of the ETL DAG: change tracking on sales_daily, dispatch watermark, shard log
+-- Idempotent creation with IF NOT EXISTS guards
+
+-- sales_daily.updated_at
+-- Set on insert and bumped by the ETL upsert only when a row's values change, so
+-- the DAG re-forecasts just the series touched since its last watermark.
+-- now() is evaluated once by ADD COLUMN: existing rows get the migration time, no table rewrite.
+ALTER TABLE public.sales_daily ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS idx_sales_daily_updated_at ON public.sales_daily(updated_at);
+
+-- forecast_watermark
+-- sales_daily.updated_at up to which changed series have been forecast (one row per DAG)
+DO $$ BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'forecast_watermark' AND table_schema = 'public') THEN
+    CREATE TABLE public.forecast_watermark (
+      name        TEXT PRIMARY KEY,
+      cursor_ts   TIMESTAMPTZ NOT NULL,
+      updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+  END IF;
+END $$;
+
+-- forecast_shard_runs
+-- Size and runtime of every forecast shard, for tuning the shard target size
+DO $$ BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'forecast_shard_runs' AND table_schema = 'public') THEN
+    CREATE TABLE public.forecast_shard_runs (
+      dag_run_id    TEXT NOT NULL,
+      shard         INT NOT NULL,
+      account_id    TEXT NOT NULL,
+      country       TEXT,
+      products      INT NOT NULL,
+      history_rows  BIGINT NOT NULL,
+      seconds       DOUBLE PRECISION,
+      status        TEXT NOT NULL,
+      error         TEXT,
+      finished_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+      PRIMARY KEY (dag_run_id, shard)
+    );
+  END IF;
+END $$;
@@ -0,0 +1,54 @@
+-- Forecast service: Postgres work queue shared by every replica and run_once.py worker
+-- Idempotent creation with IF NOT EXISTS guards
+
+-- forecast_queue_runs
+-- One row per queued forecast run; done/failed are bumped as workers finish tasks
+-- and status becomes 'completed' once done + failed = total.
+DO $$ BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'forecast_queue_runs' AND table_schema = 'public') THEN
+    CREATE TABLE public.forecast_queue_runs (
+      run_id        TEXT PRIMARY KEY,
+      account_id    TEXT NOT NULL,
+      country       TEXT,
+      horizon_days  INT NOT NULL,
+      incremental   BOOLEAN NOT NULL DEFAULT false,
+      decay         DOUBLE PRECISION,
+      triage        BOOLEAN,  -- NULL: the worker's FORECAST_TRIAGE
+      total         INT NOT NULL,
+      done          INT NOT NULL DEFAULT 0,
+      failed        INT NOT NULL DEFAULT 0,
+      status        TEXT NOT NULL DEFAULT 'queued',  -- queued | running | completed
+      created_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+      started_at    TIMESTAMPTZ,
+      finished_at   TIMESTAMPTZ
+    );
+  END IF;
+END $$;
+
+ALTER TABLE public.forecast_queue_runs ADD COLUMN IF NOT EXISTS triage BOOLEAN;
+
+-- forecast_queue_tasks
+-- One row per (run, product). Workers claim queued rows with FOR UPDATE SKIP LOCKED and
+-- hold them under a lease they keep extending; an expired lease is put back in the queue
+-- (or failed after max attempts) by the next claim.
+DO $$ BEGIN
+  IF NOT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'forecast_queue_tasks' AND table_schema = 'public') THEN
+    CREATE TABLE public.forecast_queue_tasks (
+      task_id           BIGSERIAL PRIMARY KEY,
+      run_id            TEXT NOT NULL REFERENCES public.forecast_queue_runs(run_id) ON DELETE CASCADE,
+      account_id        TEXT NOT NULL,
+      product_code      TEXT NOT NULL,
+      status            TEXT NOT NULL DEFAULT 'queued',  -- queued | leased | done | failed
+      attempts          INT NOT NULL DEFAULT 0,
+      lease_owner       TEXT,
+      lease_expires_at  TIMESTAMPTZ,
+      error             TEXT,
+      updated_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+      UNIQUE (run_id, product_code)
+    );
+  END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_fqt_queued ON public.forecast_queue_tasks(task_id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_fqt_leased ON public.forecast_queue_tasks(lease_expires_at) WHERE status = 'leased';
+CREATE INDEX IF NOT EXISTS idx_fqt_owner ON public.forecast_queue_tasks(lease_owner) WHERE status = 'leased';
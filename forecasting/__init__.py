@@ -0,0 +1,6 @@
+"""Demand forecasting trainer (``train.py``) and the modules it shares with services/forecast.
+
+``artifact_store`` (the columnar model store) and ``calendar_cache`` (calendar
+features) are imported by the forecast service as ``forecasting.artifact_store``
+and ``forecasting.calendar_cache``: the repository root must be on its path.
+"""
@@ -0,0 +1,314 @@
+"""Columnar artifact store: many series per file, latest-per-key index, memory-mapped reads.
+
+A segment is one directory of ``.npy`` column blocks holding every series written
+together (one shard of a batch run, or a single-series run). Segments are
+partitioned by day under ``<root>/segments/YYYYMMDD/`` and never modified once
+written. ``<root>/index.npy`` maps each key to the segment and row of its latest
+model; it is sorted by key so a lookup is one binary search, and loading a model
+memory-maps the segment columns and reads a single row.
+
+Segments can be written by any number of processes at once; merging them into the
+index (``commit``, ``compact``, ``rebuild_index``, ``prune``) takes an exclusive
+lock on ``<root>/index.lock`` so concurrent writers never lose each other's entries.
+Many small segments (one per service publish) are merged by ``compact``.
+
+Layout of a segment (n rows, ragged columns use ``*_offsets.npy`` of length n + 1):
+
+    keys.npy, created.npy, last_date.npy, sigma.npy, endog_len.npy, metrics.npy
+    feature_set.npy + features.json   feature names, deduplicated per segment
+    coef.npy, last_x.npy, coef_offsets.npy     coefficients / last design row
+    forecast.npy (m, 3), forecast_offsets.npy  yhat, p10, p90 from last_date + 1
+    meta.bin, meta_offsets.npy                 per-row JSON (config, summary, ...)
+"""
+from __future__ import annotations
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+METRICS_DTYPE = np.dtype([('mape', '<f8'), ('wmape', '<f8'), ('mae', '<f8'), ('samples', '<i8')])
+INDEX_FILE = 'index.npy'
+LOCK_FILE = 'index.lock'
+
+
+@dataclass
+class ArtifactRecord:
+    key: str
+    features: List[str]
+    coef: np.ndarray  # (p,)
+    last_x: np.ndarray  # (p,) last design row, carries exogenous values forward
+    sigma: float
+    last_date: np.datetime64  # datetime64[D] of the last training day
+    forecast: np.ndarray  # (h, 3): yhat, p10, p90 from last_date + 1
+    metrics: dict
+    endog_len: int
+    meta: dict = field(default_factory=dict)
+    created: np.datetime64 = field(default_factory=lambda: np.datetime64(datetime.utcnow(), 's'))
+
+
+def _ragged(parts: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in parts])
+    return offsets, (np.concatenate(parts) if parts else np.zeros(0))
+
+
+class ArtifactStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self._segments: Dict[str, Dict[str, object]] = {}
+        self._index: Optional[np.ndarray] = None
+        self._index_mtime: Optional[float] = None
+
+    # --- writes ---
+    def write_segment(self, records: Sequence[ArtifactRecord], tag: str = '') -> Optional[str]:
+        """Write `records` as one new segment; returns its id (relative path), or None if empty."""
+        if not records:
+            return None
+        now = datetime.utcnow()
+        name = now.strftime('%Y%m%dT%H%M%S%f') + (f'-{tag}' if tag else '') + f'-{os.getpid()}'
+        seg_id = f"{now.strftime('%Y%m%d')}/{name}"
+        final = self.root / 'segments' / seg_id
+        tmp = final.with_name(final.name + '.tmp')
+        tmp.mkdir(parents=True, exist_ok=False)
+
+        feature_sets: List[List[str]] = []
+        set_ids: Dict[Tuple[str, ...], int] = {}
+        fs = np.empty(len(records), dtype=np.int32)
+        for i, r in enumerate(records):
+            fs[i] = set_ids.setdefault(tuple(r.features), len(set_ids))
+            if fs[i] == len(feature_sets):
+                feature_sets.append(list(r.features))
+        metrics = np.zeros(len(records), dtype=METRICS_DTYPE)
+        for i, r in enumerate(records):
+            for name_ in ('mape', 'wmape', 'mae', 'samples'):
+                metrics[i][name_] = r.metrics.get(name_, 0)
+        coef_off, coef = _ragged([np.asarray(r.coef, dtype=np.float64) for r in records])
+        _, last_x = _ragged([np.asarray(r.last_x, dtype=np.float64) for r in records])
+        fc_off, fc = _ragged([np.asarray(r.forecast, dtype=np.float64).reshape(-1, 3) for r in records])
+        metas = [json.dumps(r.meta, default=str).encode('utf-8') for r in records]
+        meta_off = np.zeros(len(records) + 1, dtype=np.int64)
+        meta_off[1:] = np.cumsum([len(m) for m in metas])
+
+        columns = {
+            'keys': np.array([r.key for r in records]),
+            'created': np.array([r.created for r in records], dtype='datetime64[s]'),
+            'last_date': np.array([r.last_date for r in records], dtype='datetime64[D]'),
+            'sigma': np.array([r.sigma for r in records], dtype=np.float64),
+            'endog_len': np.array([r.endog_len for r in records], dtype=np.int64),
+            'metrics': metrics,
+            'feature_set': fs,
+            'coef': coef,
+            'last_x': last_x,
+            'coef_offsets': coef_off,
+            'forecast': fc.reshape(-1, 3),
+            'forecast_offsets': fc_off,
+            'meta_offsets': meta_off,
+        }
+        for col, arr in columns.items():
+            np.save(tmp / f'{col}.npy', arr)
+        (tmp / 'features.json').write_text(json.dumps(feature_sets), encoding='utf-8')
+        (tmp / 'meta.bin').write_bytes(b''.join(metas))
+        os.replace(tmp, final)
+        return seg_id
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive lock on the index across processes (read-modify-write of index.npy)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / LOCK_FILE, 'a+b') as f:
+            if os.name == 'nt':
+                import msvcrt
+
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._index, self._index_mtime = None, None  # another process may have rewritten it
+                yield
+            finally:
+                if os.name == 'nt':
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def commit(self, segments: Sequence[Optional[str]]) -> int:
+        """Merge written segments into the latest-per-key index. Returns #keys indexed."""
+        with self.locked():
+            parts = [self._read_index()] if (self.root / INDEX_FILE).exists() else []
+            for seg_id in segments:
+                if seg_id:
+                    parts.append(self._segment_entries(seg_id))
+            return self._write_index(parts)
+
+    def rebuild_index(self) -> int:
+        """Recreate the index from every segment on disk (e.g. after an interrupted batch)."""
+        with self.locked():
+            return self._write_index([self._segment_entries(s) for s in self._segment_ids()])
+
+    def compact(self, max_segments: int = 64, small_rows: int = 10000) -> Optional[str]:
+        """Rewrite the live rows of small segments into one segment once more than ``max_segments`` are live.
+
+        Segments with fewer than ``small_rows`` live rows are merged; rows keep their
+        ``created`` time and the index is repointed in place, so a model committed
+        meanwhile by another writer still wins. Returns the new segment id, if any.
+        ``prune`` then deletes the merged segments.
+        """
+        with self.locked():
+            if not (self.root / INDEX_FILE).exists():
+                return None
+            index = self._read_index().copy()
+            segments, rows = np.unique(index['segment'], return_counts=True)
+            if len(segments) <= max_segments:
+                return None
+            small = set(str(s) for s in segments[rows < small_rows])
+            if len(small) < 2:
+                return None
+            moved = np.flatnonzero(np.isin(index['segment'], list(small)))
+            seg_id = self.write_segment([self._record(str(index['key'][i])) for i in moved], tag='compact')
+            return self._repoint(index, moved, seg_id)
+
+    def _repoint(self, index: np.ndarray, moved: np.ndarray, seg_id: str) -> str:
+        seg_w = max(index.dtype['segment'].itemsize // 4, len(seg_id))
+        dtype = np.dtype([('key', index.dtype['key']), ('segment', f'<U{seg_w}'), ('row', '<i8'), ('created', 'datetime64[s]')])
+        index = index.astype(dtype)
+        index['segment'][moved] = seg_id
+        index['row'][moved] = np.arange(len(moved))
+        self._write_index([index])
+        return seg_id
+
+    def _record(self, key: str) -> 'ArtifactRecord':
+        row = self.load(key)
+        return ArtifactRecord(
+            key=key, features=row['features'], coef=row['coef'], last_x=row['last_x'], sigma=row['sigma'],
+            last_date=row['last_date'], forecast=row['forecast'], metrics=row['metrics'], endog_len=row['endog_len'],
+            meta=row['meta'], created=row['created'],
+        )
+
+    def _segment_ids(self) -> List[str]:
+        base = self.root / 'segments'
+        return sorted(p.parent.name + '/' + p.name for p in base.glob('*/*') if p.is_dir() and not p.name.endswith('.tmp'))
+
+    def _segment_entries(self, seg_id: str) -> np.ndarray:
+        seg = self._segment(seg_id)
+        keys = np.asarray(seg['keys'])
+        entries = np.zeros(len(keys), dtype=[('key', keys.dtype), ('segment', f'<U{max(len(seg_id), 1)}'), ('row', '<i8'), ('created', 'datetime64[s]')])
+        entries['key'] = keys
+        entries['segment'] = seg_id
+        entries['row'] = np.arange(len(keys))
+        entries['created'] = seg['created']
+        return entries
+
+    def _write_index(self, parts: List[np.ndarray]) -> int:
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return 0
+        key_w = max(p.dtype['key'].itemsize // 4 for p in parts)
+        seg_w = max(p.dtype['segment'].itemsize // 4 for p in parts)
+        dtype = np.dtype([('key', f'<U{key_w}'), ('segment', f'<U{seg_w}'), ('row', '<i8'), ('created', 'datetime64[s]')])
+        entries = np.concatenate([p.astype(dtype) for p in parts])
+        # latest per key: sort by (key, created, segment) and keep the last row of each key
+        entries = entries[np.lexsort((entries['segment'], entries['created'], entries['key']))]
+        last = np.ones(len(entries), dtype=bool)
+        last[:-1] = entries['key'][1:] != entries['key'][:-1]
+        index = entries[last]
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / (INDEX_FILE + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, index)
+        os.replace(tmp, self.root / INDEX_FILE)
+        self._index, self._index_mtime = None, None
+        return int(len(index))
+
+    # --- reads ---
+    def _read_index(self) -> np.ndarray:
+        path = self.root / INDEX_FILE
+        mtime = path.stat().st_mtime
+        if self._index is None or self._index_mtime != mtime:
+            # loaded, not mapped: the index is small and must stay replaceable (os.replace on Windows)
+            self._index, self._index_mtime = np.load(path), mtime
+        return self._index
+
+    def _segment(self, seg_id: str) -> Dict[str, object]:
+        seg = self._segments.get(seg_id)
+        if seg is None:
+            base = self.root / 'segments' / seg_id
+            seg = {p.stem: np.load(p, mmap_mode='r') for p in base.glob('*.npy')}
+            seg['features'] = json.loads((base / 'features.json').read_text(encoding='utf-8'))
+            seg['meta_path'] = base / 'meta.bin'
+            self._segments[seg_id] = seg
+        return seg
+
+    def keys(self) -> np.ndarray:
+        if not (self.root / INDEX_FILE).exists():
+            return np.array([], dtype=str)
+        return np.asarray(self._read_index()['key'])
+
+    def locate(self, key: str) -> Optional[Tuple[str, int]]:
+        if not (self.root / INDEX_FILE).exists():
+            return None
+        index = self._read_index()
+        i = int(np.searchsorted(index['key'], key))
+        if i >= len(index) or index['key'][i] != key:
+            return None
+        return str(index['segment'][i]), int(index['row'][i])
+
+    def load(self, key: str) -> Optional[dict]:
+        """Latest model for `key`; only that row is read from the memory-mapped segment."""
+        loc = self.locate(key)
+        if loc is None:
+            return None
+        seg_id, i = loc
+        seg = self._segment(seg_id)
+        c0, c1 = seg['coef_offsets'][i:i + 2]
+        f0, f1 = seg['forecast_offsets'][i:i + 2]
+        m0, m1 = (int(v) for v in seg['meta_offsets'][i:i + 2])
+        with open(seg['meta_path'], 'rb') as f:
+            f.seek(m0)
+            meta = json.loads(f.read(m1 - m0) or b'{}')
+        metrics = seg['metrics'][i]
+        last_date = seg['last_date'][i]
+        fc = np.array(seg['forecast'][f0:f1])
+        return {
+            'key': key,
+            'segment': seg_id,
+            'features': seg['features'][int(seg['feature_set'][i])],
+            'coef': np.array(seg['coef'][c0:c1]),
+            'last_x': np.array(seg['last_x'][c0:c1]),
+            'sigma': float(seg['sigma'][i]),
+            'last_date': last_date,
+            'created': seg['created'][i],
+            'endog_len': int(seg['endog_len'][i]),
+            'metrics': {name: metrics[name].item() for name in METRICS_DTYPE.names},
+            'forecast_dates': last_date + 1 + np.arange(len(fc)),
+            'forecast': fc,
+            'meta': meta,
+        }
+
+    def prune(self, min_age_seconds: float = 600.0) -> int:
+        """Delete segments no longer referenced by the index; returns how many were removed.
+
+        Segments younger than ``min_age_seconds`` are kept: another process may have
+        written one and not committed it yet.
+        """
+        with self.locked():
+            live = set(str(s) for s in self._read_index()['segment']) if (self.root / INDEX_FILE).exists() else set()
+            removed = 0
+            cutoff = time.time() - min_age_seconds
+            for seg_id in self._segment_ids():
+                path = self.root / 'segments' / seg_id
+                if seg_id not in live and path.stat().st_mtime < cutoff:
+                    self._segments.pop(seg_id, None)
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+            return removed
@@ -0,0 +1,92 @@
+"""Process-wide calendar feature cache: bias + weekday one-hot and holiday flags per country.
+
+Calendar features depend only on (country, date), so they are built once per country
+and span of whole years as datetime64-indexed NumPy arrays and reused (LRU) by every
+series, backtest fold and forecast horizon. Lookups are offset arithmetic: a
+contiguous window is a view, arbitrary dates are a gather.
+"""
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+CALENDAR_CACHE_SIZE = int(os.getenv("CALENDAR_CACHE_SIZE", "64"))
+
+
+@dataclass(frozen=True)
+class CalendarBlock:
+    country: Optional[str]
+    start: np.datetime64  # datetime64[D] of row 0
+    design: np.ndarray  # (n, 8): bias + weekday one-hot (Monday=0)
+    weekday: np.ndarray  # (n,) int8
+    holiday: np.ndarray  # (n,) float, 1.0 on public holidays of `country`
+
+    def __len__(self) -> int:
+        return len(self.weekday)
+
+    def offsets(self, days: np.ndarray) -> np.ndarray:
+        off = (np.asarray(days, dtype="datetime64[D]") - self.start).astype(np.int64)
+        if off.size and (off.min() < 0 or off.max() >= len(self)):
+            raise IndexError("dates outside of the calendar block")
+        return off
+
+    def window(self, first_day, n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(design, weekday, holiday) views for `n` consecutive days from `first_day`."""
+        lo = int(self.offsets(np.datetime64(first_day, "D")))
+        if lo + n > len(self):
+            raise IndexError("dates outside of the calendar block")
+        return self.design[lo:lo + n], self.weekday[lo:lo + n], self.holiday[lo:lo + n]
+
+    def take(self, days: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(design, weekday, holiday) gathered for arbitrary dates (any shape)."""
+        off = self.offsets(days)
+        return self.design[off], self.weekday[off], self.holiday[off]
+
+
+def _holiday_days(country: str, first_year: int, last_year: int) -> np.ndarray:
+    try:
+        import holidays  # lazy: optional outside of the trainer
+        cal = holidays.country_holidays(country.upper(), years=range(first_year, last_year + 1))
+    except Exception:
+        return np.array([], dtype="datetime64[D]")
+    return np.array(sorted(cal.keys()), dtype="datetime64[D]")
+
+
+@lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def _build(country: Optional[str], first_year: int, last_year: int) -> CalendarBlock:
+    start = np.datetime64(f"{first_year}-01-01", "D")
+    days = np.arange(start, np.datetime64(f"{last_year + 1}-01-01", "D"))
+    weekday = ((days.astype(np.int64) + 3) % 7).astype(np.int8)  # 1970-01-01 was a Thursday
+    design = np.zeros((len(days), 8))
+    design[:, 0] = 1.0
+    design[np.arange(len(days)), weekday.astype(np.int64) + 1] = 1.0
+    holiday = np.zeros(len(days))
+    if country:
+        holiday[np.isin(days, _holiday_days(country, first_year, last_year))] = 1.0
+    for arr in (design, weekday, holiday):
+        arr.setflags(write=False)
+    return CalendarBlock(country=country, start=start, design=design, weekday=weekday, holiday=holiday)
+
+
+def _year(day: np.datetime64) -> int:
+    return int(np.datetime64(day, "Y").astype(np.int64)) + 1970
+
+
+def calendar_block(country: Optional[str], first_day, last_day) -> CalendarBlock:
+    """Cached block covering [first_day, last_day], widened to whole calendar years."""
+    return _build(country.upper() if country else None, _year(np.datetime64(first_day, "D")), _year(np.datetime64(last_day, "D")))
+
+
+def calendar_features(country: Optional[str], days: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(design, weekday, holiday) for datetime64 `days` of any shape."""
+    days = np.asarray(days, dtype="datetime64[D]")
+    if days.size == 0:
+        return np.zeros(days.shape + (8,)), np.zeros(days.shape, dtype=np.int8), np.zeros(days.shape)
+    return calendar_block(country, days.min(), days.max()).take(days)
+
+
+def cache_info():
+    return _build.cache_info()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Ensure the repository root is on sys.path so `import forecasting.*` works from any directory
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
@@ -0,0 +1,44 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from forecasting.train import TrainConfig, build_design_matrix, expanding_backtest_batch, fit_linear, predict_linear, rolling_backtest_linear, wmape
+
+
+def _series(n, p, seed):
+    rng = np.random.default_rng(seed)
+    X = np.c_[np.ones(n), rng.normal(size=(n, p - 1))]
+    y = X @ rng.normal(size=p) + rng.normal(scale=0.1, size=n)
+    return X, y
+
+
+def test_expanding_backtest_batch_matches_refit_per_origin():
+    horizon = 7
+    series = [_series(120, 8, 1) + (np.array([30, 60, 90, 118]),), _series(80, 10, 2) + (np.arange(20, 80, 5),), _series(50, 8, 3) + (np.array([45]),)]
+    for (X, y, origins), (yhat, y_true, valid) in zip(series, expanding_backtest_batch(series, horizon)):
+        assert yhat.shape == (len(origins), horizon)
+        for k, o in enumerate(origins):
+            coef, _ = fit_linear(X[:o], y[:o])  # naive: refit on the window, predict the next days
+            rows = np.arange(o, min(o + horizon, len(y)))
+            assert np.array_equal(valid[k], np.arange(horizon) < len(rows))
+            assert np.allclose(yhat[k][valid[k]], predict_linear(X[rows], coef))
+            assert np.array_equal(y_true[k][valid[k]], y[rows])
+
+
+def test_rolling_backtest_reports_the_folds_it_scored():
+    cfg = TrainConfig(country='FR')
+    df = pd.DataFrame({'date': pd.date_range('2025-03-01', periods=30, freq='D'), 'sales': np.arange(30) % 7 + 1.0})
+    X, y, _ = build_design_matrix(df, cfg)
+    metrics = rolling_backtest_linear(df, cfg, splits=3, horizon=14)  # folds at -12 (skipped), 2 and 16
+    assert metrics.samples == 2
+    maes, wmapes = [], []
+    for o in (2, 16):
+        coef, _ = fit_linear(X[:o], y[:o])
+        yhat = predict_linear(X[o:o + 14], coef)
+        maes.append(np.mean(np.abs(y[o:o + 14] - yhat)))
+        wmapes.append(wmape(y[o:o + 14], yhat))
+    assert np.isclose(metrics.mae, np.mean(maes)) and np.isclose(metrics.wmape, np.mean(wmapes))
+
+    too_short = rolling_backtest_linear(df.iloc[:10], cfg, splits=3, horizon=14)
+    assert too_short.samples == 0 and math.isnan(too_short.mae)
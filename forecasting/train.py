@@ -1,6 +1,9 @@
 import argparse
 import os
 import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -11,8 +14,12 @@ import pandas as pd
 from joblib import dump
 from pydantic import BaseModel
 from tqdm import tqdm
-import holidays
-from dataclasses import dataclass
+
+if __package__ in (None, ""):  # run as a script (python forecasting/train.py): import the package from the repo root
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from forecasting.artifact_store import ArtifactRecord, ArtifactStore
+from forecasting.calendar_cache import calendar_features
 
 
 class TrainConfig(BaseModel):
@@ -30,6 +37,8 @@ class TrainConfig(BaseModel):
     dsn: Optional[str] = None
     from_csv: Optional[str] = None
     output_dir: str = "forecasting/artifacts"
+    artifact_format: str = "columnar"  # columnar store under <output_dir>/store, or "tree" (one directory per run)
+    backtest_days: Optional[int] = None
 
 
 @dataclass
@@ -40,8 +49,9 @@ class BacktestMetrics:
     samples: int
 
 
-def load_from_db(cfg: TrainConfig) -> pd.DataFrame:
-    assert cfg.dsn, "DSN requis pour la lecture en base"
+def load_from_db(cfg: TrainConfig, conn=None) -> pd.DataFrame:
+    """Load the daily series of cfg.product_id; reuses `conn` (psycopg2) when given."""
+    assert cfg.dsn or conn is not None, "DSN requis pour la lecture en base"
     # Lazy import to avoid hard dependency when using CSV mode
     import psycopg2  # type: ignore
     from psycopg2.extras import RealDictCursor  # type: ignore
@@ -70,6 +80,12 @@ def load_from_db(cfg: TrainConfig) -> pd.DataFrame:
         "start": cfg.start_date or (datetime.utcnow() - timedelta(days=365*2)).date(),
         "end": cfg.end_date or (datetime.utcnow() - timedelta(days=1)).date(),
     }
+    if conn is not None:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+        conn.rollback()  # end the read transaction, keep the connection
+        return pd.DataFrame(rows)
     with psycopg2.connect(cfg.dsn, cursor_factory=RealDictCursor) as conn:
         with conn.cursor() as cur:
             cur.execute(query, params)
@@ -78,6 +94,88 @@ def load_from_db(cfg: TrainConfig) -> pd.DataFrame:
     return df
 
 
+# Binary COPY row of (date, float8 sales, float8 price, float8 stock): field count, then (length, value) per field
+_COPY_ROW = np.dtype([
+    ('nfields', '>i2'),
+    ('l_date', '>i4'), ('date', '>i4'),
+    ('l_sales', '>i4'), ('sales', '>f8'),
+    ('l_price', '>i4'), ('price', '>f8'),
+    ('l_stock', '>i4'), ('stock', '>f8'),
+])
+_PG_EPOCH = np.datetime64('2000-01-01', 'D')
+
+
+def parse_copy_binary(buf: bytes) -> pd.DataFrame:
+    """Decode a `COPY ... TO STDOUT (FORMAT binary)` stream of fixed-width rows into NumPy columns.
+
+    NULLs must be mapped in SQL (NaN for floats) so every row has the same width.
+    """
+    header_len = 11 + 4 + 4 + int(np.frombuffer(buf, dtype='>i4', count=1, offset=15)[0])
+    n = (len(buf) - header_len - 2) // _COPY_ROW.itemsize
+    rows = np.frombuffer(buf, dtype=_COPY_ROW, count=n, offset=header_len)
+    return pd.DataFrame({
+        'date': (_PG_EPOCH + rows['date'].astype('timedelta64[D]')).astype('datetime64[ns]'),
+        'sales': rows['sales'].astype(float),
+        'price': rows['price'].astype(float),
+        'stock': rows['stock'].astype(float),
+    })
+
+
+def load_from_db_columnar(cfg: TrainConfig, conn=None) -> pd.DataFrame:
+    """Same daily frame as `load_from_db`, built server-side and fetched as binary COPY.
+
+    The range predicate on `ts` is sargable (an index on ts, or on
+    (product_id, country, channel, ts), can be used) and the daily aggregation runs
+    before the calendar join. Missing price/stock come back as NaN instead of None.
+    """
+    assert cfg.dsn or conn is not None, "DSN requis pour la lecture en base"
+    import io
+    import psycopg2  # type: ignore
+    query = """
+        with agg as (
+            select
+                s.ts::date as d,
+                sum(s.quantity) as sales,
+                avg(s.price) as price,
+                max(s.stock) as stock
+            from internal_sales s
+            where s.product_id = %(pid)s
+              and s.country = %(country)s
+              and s.channel = %(channel)s
+              and s.ts >= %(start)s::date
+              and s.ts < %(end)s::date + 1
+            group by 1
+        )
+        select
+            gs.d::date as date,
+            coalesce(agg.sales, 0)::float8 as sales,
+            coalesce(agg.price, 'NaN')::float8 as price,
+            coalesce(agg.stock, 'NaN')::float8 as stock
+        from generate_series(%(start)s::date, %(end)s::date, interval '1 day') as gs(d)
+        left join agg on agg.d = gs.d::date
+        order by 1
+    """
+    params = {
+        "pid": cfg.product_id,
+        "country": cfg.country,
+        "channel": cfg.channel or "GLOBAL",
+        "start": str(cfg.start_date or (datetime.utcnow() - timedelta(days=365*2)).date()),
+        "end": str(cfg.end_date or (datetime.utcnow() - timedelta(days=1)).date()),
+    }
+    own = conn is None
+    conn = conn if conn is not None else psycopg2.connect(cfg.dsn)
+    try:
+        buf = io.BytesIO()
+        with conn.cursor() as cur:
+            sql = cur.mogrify(query, params).decode()
+            cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT binary)", buf)
+        conn.rollback()
+    finally:
+        if own:
+            conn.close()
+    return parse_copy_binary(buf.getvalue())
+
+
 def load_from_csv(path: str) -> pd.DataFrame:
     df = pd.read_csv(path)
     return df
@@ -100,12 +198,9 @@ def ensure_daily_index(df: pd.DataFrame, date_col: str, target_col: str) -> pd.D
 
 def add_holiday_dummy(df: pd.DataFrame, date_col: str, country: str) -> pd.DataFrame:
     df = df.copy()
-    country_code = country.upper()
-    try:
-        country_holidays = holidays.country_holidays(country_code)
-    except Exception:
-        country_holidays = {}
-    df["exog_holiday"] = df[date_col].dt.date.apply(lambda d: 1 if d in country_holidays else 0)
+    days = np.asarray(df[date_col].values, dtype='datetime64[D]')
+    _, _, holiday = calendar_features(country, days)
+    df["exog_holiday"] = holiday.astype(int)
     return df
 
 
@@ -131,15 +226,11 @@ def build_design_matrix(df: pd.DataFrame, cfg: TrainConfig, include_target: bool
     """Build a linear regression design matrix with weekly seasonality (weekday one-hot) + exogenous."""
     X_parts = []
     feature_names = []
-    # Intercept
-    X_parts.append(np.ones((len(df), 1)))
-    feature_names.append('bias')
-    # Weekday one-hot (0-6)
-    weekday = pd.to_datetime(df[cfg.date_col]).dt.weekday.values
-    for d in range(7):
-        col = (weekday == d).astype(float)[:, None]
-        X_parts.append(col)
-        feature_names.append(f'wd_{d}')
+    # Intercept + weekday one-hot (0-6), sliced from the shared calendar cache
+    days = np.asarray(pd.to_datetime(df[cfg.date_col]).values, dtype='datetime64[D]')
+    design, _, _ = calendar_features(cfg.country, days)
+    X_parts.append(design)
+    feature_names += ['bias'] + [f'wd_{d}' for d in range(7)]
     # Exogenous numeric columns
     exog_cols = [c for c in df.columns if c.startswith(cfg.exog_prefix)]
     for colname in [cfg.price_col, cfg.stock_col]:
@@ -158,40 +249,130 @@ def build_design_matrix(df: pd.DataFrame, cfg: TrainConfig, include_target: bool
     return X, y, feature_names
 
 
+def fit_linear_batch(X: np.ndarray, Y: np.ndarray, mask: Optional[np.ndarray] = None, l2: float = 1e-3) -> Tuple[np.ndarray, np.ndarray]:
+    """Ridge fit of N stacked series in one call.
+
+    X is a padded (N, T, P) design, Y is (N, T) and mask (N, T) flags the valid rows
+    (padding is ignored). X^T X / X^T y are formed with einsum and all N systems are
+    solved by a single np.linalg.solve. Returns coef (N, P) and sigma (N,).
+    """
+    w = np.ones(Y.shape) if mask is None else mask.astype(float)
+    Xw = X * w[..., None]
+    # (X^T X + l2 I)^{-1} X^T y, per series
+    XtX = np.einsum('ntp,ntq->npq', Xw, X) + l2 * np.eye(X.shape[-1])
+    Xty = np.einsum('ntp,nt->np', Xw, Y)
+    coef = np.linalg.solve(XtX, Xty[..., None])[..., 0]
+    n = np.maximum(w.sum(axis=1), 1.0)
+    residuals = (Y - np.einsum('ntp,np->nt', X, coef)) * w
+    mean = residuals.sum(axis=1) / n
+    sigma = np.sqrt((((residuals - mean[:, None]) * w) ** 2).sum(axis=1) / n)
+    return coef, sigma
+
+
 def fit_linear(X: np.ndarray, y: np.ndarray, l2: float = 1e-3) -> Tuple[np.ndarray, float]:
     """Ridge-regularized least squares using normal equations with small l2."""
-    # (X^T X + l2 I)^{-1} X^T y
-    XtX = X.T @ X
-    XtX += l2 * np.eye(X.shape[1])
-    Xty = X.T @ y
-    coef = np.linalg.solve(XtX, Xty)
-    residuals = y - (X @ coef)
-    sigma = float(np.std(residuals))
-    return coef, sigma
+    coef, sigma = fit_linear_batch(X[None], y[None], l2=l2)
+    return coef[0], float(sigma[0])
 
 
 def predict_linear(X: np.ndarray, coef: np.ndarray) -> np.ndarray:
     return X @ coef
 
 
+def _prefix_normal_equations(X: np.ndarray, y: np.ndarray, origins: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """X^T X and X^T y of the expanding windows X[:o] for every (strictly increasing) origin o.
+
+    One pass over the rows: per-segment sums between consecutive origins, then a
+    cumulative sum over the K segments. Returns (K, P, P) and (K, P).
+    """
+    end = int(origins[-1])
+    bounds = np.r_[0, origins[:-1]]
+    XtX = np.cumsum(np.add.reduceat(np.einsum('tp,tq->tpq', X[:end], X[:end]), bounds, axis=0), axis=0)
+    Xty = np.cumsum(np.add.reduceat(X[:end] * y[:end, None], bounds, axis=0), axis=0)
+    return XtX, Xty
+
+
+def expanding_backtest_batch(series: List[Tuple[np.ndarray, np.ndarray, np.ndarray]], horizon: int, l2: float = 1e-3) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Expanding-window backtest of many series, one small solve per (series, origin).
+
+    Each item is (X (n, P), y (n,), origins): the model is fitted on rows [0, o) and
+    predicts rows [o, o + horizon). Systems with the same feature count are solved by
+    a single np.linalg.solve. Returns, per series, (yhat, y_true, valid) arrays of shape
+    (K, horizon); `valid` is False past the end of the series.
+    """
+    prepared = []
+    for X, y, origins in series:
+        origins = np.unique(np.asarray(origins, dtype=np.int64))
+        origins = origins[(origins > 0) & (origins < len(y))]
+        prepared.append((X, y, origins) + _prefix_normal_equations(X, y, origins) if len(origins) else (X, y, origins, None, None))
+    coefs: List[Optional[np.ndarray]] = [None] * len(prepared)
+    for p in {X.shape[1] for X, *_ in prepared}:
+        idx = [i for i, (X, _, origins, *_) in enumerate(prepared) if X.shape[1] == p and len(origins)]
+        if not idx:
+            continue
+        XtX = np.concatenate([prepared[i][3] for i in idx]) + l2 * np.eye(p)
+        Xty = np.concatenate([prepared[i][4] for i in idx])
+        solved = np.linalg.solve(XtX, Xty[..., None])[..., 0]
+        offsets = np.cumsum([0] + [len(prepared[i][2]) for i in idx])
+        for k, i in enumerate(idx):
+            coefs[i] = solved[offsets[k]:offsets[k + 1]]
+    out = []
+    for (X, y, origins, *_), coef in zip(prepared, coefs):
+        rows = origins[:, None] + np.arange(horizon)[None, :]
+        valid = rows < len(y)
+        rows = np.minimum(rows, len(y) - 1)
+        if coef is None:
+            out.append((np.zeros(rows.shape), y[rows], valid))
+            continue
+        yhat = np.einsum('khp,kp->kh', X[rows], coef)
+        out.append((yhat, y[rows], valid))
+    return out
+
+
+def horizon_metrics(yhat: np.ndarray, y_true: np.ndarray, valid: np.ndarray) -> dict:
+    """MAE / MAPE / WMAPE per horizon step (1-based) over all backtest origins."""
+    err = np.where(valid, np.abs(y_true - yhat), 0.0)
+    n = np.maximum(valid.sum(axis=0), 1)
+    ape = np.where(valid, err / np.clip(np.abs(y_true), 1e-6, None), 0.0)
+    denom = np.where(valid, np.abs(y_true), 0.0).sum(axis=0) + 1e-8
+    return {
+        'step': list(range(1, yhat.shape[1] + 1)),
+        'mae': (err.sum(axis=0) / n).tolist(),
+        'mape': (ape.sum(axis=0) / n).tolist(),
+        'wmape': (err.sum(axis=0) / denom).tolist(),
+        'origins': int(valid.shape[0]),
+    }
+
+
 def rolling_backtest_linear(df: pd.DataFrame, cfg: TrainConfig, splits: int = 3, horizon: int = 14) -> BacktestMetrics:
+    """Mean metrics over `splits` folds of `horizon` days from the end of the history.
+
+    Folds that would start before the first day are skipped (histories shorter than
+    `splits` folds); `samples` is the number of folds scored, and the metrics are NaN
+    when none could be.
+    """
     n = len(df)
     fold_size = max(horizon, n // (splits + 1))
     starts = [n - (i+1) * fold_size for i in range(splits)][::-1]
+    X, y, _ = build_design_matrix(df, cfg)
+    [(yhat, y_true, valid)] = expanding_backtest_batch([(X, y, np.array(starts))], horizon)
+    if not len(yhat):
+        return BacktestMetrics(mape=float('nan'), wmape=float('nan'), mae=float('nan'), samples=0)
     maes, mapes, wmapes = [], [], []
-    for start in starts:
-        train_df = df.iloc[:start]
-        test_df = df.iloc[start:start+horizon]
-        X_train, y_train, _ = build_design_matrix(train_df, cfg)
-        coef, _ = fit_linear(X_train, y_train)
-        X_test, y_test, _ = build_design_matrix(test_df, cfg)
-        yhat = predict_linear(X_test, coef)
-        y = y_test
-        maes.append(float(np.mean(np.abs(y - yhat))))
-        mape_i = float(np.mean(np.abs((y - yhat) / np.clip(np.abs(y), 1e-6, None))))
-        mapes.append(mape_i)
-        wmapes.append(wmape(y, yhat))
-    return BacktestMetrics(mape=float(np.mean(mapes)), wmape=float(np.mean(wmapes)), mae=float(np.mean(maes)), samples=int(splits))
+    for k in range(len(yhat)):
+        yk, hk = y_true[k][valid[k]], yhat[k][valid[k]]
+        maes.append(float(np.mean(np.abs(yk - hk))))
+        mapes.append(float(np.mean(np.abs((yk - hk) / np.clip(np.abs(yk), 1e-6, None)))))
+        wmapes.append(wmape(yk, hk))
+    return BacktestMetrics(mape=float(np.mean(mapes)), wmape=float(np.mean(wmapes)), mae=float(np.mean(maes)), samples=len(yhat))
+
+
+def daily_origin_backtest(df: pd.DataFrame, cfg: TrainConfig, last_days: int = 90, horizon: int = 14) -> dict:
+    """Backtest from every day of the last `last_days` days; metrics per horizon step."""
+    X, y, _ = build_design_matrix(df, cfg)
+    origins = np.arange(max(1, len(y) - last_days), len(y))
+    [(yhat, y_true, valid)] = expanding_backtest_batch([(X, y, origins)], horizon)
+    return horizon_metrics(yhat, y_true, valid)
 
 
 def train_and_forecast(df: pd.DataFrame, cfg: TrainConfig) -> dict:
@@ -199,6 +380,7 @@ def train_and_forecast(df: pd.DataFrame, cfg: TrainConfig) -> dict:
     df = add_holiday_dummy(df, cfg.date_col, cfg.country)
     # Backtest
     metrics = rolling_backtest_linear(df, cfg, splits=3, horizon=min(14, cfg.horizon))
+    by_horizon = daily_origin_backtest(df, cfg, last_days=cfg.backtest_days, horizon=cfg.horizon) if cfg.backtest_days else None
     # Fit final linear model
     X, y, feature_names = build_design_matrix(df, cfg)
     coef, sigma = fit_linear(X, y)
@@ -224,11 +406,13 @@ def train_and_forecast(df: pd.DataFrame, cfg: TrainConfig) -> dict:
     out = pd.DataFrame({cfg.date_col: future_idx, 'yhat': yhat, 'p10': p10, 'p90': p90})
     return {
         'forecast': out,
-        'metrics': asdict(metrics),
+        'metrics': asdict(metrics) if by_horizon is None else {**asdict(metrics), 'by_horizon': by_horizon},
         'model_summary': f'Linear model with features: {feature_names}',
         'features': feature_names,
         'coef': coef.tolist(),
         'sigma': sigma,
+        'last_x': X[-1].tolist(),
+        'last_date': last_date,
         'endog_len': int(len(y)),
     }
 
@@ -260,6 +444,128 @@ def save_artifacts(result: dict, cfg: TrainConfig, model_obj, key: str) -> Path:
     return outdir
 
 
+def artifact_record(result: dict, cfg: TrainConfig, key: str) -> ArtifactRecord:
+    fc = result['forecast']
+    return ArtifactRecord(
+        key=key,
+        features=result['features'],
+        coef=np.asarray(result['coef']),
+        last_x=np.asarray(result['last_x']),
+        sigma=float(result['sigma']),
+        last_date=np.datetime64(result['last_date'], 'D'),
+        forecast=fc[['yhat', 'p10', 'p90']].to_numpy(dtype=float),
+        metrics=result['metrics'],
+        endog_len=result['endog_len'],
+        meta={
+            'config': json.loads(cfg.model_dump_json()),
+            'by_horizon': result['metrics'].get('by_horizon'),
+            'model_summary': result['model_summary'],
+        },
+    )
+
+
+def artifact_store(cfg: TrainConfig) -> ArtifactStore:
+    return ArtifactStore(Path(cfg.output_dir) / 'store')
+
+
+def series_key(cfg: TrainConfig) -> str:
+    return f"p{cfg.product_id or 'csv'}_{cfg.country}_{cfg.channel}"
+
+
+# --- Batch mode: many series per invocation, sharded over worker processes ---
+_worker_conn = None
+
+
+def _init_worker(dsn: str) -> None:
+    """ProcessPoolExecutor initializer: one Postgres connection per worker process."""
+    global _worker_conn
+    import psycopg2  # type: ignore
+    _worker_conn = psycopg2.connect(dsn)
+
+
+def enumerate_series(cfg: TrainConfig) -> List[Tuple[int, str]]:
+    """All (product_id, channel) pairs with sales in cfg.country."""
+    import psycopg2  # type: ignore
+    conn = psycopg2.connect(cfg.dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "select distinct product_id, channel from internal_sales where country = %(country)s order by 1, 2",
+                {"country": cfg.country},
+            )
+            return [(int(r[0]), r[1] or 'GLOBAL') for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def read_products_file(path: str, default_channel: str) -> List[Tuple[int, str]]:
+    """One series per line: `product_id[,channel]`; blank lines and # comments are skipped."""
+    series: List[Tuple[int, str]] = []
+    for line in Path(path).read_text(encoding='utf-8').splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        parts = [p.strip() for p in line.split(',')]
+        series.append((int(parts[0]), parts[1] if len(parts) > 1 and parts[1] else default_channel))
+    return series
+
+
+def _train_shard(shard_id: int, base_cfg: TrainConfig, series: List[Tuple[int, str]]) -> dict:
+    t0 = time.perf_counter()
+    ok, failures, records = 0, [], []
+    for product_id, channel in series:
+        cfg = base_cfg.model_copy(update={'product_id': product_id, 'channel': channel})
+        try:
+            df = load_from_db_columnar(cfg, conn=_worker_conn)
+            result = train_and_forecast(df, cfg)
+            if cfg.artifact_format == 'tree':
+                save_artifacts(result, cfg, None, series_key(cfg))
+            else:
+                records.append(artifact_record(result, cfg, series_key(cfg)))
+            ok += 1
+        except Exception as e:
+            failures.append({'product_id': product_id, 'channel': channel, 'error': str(e)[:200]})
+            if _worker_conn is not None:
+                _worker_conn.rollback()
+    # one segment per shard; the parent process merges them into the index
+    segment = artifact_store(base_cfg).write_segment(records, tag=f'shard{shard_id}') if records else None
+    return {
+        'shard': shard_id,
+        'segment': segment,
+        'series': len(series),
+        'ok': ok,
+        'failed': len(failures),
+        'seconds': time.perf_counter() - t0,
+        'failures': failures,
+    }
+
+
+def run_batch(base_cfg: TrainConfig, series: List[Tuple[int, str]], workers: int, shard_size: int) -> dict:
+    """Train every series, `shard_size` per task, on `workers` processes; returns the run summary."""
+    shards = [series[i:i + shard_size] for i in range(0, len(series), shard_size)]
+    t0 = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(base_cfg.dsn,)) as pool:
+        futures = [pool.submit(_train_shard, i, base_cfg, shard) for i, shard in enumerate(shards)]
+        for fut in tqdm(as_completed(futures), total=len(futures), desc='shards'):
+            results.append(fut.result())
+    results.sort(key=lambda r: r['shard'])
+    if base_cfg.artifact_format != 'tree':
+        artifact_store(base_cfg).commit([r['segment'] for r in results])
+    wall = time.perf_counter() - t0
+    done = sum(r['ok'] for r in results)
+    return {
+        'series': len(series),
+        'ok': done,
+        'failed': sum(r['failed'] for r in results),
+        'workers': workers,
+        'shard_size': shard_size,
+        'wall_seconds': wall,
+        'series_per_second': (done / wall) if wall > 0 else 0.0,
+        'shards': results,
+    }
+
+
 def main():
     ap = argparse.ArgumentParser(description='Train SARIMAX forecast with exogenous features')
     ap.add_argument('--product-id', type=int)
@@ -273,6 +579,13 @@ def main():
     ap.add_argument('--dsn', type=str, default=os.getenv('DATABASE_URL'))
     ap.add_argument('--from-csv', type=str)
     ap.add_argument('--output-dir', type=str, default='forecasting/artifacts')
+    ap.add_argument('--artifact-format', choices=['columnar', 'tree'], default='columnar',
+                    help='columnar: append to <output-dir>/store (indexed, memory-mapped); tree: one directory per series and run')
+    ap.add_argument('--backtest-days', type=int, help='Also backtest from every day of the last N days (metrics per horizon step)')
+    ap.add_argument('--all', action='store_true', help='Train every (product, channel) of --country found in internal_sales')
+    ap.add_argument('--products-file', type=str, help='Train the series listed in this file (product_id[,channel] per line)')
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    ap.add_argument('--shard-size', type=int, default=50)
     args = ap.parse_args()
 
     cfg = TrainConfig(
@@ -287,8 +600,22 @@ def main():
         dsn=args.dsn,
         from_csv=args.from_csv,
         output_dir=args.output_dir,
+        artifact_format=args.artifact_format,
+        backtest_days=args.backtest_days,
     )
 
+    if args.all or args.products_file:
+        if not cfg.dsn:
+            raise SystemExit('DATABASE_URL/--dsn requis pour lecture Postgres')
+        series = read_products_file(args.products_file, cfg.channel or 'GLOBAL') if args.products_file else enumerate_series(cfg)
+        summary = run_batch(cfg, series, workers=max(1, args.workers), shard_size=max(1, args.shard_size))
+        Path(cfg.output_dir).mkdir(parents=True, exist_ok=True)
+        out = Path(cfg.output_dir) / f"batch_summary_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+        out.write_text(json.dumps(summary, indent=2), encoding='utf-8')
+        print(f"Trained {summary['ok']}/{summary['series']} series in {summary['wall_seconds']:.1f}s "
+              f"({summary['series_per_second']:.1f} series/s, {summary['failed']} failed). Summary: {out}")
+        return
+
     if cfg.from_csv:
         df = load_from_csv(cfg.from_csv)
     else:
@@ -296,15 +623,21 @@ def main():
             raise SystemExit('product-id requis si pas de --from-csv')
         if not cfg.dsn:
             raise SystemExit('DATABASE_URL/--dsn requis pour lecture Postgres')
-        df = load_from_db(cfg)
+        df = load_from_db_columnar(cfg)
 
     # Train and forecast
     train_df = df.copy()
     result = train_and_forecast(train_df, cfg)
 
-    key = f"p{cfg.product_id or 'csv'}_{cfg.country}_{cfg.channel}"
-    outdir = save_artifacts(result, cfg, None, key)
-    print(f"Saved artifacts to: {outdir}")
+    key = series_key(cfg)
+    if cfg.artifact_format == 'tree':
+        outdir = save_artifacts(result, cfg, None, key)
+        print(f"Saved artifacts to: {outdir}")
+        return
+    store = artifact_store(cfg)
+    segment = store.write_segment([artifact_record(result, cfg, key)])
+    store.commit([segment])
+    print(f"Saved {key} to artifact store {store.root} (segment {segment})")
 
 
 if __name__ == '__main__':
@@ -1,7 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
 from datetime import datetime, timedelta
 from airflow import DAG
+from airflow.decorators import task
 from airflow.operators.bash import BashOperator
 
+from forecast_shards import changed_keys, detect_changes, plan_shards, read_watermark, record_shard, write_watermark
+
+ETL_DIR = '/opt/airflow/repo/services/etl-svc'
+FORECAST_DIR = os.getenv('FORECAST_SERVICE_DIR', '/opt/airflow/repo/services/forecast')
+FORECAST_SHARED_DIR = os.path.abspath(os.path.join(FORECAST_DIR, '..', '..'))  # repo root: run_once.py imports forecasting.*
+FORECAST_PYTHON = os.getenv('FORECAST_PYTHON', sys.executable)  # interpreter with the forecast service requirements
+FORECAST_SHARD_ROWS = int(os.getenv('FORECAST_SHARD_ROWS', '500000'))  # target history rows per shard
+FORECAST_MAX_SHARDS = int(os.getenv('FORECAST_MAX_SHARDS', '64'))  # per (account, country)
+FORECAST_SHARD_PARALLELISM = int(os.getenv('FORECAST_SHARD_PARALLELISM', '4'))
+FORECAST_HORIZON_DAYS = os.getenv('FORECAST_HORIZON_DAYS', '30')
+FORECAST_SERVICE_URL = os.getenv('FORECAST_SERVICE_URL', 'http://forecast:8001')
+FORECAST_CHANGE_LAG_SECONDS = int(os.getenv('FORECAST_CHANGE_LAG_SECONDS', '0'))  # > 0 if other writers run concurrently
+
+# node_modules is reinstalled only when package-lock.json changed since the last install
+NPM_CI = (
+    f'cd {ETL_DIR} && '
+    'if ! sha256sum -c node_modules/.package-lock.sha256 >/dev/null 2>&1; then '
+    'npm ci && sha256sum package-lock.json > node_modules/.package-lock.sha256; fi'
+)
+
+
+def _connect():
+    import psycopg2
+
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+
 # Example Airflow DAG that runs hourly
 with DAG(
     dag_id='etl_aimerchant_hourly',
@@ -13,20 +49,112 @@ with DAG(
         'retries': 2,
         'retry_delay': timedelta(minutes=5),
     },
-    tags=['aimerchant', 'etl']
+    tags=['aimerchant', 'etl', 'forecast']
 ) as dag:
 
+    npm_ci = BashOperator(
+        task_id='npm_ci',
+        bash_command=NPM_CI,
+    )
+
     etl_amazon = BashOperator(
         task_id='etl_amazon',
-        bash_command='cd /opt/airflow/repo/services/etl-svc && npm ci && npm run etl.run -- amazon',
+        bash_command=f'cd {ETL_DIR} && npm run etl.run -- amazon',
         env={
             'NODE_OPTIONS': '--max_old_space_size=512',
-        }
+        },
+        append_env=True,
     )
 
     etl_shopify = BashOperator(
         task_id='etl_shopify',
-        bash_command='cd /opt/airflow/repo/services/etl-svc && npm ci && npm run etl.run -- shopify',
+        bash_command=f'cd {ETL_DIR} && npm run etl.run -- shopify',
     )
 
-    etl_amazon >> etl_shopify
+    @task
+    def refresh_history() -> None:
+        """Refresh the service's history cube of every (account, country) the ETL just changed."""
+        conn = _connect()
+        try:
+            keys = changed_keys(conn, read_watermark(conn), datetime.now().astimezone())
+        finally:
+            conn.close()
+        for account_id, country in keys:
+            req = urllib.request.Request(
+                f'{FORECAST_SERVICE_URL}/internal/history/refresh',
+                data=json.dumps({'account_id': account_id, 'country': country}).encode(),
+                headers={'Content-Type': 'application/json'},
+                method='POST',
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=600) as resp:
+                    print(account_id, country, resp.read().decode())
+            except urllib.error.HTTPError as e:
+                if e.code == 503:  # cube disabled (no FORECAST_HISTORY_CUBE): shards read Postgres
+                    print(f'history cube disabled: {e.read().decode()}')
+                    return
+                raise
+
+    @task
+    def plan_forecast(ti=None) -> list:
+        """Series changed since the last forecast watermark, split into balanced shards (mapped below)."""
+        conn = _connect()
+        try:
+            since = read_watermark(conn)
+            with conn.cursor() as cur:
+                cur.execute('SELECT now() - make_interval(secs => %s)', (FORECAST_CHANGE_LAG_SECONDS,))
+                until = cur.fetchone()[0]
+            changes = detect_changes(conn, since, until)
+        finally:
+            conn.close()
+        shards = plan_shards(changes, FORECAST_SHARD_ROWS, FORECAST_MAX_SHARDS)
+        print(f'{len(changes)} changed series since {since} -> {len(shards)} shards '
+              f'{[(len(s["product_ids"]), s["history_rows"]) for s in shards]}')
+        ti.xcom_push(key='until', value=until.isoformat())
+        return shards
+
+    @task(max_active_tis_per_dagrun=FORECAST_SHARD_PARALLELISM)
+    def forecast_shard(shard: dict, ti=None, run_id=None) -> dict:
+        """Run the forecast batch entry point (services/forecast/run_once.py) on one shard."""
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('\n'.join(shard['product_ids']))
+        env = {
+            **os.environ,
+            'ACCOUNT_ID': shard['account_id'],
+            'COUNTRY': shard['country'] or '',
+            'PRODUCT_IDS_FILE': f.name,
+            'HORIZON_DAYS': FORECAST_HORIZON_DAYS,
+            'PYTHONPATH': os.pathsep.join(p for p in (FORECAST_SHARED_DIR, os.environ.get('PYTHONPATH')) if p),
+        }
+        t0 = time.perf_counter()
+        try:
+            proc = subprocess.run([FORECAST_PYTHON, 'run_once.py'], cwd=FORECAST_DIR, env=env, capture_output=True, text=True)
+        finally:
+            os.unlink(f.name)
+        seconds = time.perf_counter() - t0
+        print(proc.stdout)
+        error = (proc.stderr[-2000:] or f'exit code {proc.returncode}') if proc.returncode else None
+        conn = _connect()
+        try:
+            record_shard(conn, run_id, ti.map_index, shard, seconds, 'failed' if error else 'ok', error)
+        finally:
+            conn.close()
+        if error:
+            raise RuntimeError(f'forecast shard {ti.map_index} failed:\n{error}')
+        return {'products': len(shard['product_ids']), 'history_rows': shard['history_rows'], 'seconds': seconds}
+
+    @task(trigger_rule='none_failed')
+    def commit_watermark(ti=None) -> None:
+        # Only after every shard succeeded (or there was nothing to do): a failed run is re-detected next time
+        until = ti.xcom_pull(task_ids='plan_forecast', key='until')
+        conn = _connect()
+        try:
+            write_watermark(conn, datetime.fromisoformat(until))
+        finally:
+            conn.close()
+
+    plan = plan_forecast()
+    shards = forecast_shard.expand(shard=plan)
+
+    npm_ci >> etl_amazon >> etl_shopify >> refresh_history() >> plan
+    shards >> commit_watermark()
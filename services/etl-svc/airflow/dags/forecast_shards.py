@@ -0,0 +1,140 @@
+"""Change detection and shard planning for the forecasting stage of etl_aimerchant.
+
+Plain Python on a DB-API connection (psycopg2 in Airflow), so the planning can be
+tested without a scheduler:
+
+- ``detect_changes`` lists the (account, country, product) series with a ``sales_daily``
+  row updated in (watermark, until] and counts their rows in the forecast window;
+- ``plan_shards`` splits them per (account, country) into shards of about
+  ``target_rows`` history rows, largest series first onto the lightest shard;
+- ``changed_keys`` lists the (account, country) pairs of those series, whose
+  history cubes the forecast service refreshes before the shards run;
+- ``record_shard`` logs each shard's size and runtime into ``forecast_shard_runs``.
+"""
+from __future__ import annotations
+import heapq
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+WATERMARK_NAME = 'etl_aimerchant_forecast'
+HISTORY_DAYS = 730  # window read by the forecast loaders (load_sales_daily_many)
+SERIES_OVERHEAD_ROWS = 50  # fixed per-series cost (query, fit, 30 written rows) in history-row units
+
+
+@dataclass(frozen=True)
+class SeriesChange:
+    account_id: str
+    country: Optional[str]
+    product_code: str
+    history_rows: int
+
+
+def read_watermark(conn, name: str = WATERMARK_NAME) -> Optional[datetime]:
+    with conn.cursor() as cur:
+        cur.execute('SELECT cursor_ts FROM forecast_watermark WHERE name = %s', (name,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def write_watermark(conn, cursor_ts: datetime, name: str = WATERMARK_NAME) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO forecast_watermark(name, cursor_ts) VALUES (%s, %s)
+            ON CONFLICT (name) DO UPDATE SET cursor_ts = GREATEST(forecast_watermark.cursor_ts, EXCLUDED.cursor_ts), updated_at = now()
+            """,
+            (name, cursor_ts),
+        )
+    conn.commit()
+
+
+def detect_changes(conn, since: Optional[datetime], until: datetime, history_days: int = HISTORY_DAYS) -> List[SeriesChange]:
+    """Series with a row updated in (since, until]; ``since`` None means every series.
+
+    A series is one (account, country, product): a SKU sold in several countries
+    is forecast once per country, from that country's rows only.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            WITH changed AS (
+              SELECT DISTINCT account_id, country, product_code
+              FROM sales_daily
+              WHERE updated_at <= %(until)s
+                AND (%(since)s::timestamptz IS NULL OR updated_at > %(since)s::timestamptz)
+            )
+            SELECT s.account_id, s.country, s.product_code, count(*)
+            FROM sales_daily s
+            JOIN changed c
+              ON c.account_id = s.account_id AND c.product_code = s.product_code AND c.country IS NOT DISTINCT FROM s.country
+            WHERE s.date >= current_date - %(days)s
+            GROUP BY s.account_id, s.country, s.product_code
+            ORDER BY s.account_id, s.country, s.product_code
+            """,
+            {'since': since, 'until': until, 'days': history_days},
+        )
+        rows = cur.fetchall()
+    return [SeriesChange(r[0], r[1], r[2], int(r[3])) for r in rows]
+
+
+def changed_keys(conn, since: Optional[datetime], until: datetime) -> List[Tuple[str, Optional[str]]]:
+    """(account, country) pairs with a row updated in (since, until]; ``since`` None means every pair."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT DISTINCT account_id, country
+            FROM sales_daily
+            WHERE updated_at <= %(until)s
+              AND (%(since)s::timestamptz IS NULL OR updated_at > %(since)s::timestamptz)
+            ORDER BY account_id, country
+            """,
+            {'since': since, 'until': until},
+        )
+        return [(r[0], r[1]) for r in cur.fetchall()]
+
+
+def plan_shards(changes: List[SeriesChange], target_rows: int, max_shards: int = 64) -> List[Dict[str, object]]:
+    """Balanced shards, each within one (account, country) as the forecast entry point expects.
+
+    Each group gets ceil(weight / target_rows) shards (at most ``max_shards``) and
+    series are placed longest-processing-time first: heaviest series onto the
+    currently lightest shard.
+    """
+    groups: Dict[Tuple[str, Optional[str]], List[SeriesChange]] = defaultdict(list)
+    for c in changes:
+        groups[(c.account_id, c.country)].append(c)
+    shards: List[Dict[str, object]] = []
+    for (account_id, country), series in sorted(groups.items(), key=lambda kv: (kv[0][0], kv[0][1] or '')):
+        weight = sum(s.history_rows + SERIES_OVERHEAD_ROWS for s in series)
+        n = max(1, min(max_shards, len(series), math.ceil(weight / max(target_rows, 1))))
+        heap = [(0, i) for i in range(n)]
+        members: List[List[SeriesChange]] = [[] for _ in range(n)]
+        for s in sorted(series, key=lambda s: (-s.history_rows, s.product_code)):
+            load, i = heapq.heappop(heap)
+            members[i].append(s)
+            heapq.heappush(heap, (load + s.history_rows + SERIES_OVERHEAD_ROWS, i))
+        for part in members:
+            shards.append({
+                'account_id': account_id,
+                'country': country,
+                'product_ids': [s.product_code for s in part],
+                'history_rows': sum(s.history_rows for s in part),
+            })
+    return shards
+
+
+def record_shard(conn, dag_run_id: str, shard_index: int, shard: Dict[str, object], seconds: float, status: str, error: Optional[str] = None) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO forecast_shard_runs(dag_run_id, shard, account_id, country, products, history_rows, seconds, status, error)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (dag_run_id, shard) DO UPDATE SET seconds = EXCLUDED.seconds, status = EXCLUDED.status,
+              error = EXCLUDED.error, finished_at = now()
+            """,
+            (dag_run_id, shard_index, shard['account_id'], shard['country'], len(shard['product_ids']), shard['history_rows'], seconds, status, error),
+        )
+    conn.commit()
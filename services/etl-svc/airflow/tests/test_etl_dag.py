@@ -0,0 +1,123 @@
+"""Offline checks of the etl_aimerchant DAG.
+
+    pip install apache-airflow psycopg2-binary pytest
+    AIRFLOW_HOME=$(mktemp -d) DATABASE_URL=postgresql://... pytest services/etl-svc/airflow/tests
+
+The DagBag test needs Airflow; the planning tests need a scratch Postgres in
+DATABASE_URL (they work in a throwaway schema). Each is skipped otherwise.
+"""
+import os
+import sys
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+DAGS_DIR = Path(__file__).resolve().parents[1] / 'dags'
+sys.path.insert(0, str(DAGS_DIR))
+
+from forecast_shards import SeriesChange, changed_keys, detect_changes, plan_shards, read_watermark, record_shard, write_watermark  # noqa: E402
+
+
+def test_dagbag_imports_and_wires_forecast_stage():
+    pytest.importorskip('airflow')
+    from airflow.models import DagBag
+
+    bag = DagBag(dag_folder=str(DAGS_DIR), include_examples=False)
+    assert bag.import_errors == {}
+    dag = bag.get_dag('etl_aimerchant_hourly')
+    assert set(dag.task_ids) == {'npm_ci', 'etl_amazon', 'etl_shopify', 'refresh_history', 'plan_forecast', 'forecast_shard', 'commit_watermark'}
+    assert dag.get_task('npm_ci').downstream_task_ids == {'etl_amazon'}
+    assert dag.get_task('etl_shopify').downstream_task_ids == {'refresh_history'}
+    assert dag.get_task('refresh_history').downstream_task_ids == {'plan_forecast'}
+    assert 'npm ci' not in dag.get_task('etl_amazon').bash_command
+    assert dag.get_task('forecast_shard').downstream_task_ids == {'commit_watermark'}
+
+
+def test_plan_shards_balances_history_rows_per_account_country():
+    sizes = [730, 700, 500, 400, 365, 300, 200, 90, 60, 30, 10, 5]
+    changes = [SeriesChange('acc-1', 'FR', f'SKU{i}', n) for i, n in enumerate(sizes)]
+    changes += [SeriesChange('acc-2', None, 'X1', 100)]
+    shards = plan_shards(changes, target_rows=1500)
+    fr = [s for s in shards if s['account_id'] == 'acc-1']
+    assert len(fr) == 3 and len(shards) == 4
+    assert sorted(p for s in fr for p in s['product_ids']) == sorted(c.product_code for c in changes[:-1])
+    loads = [s['history_rows'] for s in fr]
+    assert max(loads) - min(loads) <= max(sizes)  # LPT keeps shards within one series of each other
+    assert shards[-1] == {'account_id': 'acc-2', 'country': None, 'product_ids': ['X1'], 'history_rows': 100}
+    assert len(plan_shards(changes, target_rows=1, max_shards=5)) == 5 + 1
+    assert plan_shards([], target_rows=1000) == []
+
+
+@pytest.fixture
+def pg():
+    dsn = os.getenv('DATABASE_URL')
+    if not dsn:
+        pytest.skip('DATABASE_URL not set')
+    psycopg2 = pytest.importorskip('psycopg2')
+    conn = psycopg2.connect(dsn)
+    schema = f'dag_test_{uuid.uuid4().hex[:8]}'
+    with conn.cursor() as cur:
+        cur.execute(f'CREATE SCHEMA {schema}')
+        cur.execute(f'SET search_path TO {schema}')
+        cur.execute('CREATE TABLE sales_daily (date DATE NOT NULL, account_id TEXT NOT NULL, product_code TEXT NOT NULL, country TEXT,'
+                    ' units_sold NUMERIC NOT NULL DEFAULT 0, revenue NUMERIC NOT NULL DEFAULT 0, PRIMARY KEY (account_id, product_code, date))')
+        migration = Path(__file__).resolve().parents[4] / 'db' / 'migrations' / '202610181300_add_forecast_fanout.sql'
+        cur.execute(migration.read_text(encoding='utf-8').replace('public.', '').replace("'public'", 'current_schema()'))
+    conn.commit()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f'DROP SCHEMA {schema} CASCADE')
+        conn.commit()
+        conn.close()
+
+
+def _now(conn):
+    with conn.cursor() as cur:
+        cur.execute('SELECT clock_timestamp()')
+        return cur.fetchone()[0]
+
+
+def test_detects_changed_series_since_watermark(pg):
+    today = date.today()
+    with pg.cursor() as cur:
+        for k, sku in enumerate(['SKU1', 'SKU2', 'SKU3']):
+            for i in range(0, 40, k + 1):
+                cur.execute('INSERT INTO sales_daily VALUES (%s, %s, %s, %s, %s, 0)', (today - timedelta(days=i), 'acc-1', sku, 'FR', i % 4))
+        cur.execute('INSERT INTO sales_daily VALUES (%s, %s, %s, %s, 1, 0)', (today - timedelta(days=900), 'acc-1', 'OLD', 'FR'))
+    pg.commit()
+
+    first = detect_changes(pg, read_watermark(pg), _now(pg))
+    assert [(c.product_code, c.history_rows) for c in first] == [('SKU1', 40), ('SKU2', 20), ('SKU3', 14)]  # OLD is outside the window
+    assert changed_keys(pg, read_watermark(pg), _now(pg)) == [('acc-1', 'FR')]
+    write_watermark(pg, _now(pg))
+    assert detect_changes(pg, read_watermark(pg), _now(pg)) == []
+    assert changed_keys(pg, read_watermark(pg), _now(pg)) == []
+
+    with pg.cursor() as cur:  # what the ETL upsert does for a changed row
+        cur.execute("UPDATE sales_daily SET units_sold = 9, updated_at = now() WHERE product_code = 'SKU2' AND date = %s", (today,))
+    pg.commit()
+    changed = detect_changes(pg, read_watermark(pg), _now(pg))
+    assert [c.product_code for c in changed] == ['SKU2']
+
+    [shard] = plan_shards(changed, target_rows=1000)
+    record_shard(pg, 'manual__1', 0, shard, 1.5, 'ok')
+    with pg.cursor() as cur:
+        cur.execute('SELECT products, history_rows, seconds, status FROM forecast_shard_runs')
+        assert cur.fetchall() == [(1, 20, 1.5, 'ok')]
+
+
+def test_multi_country_sku_is_one_series_per_country(pg):
+    today = date.today()
+    with pg.cursor() as cur:
+        for i in range(30):  # the same SKU sold in DE on even days and in FR on odd ones
+            cur.execute('INSERT INTO sales_daily VALUES (%s, %s, %s, %s, 1, 0)', (today - timedelta(days=i), 'acc-1', 'SKU1', 'FR' if i % 2 else 'DE'))
+    pg.commit()
+
+    changes = detect_changes(pg, None, _now(pg))
+    assert [(c.country, c.product_code, c.history_rows) for c in changes] == [('DE', 'SKU1', 15), ('FR', 'SKU1', 15)]
+    assert [(s['country'], s['product_ids']) for s in plan_shards(changes, target_rows=1000)] == [('DE', ['SKU1']), ('FR', ['SKU1'])]
@@ -21,7 +21,10 @@ export async function upsertSalesDaily(rows: SalesDailyRow[]) {
   const sql = `INSERT INTO sales_daily(date, account_id, product_code, country, units_sold, revenue)
                VALUES ${chunks.join(',')}
                ON CONFLICT (account_id, product_code, date)
-               DO UPDATE SET units_sold = EXCLUDED.units_sold, revenue = EXCLUDED.revenue, country = COALESCE(EXCLUDED.country, sales_daily.country)`;
+               DO UPDATE SET units_sold = EXCLUDED.units_sold, revenue = EXCLUDED.revenue, country = COALESCE(EXCLUDED.country, sales_daily.country), updated_at = now()
+               -- unchanged rows keep their updated_at: the forecast DAG only re-forecasts series that really changed
+               WHERE (sales_daily.units_sold, sales_daily.revenue, sales_daily.country)
+                     IS DISTINCT FROM (EXCLUDED.units_sold, EXCLUDED.revenue, COALESCE(EXCLUDED.country, sales_daily.country))`;
   const res = await query(sql, values);
   return (res as any).rowCount ?? rows.length;
 }
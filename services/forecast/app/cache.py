@@ -0,0 +1,172 @@
+from __future__ import annotations
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg
+
+from .model import ForecastResult
+
+# (account_id, product_id, country, horizon)
+CacheKey = Tuple[str, str, Optional[str], int]
+
+
+@dataclass(frozen=True)
+class SeriesFingerprint:
+    """Cheap server-side summary of a product's history window; changes whenever the history does."""
+    since: date
+    last_date: Optional[date]
+    rows: int
+    checksum: float
+    weighted_checksum: float
+
+
+class ForecastCache:
+    """LRU + TTL cache of forecast results, valid only while the series fingerprint is unchanged.
+
+    With ``path`` set, entries are also written through to a SQLite file (WAL mode)
+    so they survive restarts and can be shared by any number of worker processes.
+    Disk access is batched: ``get_many`` reads the misses of a whole batch in one
+    query and ``put_many`` writes a batch in one transaction; callers on the event
+    loop run both in a thread when ``blocking`` is set.
+    """
+
+    def __init__(self, max_entries: int = 50_000, ttl_seconds: float = 6 * 3600, path: Optional[str] = None, skip_write: bool = False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.skip_write = skip_write
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[CacheKey, Tuple[SeriesFingerprint, float, ForecastResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            with self._db() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS forecast_cache (key TEXT PRIMARY KEY, stored_at REAL NOT NULL, entry BLOB NOT NULL)")
+
+    @classmethod
+    def from_env(cls) -> Optional["ForecastCache"]:
+        if os.getenv("FORECAST_CACHE_ENABLED", "1") != "1":
+            return None
+        return cls(
+            max_entries=int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "50000")),
+            ttl_seconds=float(os.getenv("FORECAST_CACHE_TTL", str(6 * 3600))),
+            path=os.getenv("FORECAST_CACHE_PATH") or None,
+            skip_write=os.getenv("FORECAST_CACHE_SKIP_WRITE", "0") == "1",
+        )
+
+    @property
+    def blocking(self) -> bool:
+        """True when ``get_many`` / ``put_many`` touch the disk."""
+        return bool(self.path)
+
+    def get(self, key: CacheKey, fingerprint: SeriesFingerprint) -> Optional[ForecastResult]:
+        return self.get_many([(key, fingerprint)])[0]
+
+    def get_many(self, items: Sequence[Tuple[CacheKey, SeriesFingerprint]]) -> List[Optional[ForecastResult]]:
+        """Cached result of each (key, fingerprint), None on a miss; disk misses are read in one query."""
+        with self._lock:
+            missing = [key for key, _ in items if key not in self._entries]
+        disk = self._disk_get_many(missing) if self.path and missing else {}
+        out: List[Optional[ForecastResult]] = []
+        now = time.time()
+        with self._lock:
+            for key, fingerprint in items:
+                entry = self._entries.get(key) or disk.get(key)
+                if entry is not None:
+                    fp, stored_at, result = entry
+                    if fp == fingerprint and now - stored_at <= self.ttl_seconds:
+                        self._entries[key] = entry
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        out.append(result)
+                        continue
+                    self._entries.pop(key, None)
+                self.misses += 1
+                out.append(None)
+            self._evict()
+        return out
+
+    def put(self, key: CacheKey, fingerprint: SeriesFingerprint, result: ForecastResult) -> None:
+        self.put_many([(key, fingerprint, result)])
+
+    def put_many(self, items: List[Tuple[CacheKey, SeriesFingerprint, ForecastResult]]) -> None:
+        now = time.time()
+        with self._lock:
+            for key, fingerprint, result in items:
+                self._entries[key] = (fingerprint, now, result)
+                self._entries.move_to_end(key)
+            self._evict()
+        if self.path and items:
+            rows = [(repr(key), now, pickle.dumps((fingerprint, now, result), protocol=pickle.HIGHEST_PROTOCOL)) for key, fingerprint, result in items]
+            with self._db() as db:
+                db.executemany("INSERT OR REPLACE INTO forecast_cache(key, stored_at, entry) VALUES (?, ?, ?)", rows)
+
+    def stats(self) -> Dict[str, object]:
+        total = self.hits + self.misses
+        return {
+            "enabled": True,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk": bool(self.path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @contextmanager
+    def _db(self) -> Iterator[sqlite3.Connection]:
+        # one short-lived connection (and transaction) per call: usable from any thread,
+        # and SQLite locking makes the file safe to share between processes
+        with closing(sqlite3.connect(self.path, timeout=30)) as db, db:
+            yield db
+
+    def _disk_get_many(self, keys: List[CacheKey]) -> Dict[CacheKey, Tuple[SeriesFingerprint, float, ForecastResult]]:
+        by_repr = {repr(key): key for key in keys}
+        names = list(by_repr)
+        found: Dict[CacheKey, Tuple[SeriesFingerprint, float, ForecastResult]] = {}
+        with self._db() as db:
+            for i in range(0, len(names), 500):  # stay under SQLite's bound-parameter limit
+                chunk = names[i:i + 500]
+                rows = db.execute(f"SELECT key, entry FROM forecast_cache WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                found.update((by_repr[k], pickle.loads(entry)) for k, entry in rows)
+        return found
+
+
+async def load_fingerprints_many(conn: psycopg.AsyncConnection, account_id: str, product_ids: List[str], country: Optional[str] = None, days: int = 730) -> Dict[str, SeriesFingerprint]:
+    """Fingerprint the same history window as ``load_sales_daily_many``, aggregated in Postgres."""
+    since = datetime.utcnow().date() - timedelta(days=days)
+    where_country = " AND country = %(country)s" if country else ""
+    async with conn.cursor() as cur:
+        await cur.execute(
+            f"""
+            SELECT product_code, max(date), count(*),
+                   COALESCE(sum(units_sold), 0), COALESCE(sum(units_sold * (date - %(since)s::date)), 0)
+            FROM sales_daily
+            WHERE account_id = %(account_id)s
+              AND product_code = ANY(%(product_ids)s)
+              AND date >= %(since)s
+              {where_country}
+            GROUP BY product_code
+            """,
+            {"account_id": account_id, "product_ids": list(product_ids), "since": since.isoformat(), "country": country},
+        )
+        rows = await cur.fetchall()
+    found = {r[0]: SeriesFingerprint(since, r[1], int(r[2]), float(r[3]), float(r[4])) for r in rows}
+    return {pid: found.get(pid, SeriesFingerprint(since, None, 0, 0.0, 0.0)) for pid in product_ids}
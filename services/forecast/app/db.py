@@ -0,0 +1,63 @@
+from __future__ import annotations
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+
+from .model import get_dsn
+
+
+def create_pool(dsn: str) -> AsyncConnectionPool:
+    """Build the service connection pool from FORECAST_POOL_* environment variables.
+
+    The pool is created closed; the app lifespan opens and closes it.
+    """
+    check = AsyncConnectionPool.check_connection if os.getenv("FORECAST_POOL_CHECK", "1") == "1" else None
+    return AsyncConnectionPool(
+        dsn,
+        min_size=int(os.getenv("FORECAST_POOL_MIN_SIZE", "1")),
+        max_size=int(os.getenv("FORECAST_POOL_MAX_SIZE", "10")),
+        max_idle=float(os.getenv("FORECAST_POOL_MAX_IDLE", "300")),
+        timeout=float(os.getenv("FORECAST_POOL_TIMEOUT", "30")),
+        check=check,
+        name="forecast",
+        open=False,
+    )
+
+
+@asynccontextmanager
+async def connection(pool: Optional[AsyncConnectionPool]) -> AsyncIterator[psycopg.AsyncConnection]:
+    """Borrow a pooled connection, or open a one-off one when no pool is configured."""
+    if pool is not None:
+        async with pool.connection() as conn:
+            yield conn
+    else:
+        async with await psycopg.AsyncConnection.connect(get_dsn()) as conn:
+            yield conn
+
+
+async def open_connection(pool: Optional[AsyncConnectionPool]) -> psycopg.AsyncConnection:
+    """A connection of its own, outside the pool (same DSN), for work that must not wait on it."""
+    return await psycopg.AsyncConnection.connect(pool.conninfo if pool is not None else get_dsn(), autocommit=True)
+
+
+def pool_stats(pool: Optional[AsyncConnectionPool]) -> Dict[str, object]:
+    if pool is None:
+        return {"enabled": False}
+    stats = pool.get_stats()
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    return {
+        "enabled": True,
+        "min_size": stats.get("pool_min", 0),
+        "max_size": stats.get("pool_max", 0),
+        "size": size,
+        "available": available,
+        "in_use": size - available,
+        "waiting": stats.get("requests_waiting", 0),
+        "requests": stats.get("requests_num", 0),
+        "timeouts": stats.get("requests_errors", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+    }
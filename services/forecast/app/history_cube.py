@@ -0,0 +1,263 @@
+"""Shared sales history cube: dense float32 SKU x day arrays, memory-mapped by every worker.
+
+One directory per (account, country) under the cube root holds generations of
+
+    units-<gen>.npy   (skus, days) float32, NaN on days without a sales_daily row
+    skus-<gen>.npy    sorted product codes, row i of units
+    manifest.json     current generation, first day, watermark, refresh time
+
+Workers map the current generation read-only, so the pages are shared through
+the OS page cache instead of being copied into each process. ``refresh``
+(one writer per key, serialized with a Postgres advisory lock) re-reads only
+the days after ``watermark - overlap``, writes a new generation next to the old
+one and swaps the manifest atomically; readers notice the new manifest on
+their next poll. NaN keeps "no row" apart from "row with 0 units", so the gap
+filling matches ``load_sales_daily_many`` exactly.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import psycopg
+
+from .model import DailySeries, _day_array, _empty_series
+
+FORECAST_HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "730"))
+FORECAST_HISTORY_OVERLAP = int(os.getenv("FORECAST_HISTORY_OVERLAP", "7"))  # days the ETL may still restate
+MANIFEST = "manifest.json"
+_COPY_ROWS = 4096  # rows copied per step from the previous generation
+
+
+@dataclass(frozen=True)
+class CubeGeneration:
+    name: str
+    start: np.datetime64  # datetime64[D] of column 0
+    watermark: np.datetime64  # last day held (and read from Postgres)
+    refreshed_at: float
+    skus: np.ndarray  # sorted
+    units: np.ndarray  # (len(skus), days) float32, memory-mapped
+
+    def rows(self, product_ids: List[str]) -> np.ndarray:
+        """Row of each product, -1 when the product had no sales in the window."""
+        if not len(self.skus):
+            return np.full(len(product_ids), -1)
+        pids = np.asarray(product_ids, dtype=str)
+        pos = np.minimum(np.searchsorted(self.skus, pids), len(self.skus) - 1)
+        return np.where(self.skus[pos] == pids, pos, -1)
+
+
+def _key_dir(account_id: str, country: Optional[str]) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", f"{account_id}__{country or 'ALL'}")
+
+
+class HistoryCube:
+    """Read side (all workers) and refresh (one writer) of the shared history cube."""
+
+    def __init__(self, root: str, max_age_seconds: float = 26 * 3600, poll_seconds: float = 2.0, overlap_days: int = FORECAST_HISTORY_OVERLAP):
+        self.root = Path(root)
+        self.max_age_seconds = max_age_seconds
+        self.poll_seconds = poll_seconds
+        self.overlap_days = overlap_days
+        self.hits = 0
+        self.fallbacks = 0
+        self.reloads = 0
+        self._generations: Dict[str, Tuple[float, Optional[CubeGeneration]]] = {}  # key -> (manifest mtime, generation)
+        self._checked_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["HistoryCube"]:
+        root = os.getenv("FORECAST_HISTORY_CUBE")
+        if not root:
+            return None
+        return cls(
+            root,
+            max_age_seconds=float(os.getenv("FORECAST_HISTORY_MAX_AGE", str(26 * 3600))),
+            poll_seconds=float(os.getenv("FORECAST_HISTORY_POLL", "2.0")),
+        )
+
+    # --- reads ---
+    def generation(self, account_id: str, country: Optional[str]) -> Optional[CubeGeneration]:
+        key = _key_dir(account_id, country)
+        with self._lock:
+            now = time.monotonic()
+            cached = self._generations.get(key)
+            if cached is not None and now - self._checked_at.get(key, 0.0) < self.poll_seconds:
+                return cached[1]
+            self._checked_at[key] = now
+            path = self.root / key / MANIFEST
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                self._generations.pop(key, None)
+                return None
+            if cached is None or cached[0] != mtime:
+                self._generations[key] = (mtime, self._open(self.root / key))
+                self.reloads += 1
+            return self._generations[key][1]
+
+    @staticmethod
+    def _open(base: Path) -> Optional[CubeGeneration]:
+        try:
+            manifest = json.loads((base / MANIFEST).read_text(encoding="utf-8"))
+            name = manifest["generation"]
+            return CubeGeneration(
+                name=name,
+                start=np.datetime64(manifest["start"], "D"),
+                watermark=np.datetime64(manifest["watermark"], "D"),
+                refreshed_at=float(manifest["refreshed_at"]),
+                skus=np.load(base / f"skus-{name}.npy"),
+                units=np.load(base / f"units-{name}.npy", mmap_mode="r"),
+            )
+        except FileNotFoundError:  # generation pruned between reading the manifest and mapping it
+            return None
+
+    def series_many(self, account_id: str, product_ids: List[str], country: Optional[str] = None, days: int = FORECAST_HISTORY_DAYS) -> Optional[Dict[str, DailySeries]]:
+        """Same histories as ``load_sales_daily_many``, sliced from the cube.
+
+        None when the cube has no fresh generation covering the window; callers then
+        read Postgres.
+        """
+        gen = self.generation(account_id, country)
+        since = np.datetime64(datetime.utcnow().date() - timedelta(days=days), "D")
+        if gen is None or time.time() - gen.refreshed_at > self.max_age_seconds or since < gen.start:
+            self.fallbacks += 1
+            return None
+        self.hits += 1
+        rows = gen.rows(product_ids)
+        found = rows >= 0
+        block = np.asarray(gen.units[rows[found], int((since - gen.start).astype(np.int64)):], dtype=np.float64)
+        present = ~np.isnan(block)
+        has = present.any(axis=1)
+        first = present.argmax(axis=1)
+        last = block.shape[1] - 1 - present[:, ::-1].argmax(axis=1)
+        out: Dict[str, DailySeries] = {}
+        for j, pid in enumerate(np.asarray(product_ids, dtype=object)[found]):
+            if has[j]:
+                out[pid] = DailySeries(since + first[j], np.nan_to_num(block[j, first[j]:last[j] + 1]))
+        for pid in product_ids:
+            if pid not in out:
+                out[pid] = _empty_series()
+        return out
+
+    def series(self, account_id: str, product_id: str, country: Optional[str] = None, days: int = FORECAST_HISTORY_DAYS) -> Optional[DailySeries]:
+        """One product's history, e.g. for ``simple_forecast``; None when the cube cannot serve it."""
+        many = self.series_many(account_id, [product_id], country, days)
+        return None if many is None else many[product_id]
+
+    # --- refresh ---
+    async def refresh(self, conn: psycopg.AsyncConnection, account_id: str, country: Optional[str] = None, full: bool = False, days: int = FORECAST_HISTORY_DAYS) -> Dict[str, object]:
+        """Bring the cube of (account, country) up to date with ``sales_daily``.
+
+        Reads rows dated after ``watermark - overlap_days`` (everything with ``full``
+        or when there is no generation yet). Returns what was done; ``status`` is
+        "busy" when another worker is already refreshing this key.
+        """
+        t0 = time.perf_counter()
+        base = self.root / _key_dir(account_id, country)
+        today = np.datetime64(datetime.utcnow().date(), "D")
+        start = today - days
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", (f"forecast_history:{base.name}",))
+                if not (await cur.fetchone())[0]:
+                    return {"status": "busy"}
+            old = None if full or not (base / MANIFEST).exists() else await asyncio.to_thread(self._open, base)
+            since = start if old is None else max(start, old.watermark - self.overlap_days + 1)
+            rows = await _fetch_rows(conn, account_id, country, since)
+            # densifying and writing the generation is NumPy and disk work: off the event loop, still under the lock
+            gen = await asyncio.to_thread(self._write_generation, base, old, start, since, rows)
+        await asyncio.to_thread(self._prune, base, {gen.name, old.name if old is not None else ""})
+        return {
+            "status": "ok",
+            "mode": "full" if old is None else "incremental",
+            "since": str(since),
+            "watermark": str(gen.watermark),
+            "rows_read": len(rows),
+            "skus": int(len(gen.skus)),
+            "days": int(gen.units.shape[1]),
+            "bytes": int(gen.units.nbytes),
+            "seconds": time.perf_counter() - t0,
+        }
+
+    def _write_generation(self, base: Path, old: Optional[CubeGeneration], start: np.datetime64, since: np.datetime64, rows: List[tuple]) -> CubeGeneration:
+        codes = np.array([r[0] for r in rows], dtype=str)
+        dates = _day_array([r[1] for r in rows])
+        units = np.array([float(r[2] or 0.0) for r in rows], dtype=np.float32)
+        watermark = max([since - 1] + ([dates.max()] if len(dates) else []) + ([old.watermark] if old is not None else []))
+        skus = np.union1d(old.skus if old is not None else np.array([], dtype=str), codes)
+        n_days = int((watermark - start).astype(np.int64)) + 1
+
+        name = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f") + f"-{os.getpid()}"
+        base.mkdir(parents=True, exist_ok=True)
+        tmp = base / f"units-{name}.npy.tmp"
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(skus), n_days))
+        out[:] = np.nan
+        if old is not None and len(old.skus):
+            # carry [start, since) over from the previous generation; the overlap is re-read
+            lo, hi = max(start, old.start), min(since, old.watermark + 1)
+            if hi > lo:
+                src = slice(int((lo - old.start).astype(np.int64)), int((hi - old.start).astype(np.int64)))
+                dst = slice(int((lo - start).astype(np.int64)), int((hi - start).astype(np.int64)))
+                new_rows = np.searchsorted(skus, old.skus)
+                for i in range(0, len(old.skus), _COPY_ROWS):
+                    out[new_rows[i:i + _COPY_ROWS], dst] = old.units[i:i + _COPY_ROWS, src]
+        if len(rows):
+            out[np.searchsorted(skus, codes), (dates - start).astype(np.int64)] = units
+        out.flush()
+        del out
+        np.save(base / f"skus-{name}.npy", skus)
+        os.replace(tmp, base / f"units-{name}.npy")
+        manifest = {"generation": name, "start": str(start), "watermark": str(watermark), "refreshed_at": time.time(), "skus": int(len(skus))}
+        (base / (MANIFEST + ".tmp")).write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(base / (MANIFEST + ".tmp"), base / MANIFEST)
+        return self._open(base)
+
+    @staticmethod
+    def _prune(base: Path, keep: set) -> None:
+        # The previous generation is kept: other workers may still have it mapped until their next poll
+        for p in base.glob("*-*.npy"):
+            if p.stem.split("-", 1)[1] not in keep:
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, object]:
+        gens = {key: g for key, (_, g) in self._generations.items() if g is not None}
+        return {
+            "enabled": True,
+            "root": str(self.root),
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "reloads": self.reloads,
+            "cubes": {
+                key: {"skus": int(len(g.skus)), "start": str(g.start), "watermark": str(g.watermark), "refreshed_at": g.refreshed_at, "bytes": int(g.units.nbytes)}
+                for key, g in gens.items()
+            },
+        }
+
+
+async def _fetch_rows(conn: psycopg.AsyncConnection, account_id: str, country: Optional[str], since: np.datetime64) -> List[tuple]:
+    where_country = " AND country = %(country)s" if country else ""
+    async with conn.cursor() as cur:
+        await cur.execute(
+            f"""
+            SELECT product_code, date, COALESCE(units_sold, 0) as units_sold
+            FROM sales_daily
+            WHERE account_id = %(account_id)s
+              AND date >= %(since)s
+              {where_country}
+            """,
+            {"account_id": account_id, "since": str(since), "country": country},
+        )
+        return await cur.fetchall()
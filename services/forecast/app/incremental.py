@@ -0,0 +1,221 @@
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import psycopg
+
+from .model import ForecastResult, History, WeekdayStats, _day_array, _history_arrays, _weekday_of, forecast_from_stats, load_sales_daily_many, weekday_stats
+
+FORECAST_DECAY = float(os.getenv("FORECAST_DECAY", "1.0"))
+
+
+@dataclass
+class ModelState:
+    """Normal-equation state of one series' weekday model.
+
+    ``stats`` hold the (optionally exponentially weighted) per-weekday counts, sums and
+    sums of squares of every gap-filled day up to ``watermark``; together they give
+    X^T X, X^T y and the residual moments of the weekday + bias design.
+
+    Stored states stop one day before the last day read (see ``close_day``): that
+    day may still be partial, so the next run reads it again.
+
+    With ``decay`` = 1 nothing is ever forgotten, while a full load only reads the
+    last 730 days: an incremental state keeps every day since it was created, so
+    it drifts from a full refit as the series ages. Use ``decay`` < 1 or a periodic
+    full (non-incremental) run to bound the memory of the model.
+    """
+    stats: WeekdayStats
+    watermark: date
+    decay: float = 1.0
+
+
+def _forgetting_weights(days: np.ndarray, last_days: np.ndarray, decay: float) -> Optional[np.ndarray]:
+    if decay >= 1.0:
+        return None
+    return decay ** (last_days - days).astype(np.int64).astype(float)
+
+
+def state_from_history(history: History, decay: float = 1.0) -> ModelState:
+    """Build the state of a gap-filled daily history (as returned by the loaders)."""
+    days, y = _history_arrays(history)
+    last = days.max()
+    stats = weekday_stats(y, _weekday_of(days), weights=_forgetting_weights(days, last, decay))
+    return ModelState(stats=stats, watermark=last.item(), decay=decay)
+
+
+def update_states(states: List[ModelState], new_rows: List[Tuple[np.ndarray, np.ndarray]]) -> List[ModelState]:
+    """Fold the rows that arrived after each state's watermark into that state.
+
+    ``new_rows[i]`` holds (datetime64[D] dates, units) strictly after ``states[i].watermark``.
+    Days between the watermark and the newest row are gap-filled with zeros, exactly as
+    a full reload would. With forgetting, the old aggregates are first scaled by
+    ``decay ** n_new_days``. All series are updated with one bincount pass.
+    """
+    n = len(states)
+    watermarks = np.array([s.watermark for s in states], dtype="datetime64[D]")
+    new_last = np.array([d.max() if len(d) else w for (d, _), w in zip(new_rows, watermarks)], dtype="datetime64[D]")
+    spans = (new_last - watermarks).astype(np.int64)
+    base = np.r_[0, np.cumsum(spans)[:-1]]
+    series = np.repeat(np.arange(n), spans)
+    days = watermarks[series] + 1 + (np.arange(int(spans.sum())) - base[series])
+    y = np.zeros(len(days))
+    for i, (d, u) in enumerate(new_rows):
+        if len(d):
+            y[base[i] + (d - watermarks[i] - 1).astype(np.int64)] = u
+    decays = np.array([s.decay for s in states])
+    weights = None
+    if (decays < 1.0).any():
+        weights = decays[series] ** (new_last[series] - days).astype(np.int64).astype(float)
+    delta = weekday_stats(y, _weekday_of(days), series, n_series=n, weights=weights)
+    out = []
+    for i, s in enumerate(states):
+        scale = s.decay ** float(spans[i]) if s.decay < 1.0 else 1.0
+        stats = WeekdayStats(
+            counts=s.stats.counts * scale + delta.counts[i:i + 1],
+            sums=s.stats.sums * scale + delta.sums[i:i + 1],
+            sumsq=s.stats.sumsq * scale + delta.sumsq[i:i + 1],
+        )
+        out.append(ModelState(stats=stats, watermark=new_last[i].item(), decay=s.decay))
+    return out
+
+
+def close_day(state: ModelState, units: float) -> ModelState:
+    """``state`` without its watermark day (``units`` sold that day): the state up to the day before.
+
+    With forgetting, the remaining days are re-weighted to the new watermark.
+    """
+    wd = int(_weekday_of(np.array([state.watermark], dtype="datetime64[D]"))[0])
+    counts, sums, sumsq = state.stats.counts.copy(), state.stats.sums.copy(), state.stats.sumsq.copy()
+    counts[:, wd] -= 1.0
+    sums[:, wd] -= units
+    sumsq[:, wd] -= units * units
+    if state.decay < 1.0:
+        counts, sums, sumsq = counts / state.decay, sums / state.decay, sumsq / state.decay
+    day = np.datetime64(state.watermark, "D") - 1
+    return ModelState(stats=WeekdayStats(counts, sums, sumsq), watermark=day.item(), decay=state.decay)
+
+
+def forecast_states(states: List[ModelState], horizon: int = 30) -> List[ForecastResult]:
+    if not states:
+        return []
+    stats = WeekdayStats(
+        counts=np.concatenate([s.stats.counts for s in states]),
+        sums=np.concatenate([s.stats.sums for s in states]),
+        sumsq=np.concatenate([s.stats.sumsq for s in states]),
+    )
+    last_days = np.array([s.watermark for s in states], dtype="datetime64[D]")
+    return forecast_from_stats(stats, last_days, horizon)
+
+
+async def load_states(conn: psycopg.AsyncConnection, account_id: str, product_ids: List[str], country: Optional[str] = None) -> Dict[str, ModelState]:
+    """States of the ``country`` series (None: the all-countries series) of each product."""
+    async with conn.cursor() as cur:
+        await cur.execute(
+            """
+            SELECT product_code, counts, sums, sumsq, watermark, decay
+            FROM forecast_model_state
+            WHERE account_id = %(account_id)s AND product_code = ANY(%(product_ids)s)
+              AND country IS NOT DISTINCT FROM %(country)s
+            """,
+            {"account_id": account_id, "product_ids": list(product_ids), "country": country},
+        )
+        rows = await cur.fetchall()
+    return {
+        r[0]: ModelState(
+            stats=WeekdayStats(np.array([r[1]], dtype=float), np.array([r[2]], dtype=float), np.array([r[3]], dtype=float)),
+            watermark=r[4],
+            decay=float(r[5]),
+        )
+        for r in rows
+    }
+
+
+async def save_states(conn: psycopg.AsyncConnection, account_id: str, country: Optional[str], states: Dict[str, ModelState], run_id: str):
+    rows = [(
+        account_id, pid, country, s.stats.counts[0].tolist(), s.stats.sums[0].tolist(), s.stats.sumsq[0].tolist(), s.watermark, s.decay, run_id
+    ) for pid, s in states.items()]
+    async with conn.cursor() as cur:
+        await cur.executemany(
+            """
+            INSERT INTO forecast_model_state(account_id, product_code, country, counts, sums, sumsq, watermark, decay, run_id)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+            ON CONFLICT (account_id, product_code, country)
+            DO UPDATE SET counts=EXCLUDED.counts, sums=EXCLUDED.sums, sumsq=EXCLUDED.sumsq,
+                          watermark=EXCLUDED.watermark, decay=EXCLUDED.decay, run_id=EXCLUDED.run_id, updated_at=now()
+            """,
+            rows
+        )
+
+
+async def load_sales_after_many(conn: psycopg.AsyncConnection, account_id: str, watermarks: Dict[str, date], country: Optional[str] = None) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Fetch only the rows newer than each product's watermark (one query from the oldest watermark)."""
+    out: Dict[str, Tuple[np.ndarray, np.ndarray]] = {pid: (np.array([], dtype="datetime64[D]"), np.array([])) for pid in watermarks}
+    if not watermarks:
+        return out
+    where_country = " AND country = %(country)s" if country else ""
+    async with conn.cursor() as cur:
+        await cur.execute(
+            f"""
+            SELECT product_code, date, COALESCE(units_sold, 0) as units_sold
+            FROM sales_daily
+            WHERE account_id = %(account_id)s
+              AND product_code = ANY(%(product_ids)s)
+              AND date > %(since)s
+              {where_country}
+            ORDER BY product_code, date
+            """,
+            {"account_id": account_id, "product_ids": list(watermarks), "since": min(watermarks.values()), "country": country},
+        )
+        rows = await cur.fetchall()
+    if rows:
+        codes = np.array([r[0] for r in rows], dtype=object)
+        dates = _day_array([r[1] for r in rows])
+        units = np.array([float(r[2] or 0.0) for r in rows], dtype=float)
+        # rows come grouped by product: slice each group once
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)]
+        for a, b in zip(starts, ends):
+            pid = codes[a]
+            d, u = dates[a:b], units[a:b]
+            sel = d > np.datetime64(watermarks[pid], "D")
+            out[pid] = (d[sel], u[sel])
+    return out
+
+
+async def incremental_forecast(conn: psycopg.AsyncConnection, account_id: str, product_ids: List[str], country: Optional[str], horizon: int, run_id: str, decay: Optional[float] = None) -> List[ForecastResult]:
+    """Forecast from stored normal-equation state, reading only the rows after each watermark.
+
+    Products without state (or with a state built under another ``decay``) are loaded
+    in full once and their state is created. The forecast uses every day read, but
+    the states saved on ``conn`` stop one day earlier: the ETL rewrites the current
+    day's row every hour, so the last day read is read again by the next run.
+    Late corrections to older days are not picked up; run a full (non-incremental)
+    forecast to rebuild from scratch.
+    """
+    decay = FORECAST_DECAY if decay is None else decay
+    pids = list(dict.fromkeys(product_ids))
+    key = country or None  # the loaders read every country for '' as for None
+    states = {pid: s for pid, s in (await load_states(conn, account_id, pids, key)).items() if s.decay == decay}
+    closed: Dict[str, ModelState] = {}
+    fresh = [pid for pid in pids if pid not in states]
+    if fresh:
+        histories = await load_sales_daily_many(conn, account_id, fresh, country)
+        for pid in fresh:
+            states[pid] = state_from_history(histories[pid], decay)
+            closed[pid] = close_day(states[pid], float(_history_arrays(histories[pid])[1][-1]))
+    known = [pid for pid in pids if pid not in fresh]
+    if known:
+        new_rows = await load_sales_after_many(conn, account_id, {pid: states[pid].watermark for pid in known}, country)
+        for pid, state in zip(known, update_states([states[pid] for pid in known], [new_rows[pid] for pid in known])):
+            dates, units = new_rows[pid]
+            if len(dates):
+                closed[pid] = close_day(state, float(units[dates == np.datetime64(state.watermark, "D")].sum()))
+            states[pid] = state
+    if closed:
+        await save_states(conn, account_id, key, closed, run_id)
+    by_pid = dict(zip(pids, forecast_states([states[pid] for pid in pids], horizon)))
+    return [by_pid[pid] for pid in product_ids]
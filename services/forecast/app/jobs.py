@@ -0,0 +1,169 @@
+from __future__ import annotations
+import asyncio
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .schemas import ForecastJobStatus, ForecastProductSummary, ForecastRunRequest
+
+FORECAST_JOB_CHUNK = int(os.getenv("FORECAST_JOB_CHUNK", "1000"))
+FORECAST_JOB_WORKERS = int(os.getenv("FORECAST_JOB_WORKERS", "1"))
+# finished (completed, cancelled, failed) jobs are dropped after FORECAST_JOB_TTL seconds,
+# and the oldest beyond the FORECAST_JOB_KEEP most recent ones earlier
+FORECAST_JOB_TTL = float(os.getenv("FORECAST_JOB_TTL", "86400"))
+FORECAST_JOB_KEEP = int(os.getenv("FORECAST_JOB_KEEP", "200"))
+
+TERMINAL = ("completed", "cancelled", "failed")
+
+# (job, product chunk) -> summaries of that chunk, in chunk order
+ChunkRunner = Callable[["Job", List[str]], Awaitable[List[ForecastProductSummary]]]
+
+
+class JobStateError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    run_id: str
+    request: ForecastRunRequest
+    status: str = "queued"  # queued | running | cancelling | cancelled | completed | failed
+    processed: int = 0
+    summaries: List[ForecastProductSummary] = field(default_factory=list)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    active_seconds: float = 0.0
+    _session_start: Optional[float] = None
+    _cancel: bool = False
+
+    @property
+    def total(self) -> int:
+        return len(self.request.product_ids)
+
+    def elapsed(self) -> float:
+        running = time.monotonic() - self._session_start if self._session_start is not None else 0.0
+        return self.active_seconds + running
+
+    def to_status(self, offset: int = 0, limit: int = 100) -> ForecastJobStatus:
+        elapsed = self.elapsed()
+        return ForecastJobStatus(
+            run_id=self.run_id,
+            status=self.status,
+            total=self.total,
+            processed=self.processed,
+            progress=(self.processed / self.total) if self.total else 1.0,
+            elapsed_seconds=elapsed,
+            products_per_second=(self.processed / elapsed) if elapsed > 0 else 0.0,
+            error=self.error,
+            products=self.summaries[offset:offset + limit],
+        )
+
+
+class JobManager:
+    """In-memory queue of forecast runs processed in chunks by background asyncio workers.
+
+    A cancelled (or failed) job keeps the products already written and can be resumed
+    from the first unprocessed chunk under the same run_id. Finished jobs are evicted
+    ``ttl`` seconds after they finish, or earlier once more than ``keep`` of them are
+    held (oldest first); an evicted run_id is unknown, so it can no longer be resumed.
+    """
+
+    def __init__(self, runner: ChunkRunner, chunk_size: Optional[int] = None, workers: Optional[int] = None,
+                 ttl: Optional[float] = None, keep: Optional[int] = None):
+        self.runner = runner
+        self.chunk_size = chunk_size or FORECAST_JOB_CHUNK
+        self.workers = workers or FORECAST_JOB_WORKERS
+        self.ttl = FORECAST_JOB_TTL if ttl is None else ttl
+        self.keep = FORECAST_JOB_KEEP if keep is None else keep
+        self.jobs: Dict[str, Job] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def evict(self) -> int:
+        """Drop expired finished jobs, then the oldest beyond ``keep``; returns how many were dropped."""
+        finished = sorted((j for j in self.jobs.values() if j.status in TERMINAL and j.finished_at is not None),
+                          key=lambda j: j.finished_at)
+        horizon = time.time() - self.ttl
+        expired = [j for j in finished if j.finished_at <= horizon]
+        kept = finished[len(expired):]
+        drop = expired + kept[:max(0, len(kept) - self.keep)]
+        for j in drop:
+            del self.jobs[j.run_id]
+        return len(drop)
+
+    def submit(self, request: ForecastRunRequest) -> Job:
+        self.evict()
+        job = Job(run_id=str(uuid.uuid4()), request=request)
+        self.jobs[job.run_id] = job
+        self._queue.put_nowait(job.run_id)
+        return job
+
+    def get(self, run_id: str) -> Job:
+        self.evict()
+        return self.jobs[run_id]
+
+    def cancel(self, run_id: str) -> Job:
+        job = self.get(run_id)
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        elif job.status == "running":
+            # Honoured between chunks; the chunk in flight is still written
+            job._cancel = True
+            job.status = "cancelling"
+        elif job.status != "cancelling":
+            raise JobStateError(f"cannot cancel a {job.status} job")
+        return job
+
+    def resume(self, run_id: str) -> Job:
+        job = self.get(run_id)
+        if job.status not in ("cancelled", "failed"):
+            raise JobStateError(f"cannot resume a {job.status} job")
+        job.status, job.error, job.finished_at, job._cancel = "queued", None, None, False
+        self._queue.put_nowait(run_id)
+        return job
+
+    async def _work(self) -> None:
+        while True:
+            run_id = await self._queue.get()
+            job = self.jobs.get(run_id)
+            if job is None or job.status != "queued":
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job) -> None:
+        job.status = "running"
+        job._session_start = time.monotonic()
+        try:
+            pids = job.request.product_ids
+            while job.processed < len(pids):
+                if job._cancel:
+                    job.status = "cancelled"
+                    return
+                chunk = pids[job.processed:job.processed + self.chunk_size]
+                job.summaries.extend(await self.runner(job, chunk))
+                job.processed += len(chunk)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = (str(e) or type(e).__name__)[:200]
+        finally:
+            job.active_seconds = job.elapsed()
+            job._session_start = None
+            job.finished_at = time.time()
+            self.evict()
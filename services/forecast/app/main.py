@@ -1,10 +1,32 @@
 from fastapi import FastAPI
-from fastapi import Body
-from .schemas import ForecastRunRequest, ForecastRunResponse, ForecastProductSummary
-from .model import simple_forecast, load_sales_daily, write_forecast, get_dsn, load_sales_daily_sync, write_forecast_sync
+from fastapi import Body, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from .schemas import ForecastJobStatus, ForecastPoint, ForecastQueueStatus, HistoryRefreshRequest, ForecastPredictRequest, ForecastPredictResponse, ForecastRunRequest, ForecastRunResponse, ForecastProductSummary
+from .model import forecast_batch, get_dsn, load_sales_daily_many_sync, write_forecasts_bulk_sync
+from .cache import ForecastCache
+from .db import connection, create_pool, pool_stats
+from .history_cube import HistoryCube
+from .jobs import Job, JobManager, JobStateError
+from .metrics import TRACES, RunTrace, find_trace, render_metrics, track_run
+from .pipeline import BatchOutcome, iter_pipeline, run_pipeline, summarize
+from .registry import ModelPublisher, ModelRegistry, model_key
+from .scheduler import AdmissionRejected, FairScheduler
+from .stored_forecasts import (
+    ARROW_MEDIA_TYPE, FORECAST_EXPORT_BUFFER_ROWS, FORECAST_EXPORT_MAX_ROWS, NDJSON_MEDIA_TYPE, ArrowWriter, ResponseCache,
+    arrow_available, etag, etag_matches, format_cursor, iter_forecast_rows, load_product_forecast, ndjson_rows, ndjson_trailer,
+    parse_cursor, product_document,
+)
+from .triage import FORECAST_TRIAGE, forecast_triaged
+from .work_queue import FORECAST_QUEUE_WORKERS, Lease, QueueWorkers, WorkQueue, forecast_lease
 import psycopg
+import json
+import os
+import time
 import uuid
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from datetime import date
+from typing import AsyncIterator, List, Optional
 import sys
 import asyncio
 
@@ -15,7 +37,105 @@ if sys.platform.startswith("win"):
     except Exception:
         pass
 
-app = FastAPI(title="Forecast Service", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One connection pool per worker; skipped on Windows (sync path) or without a DSN
+    app.state.pool = None
+    app.state.cache = ForecastCache.from_env()
+    app.state.registry = ModelRegistry.from_env()
+    app.state.publisher = ModelPublisher.from_env(app.state.registry)
+    if app.state.publisher is not None:
+        app.state.publisher.start()
+    app.state.history = HistoryCube.from_env()
+    app.state.scheduler = FairScheduler.from_env()
+    workers = int(os.getenv("FORECAST_FIT_WORKERS", "0")) or None
+    if os.getenv("FORECAST_FIT_EXECUTOR", "thread") == "process":
+        app.state.fit_executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        app.state.fit_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="forecast-fit")
+    app.state.read_cache = ResponseCache.from_env()
+    read_listener = None
+    dsn = os.getenv("DATABASE_URL") or os.getenv("ANALYTICS_DATABASE_URL")
+    if dsn and not sys.platform.startswith("win"):
+        app.state.pool = create_pool(dsn)
+        await app.state.pool.open()
+        if app.state.read_cache is not None:
+            read_listener = asyncio.create_task(app.state.read_cache.listen(dsn))
+
+    async def run_job_chunk(job: Job, product_ids: List[str]) -> List[ForecastProductSummary]:
+        req = job.request
+        async with _admitted(app.state.scheduler, req.account_id, len(product_ids), background=True), \
+                track_run(job.run_id, "job", len(product_ids)) as trace:
+            results = await run_pipeline(
+                app.state.pool, req.account_id, product_ids, req.country, req.horizon_days, job.run_id,
+                max_concurrency=req.max_concurrency, executor=app.state.fit_executor, cache=app.state.cache,
+                incremental=req.incremental, decay=req.decay, trace=trace, history=app.state.history, triage=req.triage,
+            )
+        _publish(app.state.publisher, req.account_id, req.country, product_ids, results, job.run_id)
+        return [summarize(pid, req.horizon_days, res) for pid, res in zip(product_ids, results)]
+
+    async def publish_lease(lease: Lease, product_ids: List[str], results: list) -> None:
+        _publish(app.state.publisher, lease.account_id, lease.country, product_ids, results, lease.run_id)
+
+    async def run_lease(lease: Lease) -> dict:
+        async with _admitted(app.state.scheduler, lease.account_id, len(lease.product_ids), background=True):
+            return await forecast_lease(
+                lease, app.state.pool, executor=app.state.fit_executor, cache=app.state.cache,
+                history=app.state.history, publish=publish_lease,
+            )
+
+    app.state.jobs = JobManager(run_job_chunk)
+    app.state.jobs.start()
+    # Shared Postgres queue: every replica started with FORECAST_QUEUE_WORKERS > 0 takes a share of queued runs
+    app.state.queue = WorkQueue()
+    app.state.queue_workers = None
+    if FORECAST_QUEUE_WORKERS and app.state.pool is not None:
+        app.state.queue_workers = QueueWorkers(app.state.queue, run_lease, app.state.pool, FORECAST_QUEUE_WORKERS)
+        app.state.queue_workers.start()
+    try:
+        yield
+    finally:
+        await app.state.jobs.stop()
+        if app.state.queue_workers is not None:
+            await app.state.queue_workers.stop()
+        if app.state.publisher is not None:
+            await app.state.publisher.stop()
+        if read_listener is not None:
+            read_listener.cancel()
+            await asyncio.gather(read_listener, return_exceptions=True)
+        if app.state.pool is not None:
+            await app.state.pool.close()
+        app.state.fit_executor.shutdown(wait=False)
+
+
+def _publish(publisher: Optional[ModelPublisher], account_id, country, product_ids, results, run_id: str) -> None:
+    # Make freshly fitted models servable by /forecast/predict (FORECAST_MODEL_PUBLISH=1);
+    # the publisher commits everything submitted by all runs as one segment per flush
+    if publisher is not None:
+        publisher.submit(account_id, country, zip(product_ids, results), run_id)
+
+
+@asynccontextmanager
+async def _admitted(scheduler: Optional[FairScheduler], account_id: str, products: int, background: bool = False) -> AsyncIterator[None]:
+    if scheduler is None:
+        yield
+        return
+    async with scheduler.admit(account_id, products, background=background):
+        yield
+
+
+app = FastAPI(title="Forecast Service", version="0.1.0", lifespan=lifespan)
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    # Saturated: tell the client when to come back instead of letting it time out
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "reason": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
 
 
 @app.get("/forecast/sample")
@@ -27,42 +147,242 @@ async def forecast_sample():
     }
 
 
+@app.get("/internal/pool")
+async def internal_pool(request: Request):
+    return pool_stats(getattr(request.app.state, "pool", None))
+
+
+@app.get("/internal/cache")
+async def internal_cache(request: Request):
+    cache = getattr(request.app.state, "cache", None)
+    return cache.stats() if cache is not None else {"enabled": False}
+
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/internal/traces")
+async def internal_traces(limit: int = 20):
+    return [t.to_dict(spans=False) for t in list(TRACES)[::-1][:limit]]
+
+
+@app.get("/internal/traces/{run_id}")
+async def internal_trace(run_id: str):
+    trace = find_trace(run_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="no trace for run_id")
+    return trace.to_dict()
+
+
+@app.get("/internal/scheduler")
+async def internal_scheduler(request: Request):
+    scheduler = getattr(request.app.state, "scheduler", None)
+    return scheduler.stats() if scheduler is not None else {"enabled": False}
+
+
+@app.get("/internal/reads")
+async def internal_reads(request: Request):
+    cache = getattr(request.app.state, "read_cache", None)
+    return cache.stats() if cache is not None else {"enabled": False}
+
+
+@app.get("/internal/registry")
+async def internal_registry(request: Request):
+    registry = getattr(request.app.state, "registry", None)
+    if registry is None:
+        return {"enabled": False}
+    publisher = getattr(request.app.state, "publisher", None)
+    return {**registry.stats(), "publisher": publisher.stats() if publisher is not None else None}
+
+
+@app.get("/internal/history")
+async def internal_history(request: Request):
+    history = getattr(request.app.state, "history", None)
+    return history.stats() if history is not None else {"enabled": False}
+
+
+@app.post("/internal/history/refresh")
+async def refresh_history(request: Request, payload: HistoryRefreshRequest = Body(...)):
+    # Called after each ETL run; the other workers pick the new generation up on their next poll
+    history = getattr(request.app.state, "history", None)
+    if history is None:
+        raise HTTPException(status_code=503, detail="history cube disabled (FORECAST_HISTORY_CUBE)")
+    async with connection(getattr(request.app.state, "pool", None)) as conn:
+        return await history.refresh(conn, payload.account_id, payload.country, full=payload.full)
+
+
+@app.get("/internal/queue")
+async def internal_queue(request: Request):
+    queue = getattr(request.app.state, "queue", None)
+    if queue is None:
+        return {"enabled": False}
+    async with connection(getattr(request.app.state, "pool", None)) as conn:
+        stats = await queue.stats(conn)
+    workers = getattr(request.app.state, "queue_workers", None)
+    return {**stats, "local_workers": workers.workers if workers is not None else 0}
+
+
+@app.post("/forecast/predict", response_model=ForecastPredictResponse)
+async def predict_forecast(request: Request, payload: ForecastPredictRequest = Body(...)):
+    # Evaluates stored coefficients only: no history fetch, no refit, no DB round trip
+    registry = getattr(request.app.state, "registry", None)
+    if registry is None:
+        raise HTTPException(status_code=503, detail="model registry disabled (set FORECAST_MODEL_STORE)")
+    model = registry.find(payload.account_id, payload.product_id, payload.country, payload.channel)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"no trained model for {model_key(payload.product_id, payload.country, payload.channel, payload.account_id)}")
+    days, yhat = model.evaluate(payload.start_date, payload.horizon_days)
+    p10, p90 = model.interval(yhat)
+    return ForecastPredictResponse(
+        product_id=payload.product_id,
+        key=model.key,
+        trained_through=model.last_date.item(),
+        created_at=model.created.item(),
+        sigma=model.sigma,
+        series=[ForecastPoint(date=d, yhat=y, p10=lo, p90=hi) for d, y, lo, hi in zip(days.tolist(), yhat.tolist(), p10.tolist(), p90.tolist())],
+    )
+
+
+async def _run(request: Request, payload: ForecastRunRequest, run_id: str, trace: RunTrace) -> list:
+    # Use sync psycopg on Windows to avoid ProactorEventLoop issues
+    if sys.platform.startswith("win"):
+        with psycopg.connect(get_dsn()) as conn:
+            history = getattr(request.app.state, "history", None)
+            histories = None
+            if history is not None:
+                with trace.stage("cube", batch=0, products=len(payload.product_ids)):
+                    histories = history.series_many(payload.account_id, payload.product_ids, payload.country)
+            if histories is None:
+                with trace.stage("load", batch=0, products=len(payload.product_ids)):
+                    histories = load_sales_daily_many_sync(conn, payload.account_id, payload.product_ids, payload.country, frames=False)
+            with trace.stage("fit", batch=0, products=len(payload.product_ids)):
+                series = [histories[pid] for pid in payload.product_ids]
+                if FORECAST_TRIAGE if payload.triage is None else payload.triage:
+                    results, report = forecast_triaged(series, horizon=payload.horizon_days)
+                    trace.add_triage(report)
+                else:
+                    results = forecast_batch(series, horizon=payload.horizon_days)
+            with trace.stage("write", batch=0, products=len(payload.product_ids)):
+                write_forecasts_bulk_sync(conn, payload.account_id, payload.country, zip(payload.product_ids, results), run_id)
+        return results
+    results = await run_pipeline(
+        getattr(request.app.state, "pool", None),
+        payload.account_id,
+        payload.product_ids,
+        payload.country,
+        payload.horizon_days,
+        run_id,
+        max_concurrency=payload.max_concurrency,
+        executor=getattr(request.app.state, "fit_executor", None),
+        cache=getattr(request.app.state, "cache", None),
+        incremental=payload.incremental,
+        decay=payload.decay,
+        trace=trace,
+        history=getattr(request.app.state, "history", None),
+        triage=payload.triage,
+    )
+    _publish(getattr(request.app.state, "publisher", None), payload.account_id, payload.country, payload.product_ids, results, run_id)
+    return results
+
+
+async def _outcomes(request: Request, payload: ForecastRunRequest, run_id: str, trace: RunTrace) -> AsyncIterator[BatchOutcome]:
+    """Batches of a streamed run as they are written; a failing product or batch does not stop the run."""
+    if sys.platform.startswith("win"):
+        # sync path: one batch, all or nothing
+        yield BatchOutcome(0, 0, payload.product_ids, await _run(request, payload, run_id, trace))
+        return
+    async for out in iter_pipeline(
+        getattr(request.app.state, "pool", None),
+        payload.account_id,
+        payload.product_ids,
+        payload.country,
+        payload.horizon_days,
+        run_id,
+        max_concurrency=payload.max_concurrency,
+        executor=getattr(request.app.state, "fit_executor", None),
+        cache=getattr(request.app.state, "cache", None),
+        incremental=payload.incremental,
+        decay=payload.decay,
+        trace=trace,
+        isolate_errors=True,
+        history=getattr(request.app.state, "history", None),
+        triage=payload.triage,
+    ):
+        written = [(pid, res) for pid, res in zip(out.product_ids, out.results) if res is not None]
+        _publish(getattr(request.app.state, "publisher", None), payload.account_id, payload.country, [p for p, _ in written], [r for _, r in written], run_id)
+        yield out
+
+
+def _ndjson(obj) -> str:
+    return json.dumps(obj, separators=(",", ":")) + "\n"
+
+
+async def _stream_run(request: Request, payload: ForecastRunRequest, run_id: str, release=None) -> AsyncIterator[str]:
+    """NDJSON: a run header, one line per product as soon as its batch is written, then a summary trailer."""
+    try:
+        async for line in _stream_lines(request, payload, run_id):
+            yield line
+    finally:
+        if release is not None:
+            release()
+
+
+async def _stream_lines(request: Request, payload: ForecastRunRequest, run_id: str) -> AsyncIterator[str]:
+    total = len(payload.product_ids)
+    yield _ndjson({"type": "run", "run_id": run_id, "products": total, "horizon_days": payload.horizon_days})
+    t0 = time.perf_counter()
+    ok = failed = 0
+    error = None
+    try:
+        with track_run(run_id, "stream", total) as trace:
+            async for out in _outcomes(request, payload, run_id, trace):
+                lines = []
+                for pid, res in zip(out.product_ids, out.results):
+                    if res is None:
+                        failed += 1
+                        lines.append(_ndjson({"type": "error", "product_id": pid, "error": out.errors.get(pid, "failed")}))
+                    else:
+                        ok += 1
+                        lines.append(_ndjson({"type": "product", **summarize(pid, payload.horizon_days, res).model_dump()}))
+                yield "".join(lines)
+    except Exception as e:
+        # The run itself broke (e.g. the database went away): products not reported yet are lost
+        error = (str(e) or type(e).__name__)[:200]
+    yield _ndjson({
+        "type": "summary",
+        "run_id": run_id,
+        "status": "failed" if error else "completed",
+        "products": total,
+        "ok": ok,
+        "failed": failed,
+        "missing": total - ok - failed,
+        "seconds": time.perf_counter() - t0,
+        "error": error,
+    })
+
+
 @app.post("/forecast/run", response_model=ForecastRunResponse)
-async def run_forecast(payload: ForecastRunRequest = Body(...)):
-    dsn = get_dsn()
+async def run_forecast(request: Request, payload: ForecastRunRequest = Body(...), stream: bool = False):
     run_id = str(uuid.uuid4())
-    summaries: List[ForecastProductSummary] = []
+    # ?stream=1 or Accept: application/x-ndjson streams per-product results instead of one final document
+    scheduler = getattr(request.app.state, "scheduler", None)
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        # Admitted (or rejected with 429) before the response starts; the slot is held until the stream ends
+        ticket = await scheduler.acquire(payload.account_id, len(payload.product_ids)) if scheduler is not None else None
+        release = (lambda: scheduler.release(ticket)) if ticket is not None else None
+        return StreamingResponse(_stream_run(request, payload, run_id, release), media_type="application/x-ndjson")
     try:
-        # Use sync psycopg on Windows to avoid ProactorEventLoop issues
-        if sys.platform.startswith("win"):
-            with psycopg.connect(dsn) as conn:
-                for pid in payload.product_ids:
-                    df = load_sales_daily_sync(conn, payload.account_id, pid, payload.country)
-                    res = simple_forecast(df, horizon=payload.horizon_days)
-                    write_forecast_sync(conn, payload.account_id, pid, payload.country, res, run_id)
-                    summaries.append(ForecastProductSummary(
-                        product_id=pid,
-                        horizon_days=payload.horizon_days,
-                        mean=float(res.yhat.mean()),
-                        p10=float(res.p10.min()),
-                        p90=float(res.p90.max()),
-                    ))
-        else:
-            async with await psycopg.AsyncConnection.connect(dsn) as conn:
-                for pid in payload.product_ids:
-                    df = await load_sales_daily(conn, payload.account_id, pid, payload.country)
-                    res = simple_forecast(df, horizon=payload.horizon_days)
-                    await write_forecast(conn, payload.account_id, pid, payload.country, res, run_id)
-                    summaries.append(ForecastProductSummary(
-                        product_id=pid,
-                        horizon_days=payload.horizon_days,
-                        mean=float(res.yhat.mean()),
-                        p10=float(res.p10.min()),
-                        p90=float(res.p90.max()),
-                    ))
+        async with _admitted(scheduler, payload.account_id, len(payload.product_ids)):
+            with track_run(run_id, "run", len(payload.product_ids)) as trace:
+                results = await _run(request, payload, run_id, trace)
+        summaries = [summarize(pid, payload.horizon_days, res) for pid, res in zip(payload.product_ids, results)]
+    except AdmissionRejected:
+        raise
     except Exception as e:
         # Basic debug path when DEBUG_API=1: encode error into a synthetic product entry
-        import os, traceback
         if os.getenv("DEBUG_API") == "1":
             msg = (str(e) or "error")[:200]
             return {
@@ -79,3 +399,145 @@ async def run_forecast(payload: ForecastRunRequest = Body(...)):
             }
         raise
     return ForecastRunResponse(run_id=run_id, products=summaries)
+
+
+def _job(request: Request, run_id: str) -> Job:
+    try:
+        return request.app.state.jobs.get(run_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="unknown run_id")
+
+
+@app.post("/forecast/jobs", response_model=ForecastJobStatus, status_code=202)
+async def submit_forecast_job(request: Request, payload: ForecastRunRequest = Body(...)):
+    return request.app.state.jobs.submit(payload).to_status(limit=0)
+
+
+@app.get("/forecast/jobs/{run_id}", response_model=ForecastJobStatus)
+async def get_forecast_job(request: Request, run_id: str, offset: int = 0, limit: int = 100):
+    return _job(request, run_id).to_status(offset=offset, limit=limit)
+
+
+@app.post("/forecast/jobs/{run_id}/cancel", response_model=ForecastJobStatus)
+async def cancel_forecast_job(request: Request, run_id: str):
+    _job(request, run_id)
+    try:
+        return request.app.state.jobs.cancel(run_id).to_status(limit=0)
+    except JobStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/forecast/jobs/{run_id}/resume", response_model=ForecastJobStatus, status_code=202)
+async def resume_forecast_job(request: Request, run_id: str):
+    _job(request, run_id)
+    try:
+        return request.app.state.jobs.resume(run_id).to_status(limit=0)
+    except JobStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/forecast/queue", response_model=ForecastQueueStatus, status_code=202)
+async def enqueue_forecast_run(request: Request, payload: ForecastRunRequest = Body(...)):
+    # Split into per-product tasks that any replica or run_once.py worker can claim
+    queue = request.app.state.queue
+    async with connection(getattr(request.app.state, "pool", None)) as conn:
+        run_id = await queue.enqueue(conn, payload)
+        return await queue.status(conn, run_id, max_errors=0)
+
+
+@app.get("/forecast/queue/{run_id}", response_model=ForecastQueueStatus)
+async def get_queued_forecast_run(request: Request, run_id: str):
+    async with connection(getattr(request.app.state, "pool", None)) as conn:
+        status = await request.app.state.queue.status(conn, run_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="unknown run_id")
+    return status
+
+
+def _conditional(request: Request, body: bytes, media_type: str, tag: str, headers: Optional[dict] = None) -> Response:
+    headers = {"ETag": tag, "Cache-Control": "no-cache", **(headers or {})}
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+@app.get("/forecast/stored/{account_id}/{product_id}")
+async def get_stored_forecast(request: Request, account_id: str, product_id: str, country: Optional[str] = None,
+                              start: Optional[date] = None, end: Optional[date] = None):
+    """Latest written forecast of one product, without running anything; supports If-None-Match."""
+    cache = getattr(request.app.state, "read_cache", None)
+    key = ("product", account_id, (product_id, country, start, end))
+    hit = cache.get(key) if cache is not None else None
+    if hit is None:
+        generation = cache.generation(account_id) if cache is not None else None
+        async with connection(getattr(request.app.state, "pool", None)) as conn:
+            rows = await load_product_forecast(conn, account_id, product_id, country, start, end)
+        if not rows:
+            raise HTTPException(status_code=404, detail="no stored forecast for this product")
+        body = product_document(account_id, product_id, rows)
+        hit = (body, "application/json", etag(body), None)
+        if cache is not None:
+            cache.put(key, generation, *hit)
+    return _conditional(request, *hit)
+
+
+@app.get("/forecast/stored/{account_id}")
+async def export_stored_forecasts(request: Request, account_id: str, cursor: Optional[str] = None, limit: int = 10_000,
+                                  country: Optional[str] = None, start: Optional[date] = None, end: Optional[date] = None,
+                                  format: Optional[str] = None):
+    """One keyset page of an account's stored forecasts in (product_id, date) order, as NDJSON or Arrow.
+
+    Pass the ``next_cursor`` of the previous page (NDJSON trailer, ``X-Next-Cursor``
+    header, or ``product_id|date`` of the last row) as ``cursor``; on the last page
+    ``next_cursor`` is null and the header is absent. Pages of up to
+    FORECAST_EXPORT_BUFFER_ROWS rows are cached and carry an ETag; larger ones are
+    streamed as they are read, one keyset chunk (and one short-lived connection) at a time.
+    """
+    arrow = format == "arrow" or (format is None and ARROW_MEDIA_TYPE in request.headers.get("accept", ""))
+    if arrow and not arrow_available():
+        raise HTTPException(status_code=406, detail="Arrow output needs pyarrow installed in the forecast service")
+    if not 1 <= limit <= FORECAST_EXPORT_MAX_ROWS:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {FORECAST_EXPORT_MAX_ROWS}")
+    try:
+        after = parse_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="cursor must be <product_id>|<YYYY-MM-DD>")
+    media_type = ARROW_MEDIA_TYPE if arrow else NDJSON_MEDIA_TYPE
+    pool = getattr(request.app.state, "pool", None)
+    # one row past the page tells whether there is a next one; it is not returned
+    args = (account_id, after, limit + 1, country, start, end)
+
+    if limit > FORECAST_EXPORT_BUFFER_ROWS:
+        async def stream() -> AsyncIterator[bytes]:
+            writer = ArrowWriter() if arrow else None
+            n, last, more = 0, None, False
+            async with aclosing(iter_forecast_rows(pool, *args)) as chunks:
+                async for rows in chunks:
+                    if n + len(rows) > limit:
+                        rows, more = rows[:limit - n], True
+                    if not rows:
+                        break
+                    n, last = n + len(rows), rows[-1]
+                    yield writer.write(rows) if arrow else ndjson_rows(rows).encode()
+            yield writer.close() if arrow else ndjson_trailer(n, last, more).encode()
+
+        return StreamingResponse(stream(), media_type=media_type)
+
+    cache = getattr(request.app.state, "read_cache", None)
+    key = ("export", account_id, (cursor, limit, country, start, end, arrow))
+    hit = cache.get(key) if cache is not None else None
+    if hit is None:
+        generation = cache.generation(account_id) if cache is not None else None
+        rows = [r async for chunk in iter_forecast_rows(pool, *args) for r in chunk]
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if arrow:
+            writer = ArrowWriter()
+            body = writer.write(rows) + writer.close()
+        else:
+            body = (ndjson_rows(rows) + ndjson_trailer(len(rows), rows[-1] if rows else None, more)).encode()
+        # the body's last row fixes the next cursor, so the body hash covers it
+        hit = (body, media_type, etag(body), {"X-Next-Cursor": format_cursor(rows[-1])} if more else None)
+        if cache is not None:
+            cache.put(key, generation, *hit)
+    return _conditional(request, *hit)
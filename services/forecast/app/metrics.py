@@ -0,0 +1,240 @@
+from __future__ import annotations
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as Tally, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+FORECAST_TRACE_KEEP = int(os.getenv("FORECAST_TRACE_KEEP", "100"))
+FORECAST_PROFILE_SLOW_SECONDS = float(os.getenv("FORECAST_PROFILE_SLOW_SECONDS", "0"))  # 0 disables the sampler
+FORECAST_PROFILE_INTERVAL = float(os.getenv("FORECAST_PROFILE_INTERVAL", "0.005"))
+
+logger = logging.getLogger(__name__)
+
+# Stages that mostly wait on Postgres; "fit" is CPU bound and measured in CPU time too
+DB_STAGES = frozenset({"fingerprint", "load", "write", "incremental"})
+
+_SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STAGE_SECONDS = Histogram("forecast_stage_seconds", "Wall time of one pipeline stage for one batch", ["stage"], buckets=_SECONDS)
+DB_SECONDS = Counter("forecast_db_seconds", "Wall time spent in DB-bound stages", ["stage"])
+FIT_CPU_SECONDS = Counter("forecast_fit_cpu_seconds", "CPU time spent fitting (fit worker thread or process)")
+RUN_SECONDS = Histogram("forecast_run_seconds", "Wall time of a forecast run", ["mode"], buckets=_SECONDS)
+RUNS = Counter("forecast_runs", "Forecast runs by outcome", ["mode", "outcome"])
+PRODUCTS = Counter("forecast_products", "Products processed by outcome (ok, cached, failed)", ["outcome"])
+PRODUCT_ROWS_LOADED = Histogram("forecast_product_rows_loaded", "Daily history rows loaded per product", buckets=(0, 7, 30, 90, 180, 365, 540, 730, 1095))
+PRODUCT_FIT_SECONDS = Histogram("forecast_product_fit_seconds", "CPU fit time per product (batch fit time / batch size)", buckets=(1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1))
+PRODUCT_ROWS_WRITTEN = Histogram("forecast_product_rows_written", "Forecast rows written per product", buckets=(1, 7, 14, 30, 60, 90))
+# Series triage (app.triage); class is dead, intermittent or smooth, stage also classify
+TRIAGE_SERIES = Counter("forecast_triage_series", "Series forecast per triage class", ["class"])
+TRIAGE_SECONDS = Counter("forecast_triage_seconds", "Wall time of the triage pass and of each class's forecast", ["stage"])
+# Admission control (app.scheduler); priority is "interactive" or "bulk"
+SCHED_QUEUED = Gauge("forecast_sched_queued", "Runs waiting for a scheduler slot", ["priority"], multiprocess_mode="livesum")
+SCHED_RUNNING = Gauge("forecast_sched_running", "Runs holding a scheduler slot", ["priority"], multiprocess_mode="livesum")
+SCHED_WAIT_SECONDS = Histogram("forecast_sched_wait_seconds", "Time from submission to admission", ["priority"], buckets=_SECONDS)
+SCHED_REJECTED = Counter("forecast_sched_rejected", "Runs rejected with 429 by reason (rate, queue_full, timeout)", ["reason"])
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus text exposition; aggregates all workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+@dataclass
+class Span:
+    name: str
+    start: float  # seconds since the start of the run
+    seconds: float
+    attrs: Dict[str, object] = field(default_factory=dict)
+
+
+class RunTrace:
+    """Spans of one run (one per stage and batch), kept in memory for the last runs."""
+
+    def __init__(self, run_id: str, mode: str = "run", products: int = 0):
+        self.run_id = run_id
+        self.mode = mode
+        self.products = products
+        self.outcome: Optional[str] = None
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.seconds: Optional[float] = None
+        self.fit_cpu_seconds = 0.0
+        self.triage: Optional[Dict[str, Dict[str, float]]] = None  # counts and seconds per triage class
+        self.spans: List[Span] = []
+        self.profile: Optional[List[Tuple[str, int]]] = None
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, **attrs) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t
+            STAGE_SECONDS.labels(name).observe(dt)
+            if name in DB_STAGES:
+                DB_SECONDS.labels(name).inc(dt)
+            self.spans.append(Span(name, t - self._t0, dt, attrs))
+
+    def add_fit_cpu(self, seconds: float, products: int) -> None:
+        self.fit_cpu_seconds += seconds
+        FIT_CPU_SECONDS.inc(seconds)
+        per_product = seconds / max(products, 1)
+        for _ in range(products):
+            PRODUCT_FIT_SECONDS.observe(per_product)
+
+    def add_triage(self, report) -> None:
+        """Accumulate an ``app.triage.TriageReport`` of one batch."""
+        if self.triage is None:
+            self.triage = {"counts": {}, "seconds": {}}
+        for name, n in report.counts.items():
+            self.triage["counts"][name] = self.triage["counts"].get(name, 0) + n
+            TRIAGE_SERIES.labels(name).inc(n)
+        for name, seconds in report.seconds.items():
+            self.triage["seconds"][name] = self.triage["seconds"].get(name, 0.0) + seconds
+            TRIAGE_SECONDS.labels(name).inc(seconds)
+
+    def db_seconds(self) -> float:
+        return sum(s.seconds for s in self.spans if s.name in DB_STAGES)
+
+    def to_dict(self, spans: bool = True) -> Dict[str, object]:
+        out: Dict[str, object] = {
+            "run_id": self.run_id,
+            "mode": self.mode,
+            "products": self.products,
+            "outcome": self.outcome,
+            "error": self.error,
+            "started_at": self.started_at,
+            "seconds": self.seconds,
+            "db_seconds": self.db_seconds(),
+            "fit_cpu_seconds": self.fit_cpu_seconds,
+            "triage": self.triage,
+        }
+        if spans:
+            out["spans"] = [{"name": s.name, "start": s.start, "seconds": s.seconds, **s.attrs} for s in self.spans]
+            # process-wide samples taken during the run (see SamplingProfiler)
+            out["profile"] = [{"stack": stack, "samples": n} for stack, n in self.profile] if self.profile else None
+        return out
+
+
+TRACES: Deque[RunTrace] = deque(maxlen=FORECAST_TRACE_KEEP)
+
+
+def find_trace(run_id: str) -> Optional[RunTrace]:
+    for t in reversed(TRACES):
+        if t.run_id == run_id:
+            return t
+    return None
+
+
+class SamplingProfiler(threading.Thread):
+    """Process-wide sampler of the stacks of every thread, every ``interval`` seconds (folded stack -> count).
+
+    One sampler (``profiler()``) serves every traced run: it samples while at least
+    one run is attached and adds each sample to the tally of every attached run, so
+    a run gets the samples of its own time window. Samples cover the whole process:
+    concurrent runs share them.
+    """
+
+    def __init__(self, interval: float = FORECAST_PROFILE_INTERVAL, max_depth: int = 40):
+        super().__init__(name="forecast-profiler", daemon=True)
+        self.interval = interval
+        self.max_depth = max_depth
+        self._runs: Dict[int, Tally] = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+
+    def attach(self) -> Tally:
+        tally: Tally = Tally()
+        with self._lock:
+            self._runs[id(tally)] = tally
+            self._active.set()
+            if not self.is_alive():
+                self.start()
+        return tally
+
+    def detach(self, tally: Tally, top: int = 25) -> List[Tuple[str, int]]:
+        with self._lock:
+            self._runs.pop(id(tally), None)
+            if not self._runs:
+                self._active.clear()
+        return tally.most_common(top)
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            tick: Tally = Tally()
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                tick[";".join(reversed(stack))] += 1
+            with self._lock:
+                for tally in self._runs.values():
+                    tally.update(tick)
+
+
+_PROFILER: Optional[SamplingProfiler] = None
+_PROFILER_LOCK = threading.Lock()
+
+
+def profiler() -> SamplingProfiler:
+    """The process-wide sampler, created on first use."""
+    global _PROFILER
+    with _PROFILER_LOCK:
+        if _PROFILER is None:
+            _PROFILER = SamplingProfiler()
+        return _PROFILER
+
+
+def _log_slow_run(trace: RunTrace) -> None:
+    logger.warning("slow forecast run %s: %.2fs for %d products (db %.2fs, fit cpu %.2fs)",
+                   trace.run_id, trace.seconds or 0.0, trace.products, trace.db_seconds(), trace.fit_cpu_seconds)
+
+
+# Called with the trace of every run slower than FORECAST_PROFILE_SLOW_SECONDS
+SLOW_RUN_HOOKS: List[Callable[[RunTrace], None]] = [_log_slow_run]
+
+
+@contextmanager
+def track_run(run_id: str, mode: str, products: int) -> Iterator[RunTrace]:
+    """Trace a run and record its outcome; products of a failed run are counted as failed."""
+    trace = RunTrace(run_id, mode, products)
+    samples = profiler().attach() if FORECAST_PROFILE_SLOW_SECONDS > 0 else None
+    try:
+        yield trace
+        trace.outcome = "ok"
+    except BaseException as e:
+        trace.outcome = "error"
+        trace.error = (str(e) or type(e).__name__)[:200]
+        PRODUCTS.labels("failed").inc(products)
+        raise
+    finally:
+        trace.seconds = time.perf_counter() - trace._t0
+        RUN_SECONDS.labels(mode).observe(trace.seconds)
+        RUNS.labels(mode, trace.outcome).inc()
+        TRACES.append(trace)
+        if samples is not None:
+            stacks = profiler().detach(samples)
+            if trace.seconds >= FORECAST_PROFILE_SLOW_SECONDS:
+                trace.profile = stacks
+                for hook in SLOW_RUN_HOOKS:
+                    hook(trace)
@@ -1,26 +1,81 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Tuple, List, Optional
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, Sequence, Tuple, List, Optional, Union
+from itertools import repeat
 import numpy as np
-import pandas as pd
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import json
 import os
 import psycopg
 
+from forecasting.calendar_cache import calendar_features
+
+if TYPE_CHECKING:  # pandas is imported lazily: it dominates the service's cold start
+    import pandas as pd
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
 
 @dataclass
 class ForecastResult:
-    dates: List[pd.Timestamp]
+    days: np.ndarray  # datetime64[D]
     yhat: np.ndarray
     p10: np.ndarray
     p90: np.ndarray
     sigma: float
+    coef: Optional[np.ndarray] = None  # bias + weekday coefficients, for publishing to the model registry
+    method: str = "weekday"  # weekday | zero | sba (see app.triage)
+
+    @property
+    def dates(self) -> List[pd.Timestamp]:
+        import pandas as pd
+
+        return pd.DatetimeIndex(self.days.astype("datetime64[ns]")).tolist()
+
+    def __setstate__(self, state: dict) -> None:
+        if "dates" in state:  # pickled before ``days`` replaced ``dates`` (on-disk forecast cache)
+            state["days"] = np.array(state.pop("dates"), dtype="datetime64[D]")
+        self.__dict__.update(state)
+
+
+@dataclass(frozen=True)
+class DailySeries:
+    """Gap-filled daily history: ``units[i]`` were sold on day ``start + i``."""
+    start: np.datetime64  # datetime64[D]
+    units: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.units)
+
+    @property
+    def days(self) -> np.ndarray:
+        return self.start + np.arange(len(self.units))
+
+    def to_frame(self) -> pd.DataFrame:
+        """The ``date`` / ``units_sold`` frame of the pandas API."""
+        import pandas as pd
 
+        return pd.DataFrame({"date": pd.DatetimeIndex(self.days.astype("datetime64[ns]")), "units_sold": self.units})
 
-async def load_sales_daily(conn: psycopg.AsyncConnection, account_id: str, product_id: str, country: Optional[str] = None, days: int = 730) -> pd.DataFrame:
+
+History = Union[DailySeries, "pd.DataFrame"]
+
+
+def _day_array(values: Sequence[date]) -> np.ndarray:
+    """datetime64[D] of ``datetime.date`` values; via ordinals, ~50x faster than np.array(values, "datetime64[D]")."""
+    return (np.fromiter((d.toordinal() for d in values), np.int64, len(values)) - _EPOCH_ORDINAL).astype("datetime64[D]")
+
+
+def _history_arrays(history: History) -> Tuple[np.ndarray, np.ndarray]:
+    """(datetime64[D] days, float units) of a DailySeries or a ``date`` / ``units_sold`` frame."""
+    if isinstance(history, DailySeries):
+        return history.days, history.units
+    return np.asarray(history["date"].values, dtype="datetime64[D]"), history["units_sold"].to_numpy(dtype=float)
+
+
+async def load_sales_daily(conn: psycopg.AsyncConnection, account_id: str, product_id: str, country: Optional[str] = None, days: int = 730) -> DailySeries:
     since = (datetime.utcnow().date() - timedelta(days=days)).isoformat()
     where_country = " AND country = %(country)s" if country else ""
-    rows = []
     async with conn.cursor() as cur:
         await cur.execute(
             f"""
@@ -34,69 +89,181 @@ async def load_sales_daily(conn: psycopg.AsyncConnection, account_id: str, produ
             """,
             {"account_id": account_id, "product_id": product_id, "since": since, "country": country},
         )
-        async for rec in cur:
-            rows.append({"date": rec[0], "units_sold": float(rec[1] or 0.0)})
+        rows = await cur.fetchall()
+    return _fill_daily(rows)
+
+
+async def load_sales_daily_many(conn: psycopg.AsyncConnection, account_id: str, product_ids: List[str], country: Optional[str] = None, days: int = 730) -> Dict[str, DailySeries]:
+    """Load daily history for many products in a single round trip (product_code = ANY)."""
+    since = (datetime.utcnow().date() - timedelta(days=days)).isoformat()
+    where_country = " AND country = %(country)s" if country else ""
+    async with conn.cursor() as cur:
+        await cur.execute(
+            f"""
+            SELECT product_code, date, COALESCE(units_sold, 0) as units_sold
+            FROM sales_daily
+            WHERE account_id = %(account_id)s
+              AND product_code = ANY(%(product_ids)s)
+              AND date >= %(since)s
+              {where_country}
+            ORDER BY product_code, date
+            """,
+            {"account_id": account_id, "product_ids": list(product_ids), "since": since, "country": country},
+        )
+        rows = await cur.fetchall()
+    return _split_daily(rows, product_ids)
+
+
+def _empty_series() -> DailySeries:
+    return DailySeries(np.datetime64(datetime.utcnow().date(), "D") - 29, np.zeros(30))
+
+
+def _fill_daily(rows: List[tuple]) -> DailySeries:
+    """Gap-fill the (date, units) rows of one product; 30 days of zeros when there are none."""
     if not rows:
-        # Return empty daily frame
-        idx = pd.date_range(end=datetime.utcnow().date(), periods=30, freq="D")
-        return pd.DataFrame({"date": idx, "units_sold": [0.0] * len(idx)})
-    df = pd.DataFrame(rows)
-    df["date"] = pd.to_datetime(df["date"])  # naive date
-    # Ensure no gaps
-    idx = pd.date_range(df["date"].min(), df["date"].max(), freq="D")
-    df = df.set_index("date").reindex(idx).rename_axis("date").reset_index()
-    df["units_sold"] = df["units_sold"].fillna(0.0)
-    return df
-
-
-def _design_matrix(df: pd.DataFrame) -> Tuple[np.ndarray, List[str]]:
-    n = len(df)
-    ones = np.ones((n, 1))
-    weekday = pd.to_datetime(df["date"]).dt.weekday.values
-    xs = [ones]
-    names = ["bias"]
-    for d in range(7):
-        xs.append((weekday == d).astype(float)[:, None])
-        names.append(f"wd_{d}")
-    X = np.hstack(xs)
-    return X, names
-
-
-def _ridge_fit(X: np.ndarray, y: np.ndarray, l2: float = 1e-3) -> Tuple[np.ndarray, float]:
-    XtX = X.T @ X + l2 * np.eye(X.shape[1])
-    coef = np.linalg.solve(XtX, X.T @ y)
-    resid = y - (X @ coef)
-    sigma = float(np.std(resid))
+        return _empty_series()
+    days = _day_array([r[0] for r in rows])
+    first = days.min()
+    units = np.zeros(int((days.max() - first).astype(np.int64)) + 1)
+    units[(days - first).astype(np.int64)] = [float(r[1] or 0.0) for r in rows]
+    return DailySeries(first, units)
+
+
+def _split_daily(rows: List[tuple], product_ids: List[str]) -> Dict[str, DailySeries]:
+    """Split (product_code, date, units) rows into gap-filled daily series per product.
+
+    All products are densified in one vectorized pass: each row is scattered into a
+    flat buffer at ``base[product] + (date - first_date[product])``, and every
+    product's series is a slice of that buffer.
+    """
+    out: Dict[str, DailySeries] = {}
+    if rows:
+        codes = np.array([r[0] for r in rows], dtype=object)
+        dates = _day_array([r[1] for r in rows])
+        units = np.array([float(r[2] or 0.0) for r in rows], dtype=float)
+        uniq, inv = np.unique(codes, return_inverse=True)
+        order = np.lexsort((dates, inv))
+        inv, dates, units = inv[order], dates[order], units[order]
+        starts = np.flatnonzero(np.r_[True, inv[1:] != inv[:-1]])
+        first = dates[starts]
+        last = np.r_[dates[starts[1:] - 1], dates[-1:]]
+        spans = (last - first).astype(np.int64) + 1
+        base = np.r_[0, np.cumsum(spans)[:-1]]
+        flat = np.zeros(int(spans.sum()), dtype=float)
+        pos = base[inv] + (dates - first[inv]).astype(np.int64)
+        flat[pos] = units
+        for g, code in enumerate(uniq):
+            out[str(code)] = DailySeries(first[g], flat[base[g]:base[g] + spans[g]])
+    for pid in product_ids:
+        if pid not in out:
+            out[pid] = _empty_series()
+    return out
+
+
+def _weekday_of(days: np.ndarray) -> np.ndarray:
+    """Monday=0 weekday of datetime64[D] values (1970-01-01 was a Thursday)."""
+    return (days.astype(np.int64) + 3) % 7
+
+
+@dataclass
+class WeekdayStats:
+    """Sufficient statistics of the weekday + bias ridge model, one row per series.
+
+    counts, sums and sumsq are (N, 7) per-weekday aggregates of the target; the 8x8
+    normal equations and the residual variance follow from them exactly.
+    """
+    counts: np.ndarray
+    sums: np.ndarray
+    sumsq: np.ndarray
+
+
+def weekday_stats(y: np.ndarray, weekday: np.ndarray, series: Optional[np.ndarray] = None, n_series: int = 1, weights: Optional[np.ndarray] = None) -> WeekdayStats:
+    """Aggregate (series, weekday) counts, sums and sums of squares with np.bincount.
+
+    Optional per-observation ``weights`` give a weighted fit (e.g. exponential forgetting).
+    """
+    key = weekday.astype(np.int64) if series is None else series.astype(np.int64) * 7 + weekday
+    size = 7 * n_series
+    w = np.ones(len(y)) if weights is None else weights
+    counts = np.bincount(key, weights=w, minlength=size)
+    sums = np.bincount(key, weights=w * y, minlength=size)
+    sumsq = np.bincount(key, weights=w * y * y, minlength=size)
+    return WeekdayStats(counts.reshape(n_series, 7), sums.reshape(n_series, 7), sumsq.reshape(n_series, 7))
+
+
+def fit_weekday_stats(stats: WeekdayStats, l2: float = 1e-3) -> Tuple[np.ndarray, np.ndarray]:
+    """Closed-form ridge fit from per-weekday aggregates (no design matrix).
+
+    Same solution as ``forecasting.train.fit_linear`` on the bias + weekday one-hot design. Residual
+    moments use per-weekday centred sums: sum(r^2) = sum_d M2_d + c_d (mean_d - pred_d)^2.
+    """
+    c, s, q = stats.counts, stats.sums, stats.sumsq
+    N = c.shape[0]
+    n = c.sum(axis=1)
+    XtX = np.zeros((N, 8, 8))
+    XtX[:, 0, 0] = n
+    XtX[:, 0, 1:] = c
+    XtX[:, 1:, 0] = c
+    XtX[:, np.arange(1, 8), np.arange(1, 8)] = c
+    XtX += l2 * np.eye(8)
+    Xty = np.concatenate([s.sum(axis=1, keepdims=True), s], axis=1)
+    coef = np.linalg.solve(XtX, Xty[..., None])[..., 0]
+    pred = coef[:, :1] + coef[:, 1:]
+    safe_c = np.maximum(c, 1.0)
+    mean_d = s / safe_c
+    m2 = np.maximum(q - s * mean_d, 0.0)
+    sse = (m2 + c * (mean_d - pred) ** 2).sum(axis=1)
+    sr = (s - c * pred).sum(axis=1)
+    n = np.maximum(n, 1.0)
+    sigma = np.sqrt(np.maximum(sse / n - (sr / n) ** 2, 0.0))
     return coef, sigma
 
 
-def _predict(X: np.ndarray, coef: np.ndarray) -> np.ndarray:
-    return X @ coef
+def forecast_batch(histories: List[History], horizon: int = 30) -> List[ForecastResult]:
+    """Fit the weekday model on many daily histories (DailySeries or frames) at once.
 
+    Every series is reduced to its ``WeekdayStats`` with one bincount over the
+    concatenated histories, so memory per series is constant whatever its length.
+    """
+    if not histories:
+        return []
+    days, y, series, last_days = _concat_histories(histories)
+    stats = weekday_stats(y, _weekday_of(days), series, n_series=len(histories))
+    return forecast_from_stats(stats, last_days, horizon)
 
-def simple_forecast(df: pd.DataFrame, horizon: int = 30) -> ForecastResult:
-    df = df.copy()
-    X, _ = _design_matrix(df)
-    y = df["units_sold"].astype(float).values
-    coef, sigma = _ridge_fit(X, y)
-    # Build future design matrix
-    last_date = pd.to_datetime(df["date"]).max()
-    future_idx = pd.date_range(last_date + pd.Timedelta(days=1), periods=horizon, freq="D")
-    future_df = pd.DataFrame({"date": future_idx})
-    Xf, _ = _design_matrix(pd.concat([df.iloc[[-1]], future_df], ignore_index=True))
-    Xf = Xf[1:1 + horizon]
-    yhat = _predict(Xf, coef)
+
+def _concat_histories(histories: List[History]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(days, units, series index) of all histories end to end, plus each series' last day."""
+    arrays = [_history_arrays(h) for h in histories]
+    lengths = np.array([len(u) for _, u in arrays])
+    days = np.concatenate([d for d, _ in arrays])
+    y = np.concatenate([u for _, u in arrays])
+    series = np.repeat(np.arange(len(histories)), lengths)
+    ends = np.cumsum(lengths)
+    last_days = np.maximum.reduceat(days, ends - lengths) if len(days) else days
+    return days, y, series, last_days
+
+
+def forecast_from_stats(stats: WeekdayStats, last_days: np.ndarray, horizon: int = 30) -> List[ForecastResult]:
+    """Fit from ``WeekdayStats`` and forecast ``horizon`` days after each series' ``last_days`` (datetime64[D])."""
+    results: List[ForecastResult] = []
     z = 1.2816  # ~ p10/p90
-    p10 = yhat - z * sigma
-    p90 = yhat + z * sigma
-    return ForecastResult(dates=list(future_idx), yhat=yhat, p10=p10, p90=p90, sigma=sigma)
+    coef, sigma = fit_weekday_stats(stats)
+    future_days = last_days[:, None] + 1 + np.arange(horizon)[None, :]
+    yhat = np.einsum("nhp,np->nh", calendar_features(None, future_days)[0], coef)
+    for i in range(len(last_days)):
+        s = float(sigma[i])
+        results.append(ForecastResult(days=future_days[i], yhat=yhat[i], p10=yhat[i] - z * s, p90=yhat[i] + z * s, sigma=s, coef=coef[i]))
+    return results
+
+
+def simple_forecast(history: History, horizon: int = 30) -> ForecastResult:
+    return forecast_batch([history], horizon=horizon)[0]
 
 
 async def write_forecast(conn: psycopg.AsyncConnection, account_id: str, product_id: str, country: Optional[str], res: ForecastResult, run_id: str):
     # Upsert into forecast_product_daily
-    rows = [(
-        d.date(), account_id, product_id, country, float(res.yhat[i]), float(res.p10[i]), float(res.p90[i]), run_id
-    ) for i, d in enumerate(res.dates)]
+    rows = _forecast_rows(account_id, product_id, country, res, run_id)
     async with conn.cursor() as cur:
         await cur.executemany(
             """
@@ -107,6 +274,77 @@ async def write_forecast(conn: psycopg.AsyncConnection, account_id: str, product
             """,
             rows
         )
+        await cur.execute(_NOTIFY_WRITTEN, _written_payload(account_id, run_id))
+
+
+FORECAST_WRITE_CHUNK_ROWS = int(os.getenv("FORECAST_WRITE_CHUNK_ROWS", "50000"))
+
+_STAGE_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS forecast_product_daily_stage (
+      date DATE NOT NULL, account_id TEXT NOT NULL, product_code TEXT NOT NULL, country TEXT,
+      yhat NUMERIC NOT NULL, p10 NUMERIC, p90 NUMERIC, run_id TEXT
+    ) ON COMMIT DELETE ROWS
+"""
+
+_STAGE_COPY = "COPY forecast_product_daily_stage (date, account_id, product_code, country, yhat, p10, p90, run_id) FROM STDIN"
+
+_STAGE_MERGE = """
+    INSERT INTO forecast_product_daily(date, account_id, product_code, country, yhat, p10, p90, run_id)
+    SELECT date, account_id, product_code, country, yhat, p10, p90, run_id FROM forecast_product_daily_stage
+    ON CONFLICT (account_id, product_code, date)
+    DO UPDATE SET yhat=EXCLUDED.yhat, p10=EXCLUDED.p10, p90=EXCLUDED.p90, country=COALESCE(EXCLUDED.country, forecast_product_daily.country), run_id=EXCLUDED.run_id
+"""
+
+
+# NOTIFY'd by every forecast writer, delivered on commit; the read API drops its cached responses for the account
+FORECAST_WRITTEN_CHANNEL = "forecast_written"
+_NOTIFY_WRITTEN = f"SELECT pg_notify('{FORECAST_WRITTEN_CHANNEL}', %s)"
+
+
+def _written_payload(account_id: str, run_id: str) -> Tuple[str]:
+    return (json.dumps({"account_id": account_id, "run_id": run_id}),)
+
+
+def _forecast_rows(account_id: str, product_id: str, country: Optional[str], res: ForecastResult, run_id: str) -> List[tuple]:
+    return list(zip(
+        res.days.tolist(), repeat(account_id), repeat(product_id), repeat(country),
+        res.yhat.tolist(), res.p10.tolist(), res.p90.tolist(), repeat(run_id),
+    ))
+
+
+def _row_chunks(account_id: str, country: Optional[str], items: Iterable[Tuple[str, ForecastResult]], run_id: str, chunk_rows: int) -> Iterator[List[tuple]]:
+    """Group forecast rows of many products into chunks of about ``chunk_rows`` rows.
+
+    A product repeated within a chunk starts a new chunk, so that a single merge
+    never touches the same (account, product, date) key twice.
+    """
+    chunk: List[tuple] = []
+    seen = set()
+    for pid, res in items:
+        if chunk and (pid in seen or len(chunk) >= chunk_rows):
+            yield chunk
+            chunk, seen = [], set()
+        chunk.extend(_forecast_rows(account_id, pid, country, res, run_id))
+        seen.add(pid)
+    if chunk:
+        yield chunk
+
+
+async def write_forecasts_bulk(conn: psycopg.AsyncConnection, account_id: str, country: Optional[str], items: Iterable[Tuple[str, ForecastResult]], run_id: str, chunk_rows: Optional[int] = None) -> int:
+    """Write the forecasts of a whole run: COPY into a temp staging table, then one set-based upsert per chunk."""
+    written = 0
+    async with conn.cursor() as cur:
+        await cur.execute(_STAGE_DDL)
+        for chunk in _row_chunks(account_id, country, items, run_id, chunk_rows or FORECAST_WRITE_CHUNK_ROWS):
+            async with cur.copy(_STAGE_COPY) as copy:
+                for row in chunk:
+                    await copy.write_row(row)
+            await cur.execute(_STAGE_MERGE)
+            await cur.execute("TRUNCATE forecast_product_daily_stage")
+            written += len(chunk)
+        if written:
+            await cur.execute(_NOTIFY_WRITTEN, _written_payload(account_id, run_id))
+    return written
 
 
 def get_dsn() -> str:
@@ -119,7 +357,6 @@ def get_dsn() -> str:
 def load_sales_daily_sync(conn: psycopg.Connection, account_id: str, product_id: str, country: Optional[str] = None, days: int = 730) -> pd.DataFrame:
     since = (datetime.utcnow().date() - timedelta(days=days)).isoformat()
     where_country = " AND country = %(country)s" if country else ""
-    rows = []
     with conn.cursor() as cur:
         cur.execute(
             f"""
@@ -133,22 +370,32 @@ def load_sales_daily_sync(conn: psycopg.Connection, account_id: str, product_id:
             """,
             {"account_id": account_id, "product_id": product_id, "since": since, "country": country},
         )
-        for rec in cur:
-            rows.append({"date": rec[0], "units_sold": float(rec[1] or 0.0)})
-    if not rows:
-        idx = pd.date_range(end=datetime.utcnow().date(), periods=30, freq="D")
-        return pd.DataFrame({"date": idx, "units_sold": [0.0] * len(idx)})
-    df = pd.DataFrame(rows)
-    df["date"] = pd.to_datetime(df["date"])  # naive date
-    idx = pd.date_range(df["date"].min(), df["date"].max(), freq="D")
-    df = df.set_index("date").reindex(idx).rename_axis("date").reset_index()
-    df["units_sold"] = df["units_sold"].fillna(0.0)
-    return df
+        rows = list(cur)
+    return _fill_daily(rows).to_frame()
+
+def load_sales_daily_many_sync(conn: psycopg.Connection, account_id: str, product_ids: List[str], country: Optional[str] = None, days: int = 730, frames: bool = True) -> Dict[str, History]:
+    """Sync ``load_sales_daily_many``; returns DataFrames unless ``frames`` is False."""
+    since = (datetime.utcnow().date() - timedelta(days=days)).isoformat()
+    where_country = " AND country = %(country)s" if country else ""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT product_code, date, COALESCE(units_sold, 0) as units_sold
+            FROM sales_daily
+            WHERE account_id = %(account_id)s
+              AND product_code = ANY(%(product_ids)s)
+              AND date >= %(since)s
+              {where_country}
+            ORDER BY product_code, date
+            """,
+            {"account_id": account_id, "product_ids": list(product_ids), "since": since, "country": country},
+        )
+        rows = cur.fetchall()
+    series = _split_daily(rows, product_ids)
+    return {pid: s.to_frame() for pid, s in series.items()} if frames else series
 
 def write_forecast_sync(conn: psycopg.Connection, account_id: str, product_id: str, country: Optional[str], res: ForecastResult, run_id: str):
-    rows = [(
-        d.date(), account_id, product_id, country, float(res.yhat[i]), float(res.p10[i]), float(res.p90[i]), run_id
-    ) for i, d in enumerate(res.dates)]
+    rows = _forecast_rows(account_id, product_id, country, res, run_id)
     with conn.cursor() as cur:
         cur.executemany(
             """
@@ -159,4 +406,21 @@ def write_forecast_sync(conn: psycopg.Connection, account_id: str, product_id: s
             """,
             rows
         )
+        cur.execute(_NOTIFY_WRITTEN, _written_payload(account_id, run_id))
+    conn.commit()
+
+def write_forecasts_bulk_sync(conn: psycopg.Connection, account_id: str, country: Optional[str], items: Iterable[Tuple[str, ForecastResult]], run_id: str, chunk_rows: Optional[int] = None) -> int:
+    written = 0
+    with conn.cursor() as cur:
+        cur.execute(_STAGE_DDL)
+        for chunk in _row_chunks(account_id, country, items, run_id, chunk_rows or FORECAST_WRITE_CHUNK_ROWS):
+            with cur.copy(_STAGE_COPY) as copy:
+                for row in chunk:
+                    copy.write_row(row)
+            cur.execute(_STAGE_MERGE)
+            cur.execute("TRUNCATE forecast_product_daily_stage")
+            written += len(chunk)
+        if written:
+            cur.execute(_NOTIFY_WRITTEN, _written_payload(account_id, run_id))
     conn.commit()
+    return written
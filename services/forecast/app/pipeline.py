@@ -0,0 +1,333 @@
+from __future__ import annotations
+import asyncio
+import os
+import time
+from concurrent.futures import Executor
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+
+from psycopg_pool import AsyncConnectionPool
+
+from .cache import ForecastCache, load_fingerprints_many
+from .db import connection
+from .history_cube import HistoryCube
+from .incremental import incremental_forecast
+from .metrics import PRODUCT_ROWS_LOADED, PRODUCT_ROWS_WRITTEN, PRODUCTS, RunTrace
+from .model import ForecastResult, forecast_batch, load_sales_daily_many, write_forecasts_bulk
+from .schemas import ForecastProductSummary
+from .triage import FORECAST_TRIAGE, TriageReport, forecast_triaged
+
+FORECAST_BATCH_SIZE = int(os.getenv("FORECAST_BATCH_SIZE", "500"))
+FORECAST_MAX_CONCURRENCY = int(os.getenv("FORECAST_MAX_CONCURRENCY", "4"))
+
+
+def _fit(histories, horizon: int, triage: bool, report: Optional[TriageReport]) -> List[ForecastResult]:
+    if not triage:
+        return forecast_batch(histories, horizon)
+    results, part = forecast_triaged(histories, horizon)
+    report.add(part)
+    return results
+
+
+def _fit_timed(histories, horizon: int, triage: bool = False):
+    """forecast_batch (or forecast_triaged) plus the CPU time it used and the triage report.
+
+    Module level so process executors can pickle it.
+    """
+    t = time.thread_time()
+    report = TriageReport() if triage else None
+    results = _fit(histories, horizon, triage, report)
+    return results, time.thread_time() - t, report
+
+
+def _fit_each_timed(histories, horizon: int, triage: bool = False):
+    """Fit products one by one so a single bad series fails alone: (results or None, errors, cpu, triage report)."""
+    t = time.thread_time()
+    report = TriageReport() if triage else None
+    results, errors = [], {}
+    for i, history in enumerate(histories):
+        try:
+            results.append(_fit([history], horizon, triage, report)[0])
+        except Exception as e:
+            results.append(None)
+            errors[i] = _error_text(e)
+    return results, errors, time.thread_time() - t, report
+
+
+def _error_text(e: BaseException) -> str:
+    return (str(e) or type(e).__name__)[:200]
+
+
+@dataclass
+class BatchOutcome:
+    """One written batch: results in ``product_ids`` order, None where the product failed."""
+    index: int
+    start: int  # offset of the batch in the run's product_ids
+    product_ids: List[str]
+    results: List[Optional[ForecastResult]]
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+def summarize(product_id: str, horizon: int, res: ForecastResult) -> ForecastProductSummary:
+    return ForecastProductSummary(
+        product_id=product_id,
+        horizon_days=horizon,
+        mean=float(res.yhat.mean()),
+        p10=float(res.p10.min()),
+        p90=float(res.p90.max()),
+    )
+
+
+async def iter_pipeline(
+    pool: Optional[AsyncConnectionPool],
+    account_id: str,
+    product_ids: List[str],
+    country: Optional[str],
+    horizon: int,
+    run_id: str,
+    max_concurrency: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    cache: Optional[ForecastCache] = None,
+    incremental: bool = False,
+    decay: Optional[float] = None,
+    trace: Optional[RunTrace] = None,
+    isolate_errors: bool = False,
+    history: Optional[HistoryCube] = None,
+    triage: Optional[bool] = None,
+) -> AsyncIterator[BatchOutcome]:
+    """Load, fit and write a run as a bounded producer/consumer pipeline, yielding each batch once written.
+
+    Products are split into batches of ``batch_size``. Up to ``max_concurrency``
+    batches are loaded at once, each on its own pooled connection, and fitted on
+    ``executor`` (the loop's default thread pool when None) so the event loop is
+    never blocked by NumPy work. A single writer drains fitted batches with the
+    bulk COPY writer and yields them in completion order. A batch holds one of
+    ``max_concurrency`` slots from its load until it is written, so at most that
+    many batches are in memory whatever the run size.
+
+    By default the first error aborts the run and the writer's transaction covers
+    the whole run, so the writer keeps one connection throughout and
+    ``max_concurrency`` is capped at the pool size minus one. With
+    ``isolate_errors``, each batch is written in its own transaction on a
+    connection borrowed for that write, a failed load or write fails only that
+    batch, a failed fit is retried product by product, and failures are reported
+    in ``BatchOutcome.errors``.
+
+    With a ``cache``, products whose history fingerprint is unchanged since their
+    last fit are served from it and are neither reloaded nor refitted. Fresh fits
+    are cached only once their rows are committed (after the batch's write when
+    isolated, after the run otherwise).
+
+    With a ``history`` cube holding a fresh copy of the account's sales, batches
+    are sliced from it and Postgres is only used to write; fitting from memory is
+    cheaper than fingerprinting, so the cache is not consulted on that path.
+
+    With ``incremental``, each batch is forecast from its stored normal-equation
+    state and only rows newer than the state watermark are read (see
+    ``incremental_forecast``); the cache is bypassed.
+
+    With ``triage`` (default: ``FORECAST_TRIAGE``), dead and intermittent series are
+    forecast by ``app.triage`` instead of the weekday model; incremental runs are
+    not triaged.
+
+    Every stage of every batch is timed into ``trace`` (and the stage histograms
+    of ``app.metrics``).
+    """
+    max_concurrency = max_concurrency or FORECAST_MAX_CONCURRENCY
+    if pool is not None and not isolate_errors:
+        # the writer holds a connection for the whole run: leave producers the rest of the pool
+        max_concurrency = max(1, min(max_concurrency, pool.max_size - 1))
+    batch_size = batch_size or FORECAST_BATCH_SIZE
+    trace = trace or RunTrace(run_id, products=len(product_ids))
+    triage = FORECAST_TRIAGE if triage is None else triage
+    batches = [product_ids[i:i + batch_size] for i in range(0, len(product_ids), batch_size)]
+    # A slot is taken before a batch is loaded and given back by the writer once the
+    # batch is written, so loads, fits and fitted batches waiting for the writer
+    # together never exceed max_concurrency
+    slots = asyncio.Semaphore(max_concurrency)
+    queue: asyncio.Queue = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+
+    async def fit(b: int, pids: List[str], dfs) -> tuple:
+        with trace.stage("fit", batch=b, products=len(pids)):
+            try:
+                fitted, cpu, report = await loop.run_in_executor(executor, _fit_timed, dfs, horizon, triage)
+                errors: Dict[str, str] = {}
+            except Exception:
+                if not isolate_errors:
+                    raise
+                fitted, failed, cpu, report = await loop.run_in_executor(executor, _fit_each_timed, dfs, horizon, triage)
+                errors = {pids[i]: msg for i, msg in failed.items()}
+        trace.add_fit_cpu(cpu, len(pids))
+        if report is not None:
+            trace.add_triage(report)
+        return fitted, errors
+
+    async def produce_incremental(b: int, pids: List[str]) -> tuple:
+        async with connection(pool) as conn:
+            with trace.stage("incremental", batch=b, products=len(pids)):
+                batch = await incremental_forecast(conn, account_id, pids, country, horizon, run_id, decay)
+        return b, batch, list(zip(pids, batch)), {}, 0, []
+
+    async def produce(b: int, pids: List[str]) -> tuple:
+        if incremental:
+            return await produce_incremental(b, pids)
+        cached: Dict[str, ForecastResult] = {}
+        fingerprints = None
+        todo = list(dict.fromkeys(pids))
+        histories = None
+        if history is not None:
+            with trace.stage("cube", batch=b, products=len(todo)):
+                histories = await asyncio.to_thread(history.series_many, account_id, todo, country)
+        if histories is None:
+            async with connection(pool) as conn:
+                if cache is not None:
+                    with trace.stage("fingerprint", batch=b, products=len(pids)):
+                        fingerprints = await load_fingerprints_many(conn, account_id, pids, country)
+                    lookups = [((account_id, pid, country, horizon), fingerprints[pid]) for pid in pids]
+                    hits = await asyncio.to_thread(cache.get_many, lookups) if cache.blocking else cache.get_many(lookups)
+                    for pid, hit in zip(pids, hits):
+                        # a zero / SBA forecast cached by a triaged run is not served to an untriaged one
+                        if hit is not None and (triage or hit.method == "weekday"):
+                            cached[pid] = hit
+                todo = [pid for pid in todo if pid not in cached]
+                with trace.stage("load", batch=b, products=len(todo)):
+                    histories = await load_sales_daily_many(conn, account_id, todo, country) if todo else {}
+        for pid in todo:
+            PRODUCT_ROWS_LOADED.observe(len(histories[pid]))
+        fitted, errors = await fit(b, todo, [histories[pid] for pid in todo]) if todo else ([], {})
+        fresh = [(pid, res) for pid, res in zip(todo, fitted) if res is not None]
+        # cached by the writer once these rows are committed (see remember)
+        entries = [((account_id, pid, country, horizon), fingerprints[pid], res) for pid, res in fresh] if fingerprints is not None else []
+        by_pid = {**cached, **dict(fresh)}
+        batch = [by_pid.get(pid) for pid in pids]
+        # Cache hits can skip the write: their rows are already in forecast_product_daily
+        to_write = fresh if cache is not None and cache.skip_write else [(pid, res) for pid, res in zip(pids, batch) if res is not None]
+        return b, batch, to_write, errors, len(cached), entries
+
+    async def produce_slot(b: int, pids: List[str]) -> None:
+        await slots.acquire()  # released by the writer
+        try:
+            item = await produce(b, pids)
+        except Exception as e:
+            if not isolate_errors:
+                raise  # the run is aborted: keep the slot so no further batch starts
+            msg = _error_text(e)
+            item = (b, [None] * len(pids), [], {pid: msg for pid in pids}, 0, [])
+        queue.put_nowait(item)
+
+    tasks: List[asyncio.Future] = []
+
+    async def produce_all() -> None:
+        tasks.extend(asyncio.ensure_future(produce_slot(b, pids)) for b, pids in enumerate(batches))
+        try:
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            # gather does not cancel the other batches: stop their loads and fits now
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await queue.put(e)
+        else:
+            await queue.put(None)
+
+    async def remember(entries: list) -> None:
+        # Only committed forecasts may be cached: with skip_write a hit is not written again
+        if not entries:
+            return
+        if cache.blocking:
+            await asyncio.to_thread(cache.put_many, entries)
+        else:
+            cache.put_many(entries)
+
+    counts = {"ok": 0, "cached": 0, "failed": 0}
+    uncommitted: list = []  # cache entries of the run-wide transaction
+    counted = False  # an aborted run is counted as failed by the caller (see metrics.track_run)
+    producer = asyncio.ensure_future(produce_all())
+    try:
+        async with AsyncExitStack() as stack:
+            # the run-wide transaction needs one connection throughout; isolated batches borrow one per write
+            run_conn = None if isolate_errors else await stack.enter_async_context(connection(pool))
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                b, batch, to_write, errors, n_cached, entries = item
+                if to_write:
+                    try:
+                        with trace.stage("write", batch=b, products=len(to_write)):
+                            if isolate_errors:
+                                async with connection(pool) as conn, conn.transaction():
+                                    await write_forecasts_bulk(conn, account_id, country, to_write, run_id)
+                            else:
+                                await write_forecasts_bulk(run_conn, account_id, country, to_write, run_id)
+                    except Exception as e:
+                        if not isolate_errors:
+                            raise
+                        msg = _error_text(e)
+                        errors = {**errors, **{pid: msg for pid, _ in to_write}}
+                        batch = [None if pid in errors else res for pid, res in zip(batches[b], batch)]
+                    else:
+                        for _, res in to_write:
+                            PRODUCT_ROWS_WRITTEN.observe(len(res.yhat))
+                        if isolate_errors:
+                            await remember(entries)
+                        else:
+                            uncommitted.extend(entries)
+                slots.release()
+                failed = sum(res is None for res in batch)
+                counts["failed"] += failed
+                counts["cached"] += n_cached
+                counts["ok"] += len(batch) - failed - n_cached
+                yield BatchOutcome(b, b * batch_size, batches[b], batch, errors)
+        await producer
+        await remember(uncommitted)  # the run-wide transaction committed when the stack closed
+        counted = True
+    except GeneratorExit:
+        # consumer went away (e.g. a streaming client disconnected): isolated batches are already committed
+        counted = isolate_errors
+        raise
+    finally:
+        # a failed write (or a consumer that went away) leaves batches waiting for a slot
+        for t in (producer, *tasks):
+            if not t.done():
+                t.cancel()
+        await asyncio.gather(producer, *tasks, return_exceptions=True)
+        if counted:
+            for outcome, n in counts.items():
+                PRODUCTS.labels(outcome).inc(n)
+
+
+async def run_pipeline(
+    pool: Optional[AsyncConnectionPool],
+    account_id: str,
+    product_ids: List[str],
+    country: Optional[str],
+    horizon: int,
+    run_id: str,
+    max_concurrency: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    cache: Optional[ForecastCache] = None,
+    incremental: bool = False,
+    decay: Optional[float] = None,
+    trace: Optional[RunTrace] = None,
+    history: Optional[HistoryCube] = None,
+    triage: Optional[bool] = None,
+) -> List[ForecastResult]:
+    """Run ``iter_pipeline`` to completion; results come back in ``product_ids`` order.
+
+    The run commits as a whole: the first error aborts it and nothing is written.
+    """
+    results: List[Optional[ForecastResult]] = [None] * len(product_ids)
+    async for out in iter_pipeline(
+        pool, account_id, product_ids, country, horizon, run_id,
+        max_concurrency=max_concurrency, batch_size=batch_size, executor=executor, cache=cache,
+        incremental=incremental, decay=decay, trace=trace, history=history, triage=triage,
+    ):
+        results[out.start:out.start + len(out.results)] = out.results
+    return results  # type: ignore[return-value]
@@ -0,0 +1,331 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from forecasting.artifact_store import ArtifactRecord, ArtifactStore
+from forecasting.calendar_cache import calendar_features
+
+from .model import ForecastResult
+
+_WEEKDAYS = [f"wd_{d}" for d in range(7)]
+_Z = 1.2816  # ~ p10/p90
+
+logger = logging.getLogger(__name__)
+
+
+def model_key(product_id: str, country: Optional[str], channel: Optional[str] = None, account_id: Optional[str] = None) -> str:
+    """Same key as the trainer's ``series_key``: p<product>_<country>_<channel>.
+
+    Models fitted by the service are per tenant: a<account>/p<product>_<country>_<channel>.
+    The account-less key only holds trainer artifacts.
+    """
+    key = f"p{product_id}_{country}_{channel or 'GLOBAL'}"
+    return key if account_id is None else f"a{account_id}/{key}"
+
+
+@dataclass(frozen=True)
+class CompiledModel:
+    """A stored linear model folded into calendar terms: yhat = intercept + weekday[wd] + holiday * is_holiday.
+
+    Exogenous regressors other than the holiday flag are carried forward from the last
+    training row (as the trainer does for its own forecast), so they fold into ``intercept``.
+    """
+    key: str
+    country: Optional[str]
+    intercept: float
+    weekday: np.ndarray  # (7,) Monday=0
+    holiday: float
+    sigma: float
+    last_date: np.datetime64  # datetime64[D]
+    created: np.datetime64
+    segment: str
+    source: str = "trainer"  # "service" for models published by ModelRegistry.publish
+    method: str = "weekday"  # ForecastResult.method of service models: weekday | zero | sba
+    band: Optional[Tuple[float, float]] = None  # stored (p10 - yhat, p90 - yhat) of flat zero / SBA forecasts
+
+    def evaluate(self, start=None, horizon: int = 30) -> Tuple[np.ndarray, np.ndarray]:
+        """(days datetime64[D], yhat) for `horizon` days from `start` (default: the day after training)."""
+        first = self.last_date + 1 if start is None else np.datetime64(start, "D")
+        days = first + np.arange(horizon)
+        yhat = self.intercept + self.weekday[(days.astype(np.int64) + 3) % 7]
+        if self.holiday:
+            yhat = yhat + self.holiday * calendar_features(self.country, days)[2]
+        return days, yhat
+
+    def interval(self, yhat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(p10, p90) around ``yhat``: the Gaussian band of weekday models, the stored empirical one otherwise."""
+        if self.band is None:
+            return yhat - _Z * self.sigma, yhat + _Z * self.sigma
+        return np.maximum(yhat + self.band[0], 0.0), yhat + self.band[1]
+
+    def predict(self, start=None, horizon: int = 30) -> ForecastResult:
+        days, yhat = self.evaluate(start, horizon)
+        p10, p90 = self.interval(yhat)
+        return ForecastResult(days=days, yhat=yhat, p10=p10, p90=p90, sigma=self.sigma, method=self.method)
+
+
+def compile_model(row: dict) -> CompiledModel:
+    meta = row.get("meta") or {}
+    country = (meta.get("config") or {}).get("country") or meta.get("country")
+    intercept, holiday = 0.0, 0.0
+    weekday = np.zeros(7)
+    for name, c, x in zip(row["features"], row["coef"], row["last_x"]):
+        if name == "bias":
+            intercept += c
+        elif name in _WEEKDAYS:
+            weekday[_WEEKDAYS.index(name)] += c
+        elif name == "exog_holiday":
+            holiday += c
+        else:
+            intercept += c * x
+    method = meta.get("method", "weekday")
+    band = None
+    if method != "weekday":
+        # zero / SBA bands are empirical quantiles of recent demand, not yhat -/+ z sigma
+        yhat, p10, p90 = (float(v) for v in row["forecast"][0]) if len(row["forecast"]) else (0.0, 0.0, 0.0)
+        band = (p10 - yhat, p90 - yhat)
+    return CompiledModel(
+        key=row["key"], country=country, intercept=float(intercept), weekday=weekday, holiday=float(holiday),
+        sigma=float(row["sigma"]), last_date=row["last_date"], created=row["created"], segment=row["segment"],
+        source=meta.get("source", "trainer"), method=method, band=band,
+    )
+
+
+class ModelRegistry:
+    """Process-local registry of compiled models read from the columnar artifact store.
+
+    Models are loaded on first use (one memory-mapped row) and kept in memory. The store
+    index is re-checked at most every ``poll_seconds``; when it changed (new artifacts
+    committed by the trainer or by ``publish``) the compiled models are dropped and
+    reloaded lazily, so no request ever waits on a full reload.
+    """
+
+    def __init__(self, root: str, poll_seconds: float = 2.0, publish_enabled: bool = False):
+        self.store = ArtifactStore(root)
+        self.poll_seconds = poll_seconds
+        self.publish_enabled = publish_enabled
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._models: Dict[str, Optional[CompiledModel]] = {}
+        self._index_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["ModelRegistry"]:
+        root = os.getenv("FORECAST_MODEL_STORE")
+        if not root:
+            return None
+        return cls(
+            root,
+            poll_seconds=float(os.getenv("FORECAST_REGISTRY_POLL", "2.0")),
+            publish_enabled=os.getenv("FORECAST_MODEL_PUBLISH", "0") == "1",
+        )
+
+    def _index_path_mtime(self) -> Optional[float]:
+        try:
+            return (self.store.root / "index.npy").stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.poll_seconds:
+            return
+        self._checked_at = now
+        mtime = self._index_path_mtime()
+        if mtime != self._index_mtime:
+            self._index_mtime = mtime
+            self._models.clear()
+            self.store._segments.clear()  # segments dropped by prune() must not stay mapped
+            self.reloads += 1
+
+    def get(self, key: str) -> Optional[CompiledModel]:
+        with self._lock:
+            self._maybe_reload()
+            if key in self._models:
+                self.hits += 1
+                return self._models[key]
+            self.misses += 1
+            row = self.store.load(key)
+            model = compile_model(row) if row is not None else None
+            self._models[key] = model
+            return model
+
+    def find(self, account_id: str, product_id: str, country: Optional[str], channel: Optional[str] = None) -> Optional[CompiledModel]:
+        """The account's own service model, else the trainer's model of the product.
+
+        The ``channel`` models are looked up first, then the GLOBAL ones: service models
+        are fitted on sales of every channel and are always published under GLOBAL.
+        Service models published under the account-less key (before keys carried the
+        account) are never served: they may belong to another tenant.
+        """
+        for ch in dict.fromkeys([channel, None]):
+            model = self.get(model_key(product_id, country, ch, account_id=account_id))
+            if model is not None:
+                return model
+            model = self.get(model_key(product_id, country, ch))
+            if model is not None and model.source != "service":
+                return model
+        return None
+
+    def records(self, account_id: str, country: Optional[str], items: Iterable[Tuple[str, ForecastResult]], run_id: str) -> List[ArtifactRecord]:
+        """Artifact records of service-fitted models of one account (models without coefficients are skipped).
+
+        sales_daily has no channel, so the models are keyed under the GLOBAL channel.
+        """
+        records: List[ArtifactRecord] = []
+        for pid, res in items:
+            if res.coef is None or not len(res.days):
+                continue
+            first = res.days[0]
+            records.append(ArtifactRecord(
+                key=model_key(pid, country, account_id=account_id),
+                features=["bias"] + _WEEKDAYS,
+                coef=np.asarray(res.coef),
+                last_x=np.ones(len(res.coef)),
+                sigma=res.sigma,
+                last_date=first - 1,
+                forecast=np.column_stack([res.yhat, res.p10, res.p90]),
+                metrics={},
+                endog_len=0,
+                meta={"account_id": account_id, "country": country, "run_id": run_id, "source": "service", "method": res.method},
+            ))
+        return records
+
+    def publish(self, account_id: str, country: Optional[str], items: Iterable[Tuple[str, ForecastResult]], run_id: str) -> int:
+        """Append service-fitted models of one account to the store as one segment. Returns #models.
+
+        The service itself publishes through a ``ModelPublisher``, which batches many
+        runs into one segment.
+        """
+        records = self.records(account_id, country, items, run_id)
+        if not records:
+            return 0
+        with self._lock:
+            self.store.commit([self.store.write_segment(records, tag="service")])
+            self._checked_at = 0.0
+        return len(records)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": True,
+            "root": str(self.store.root),
+            "models": len(self._models),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "publish": self.publish_enabled,
+        }
+
+
+class ModelPublisher:
+    """Process-wide single writer of service-fitted models.
+
+    Runs, job chunks, streamed batches and queue leases only ``submit`` their models;
+    a background task commits everything pending as one segment once
+    ``max_models`` are waiting or every ``max_delay`` seconds. After a commit,
+    small segments are compacted once more than ``max_segments`` are live, and
+    segments the index no longer references are pruned. Writes go through a store
+    object of their own, so readers of the registry never wait on a commit.
+    """
+
+    def __init__(self, registry: ModelRegistry, max_models: int = 5000, max_delay: float = 5.0,
+                 max_segments: int = 64, prune_seconds: float = 600.0):
+        self.registry = registry
+        self.store = ArtifactStore(registry.store.root)
+        self.max_models = max_models
+        self.max_delay = max_delay
+        self.max_segments = max_segments
+        self.prune_seconds = prune_seconds
+        self.published = 0
+        self.flushes = 0
+        self.compactions = 0
+        self.pruned = 0
+        self._pending: List[ArtifactRecord] = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._pruned_at = time.monotonic()
+
+    @classmethod
+    def from_env(cls, registry: Optional[ModelRegistry]) -> Optional["ModelPublisher"]:
+        if registry is None or not registry.publish_enabled:
+            return None
+        return cls(
+            registry,
+            max_models=int(os.getenv("FORECAST_MODEL_PUBLISH_MAX_MODELS", "5000")),
+            max_delay=float(os.getenv("FORECAST_MODEL_PUBLISH_DELAY", "5.0")),
+            max_segments=int(os.getenv("FORECAST_MODEL_STORE_MAX_SEGMENTS", "64")),
+        )
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def submit(self, account_id: str, country: Optional[str], items: Iterable[Tuple[str, ForecastResult]], run_id: str) -> int:
+        records = self.registry.records(account_id, country, items, run_id)
+        self._pending.extend(records)
+        if len(self._pending) >= self.max_models:
+            self._wake.set()
+        return len(records)
+
+    async def flush(self) -> int:
+        """Commit every pending model as one segment. Returns #models committed."""
+        async with self._flush_lock:
+            records, self._pending = self._pending, []
+            if not records:
+                return 0
+            try:
+                await asyncio.to_thread(self._commit, records)
+            except BaseException:
+                self._pending[:0] = records  # retried on the next flush
+                raise
+            self.published += len(records)
+            self.flushes += 1
+            self.registry._checked_at = 0.0
+            return len(records)
+
+    def _commit(self, records: List[ArtifactRecord]) -> None:
+        self.store.commit([self.store.write_segment(records, tag="service")])
+        compacted = self.store.compact(max_segments=self.max_segments)
+        self.compactions += compacted is not None
+        now = time.monotonic()
+        if now - self._pruned_at >= self.prune_seconds:
+            self._pruned_at = now
+            self.pruned += self.store.prune(min_age_seconds=self.prune_seconds)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("model publish failed; %d models kept pending", len(self._pending))
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "pending": len(self._pending),
+            "published": self.published,
+            "flushes": self.flushes,
+            "compactions": self.compactions,
+            "pruned": self.pruned,
+        }
@@ -0,0 +1,237 @@
+"""Admission control and per-account fair scheduling of forecast runs within one service process.
+
+Every run (and every chunk of a background job) takes one of ``slots`` before it
+touches the pool or the fit executor:
+
+- runs of at most ``interactive_products`` products are *interactive* and are
+  always dispatched before bulk ones; ``interactive_slots`` slots are never given
+  to bulk work, so a large run cannot take the whole process;
+- between accounts, waiting runs are ordered by start-time fair queuing: an
+  account's runs get virtual finish tags spaced by ``products / weight``, so an
+  account with a 50k-SKU backlog yields to one asking for 20 SKUs;
+- each account holds at most ``account_concurrency`` slots and submits at most
+  ``account_rate`` runs per second (token bucket of ``account_burst``);
+- a run that cannot be queued (``max_queued``, ``account_max_queued``), that is over
+  its rate, or that waited ``max_wait`` seconds is rejected with ``AdmissionRejected``
+  carrying a Retry-After estimate, which the API turns into a 429.
+"""
+from __future__ import annotations
+import asyncio
+import math
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+
+from .metrics import SCHED_QUEUED, SCHED_REJECTED, SCHED_RUNNING, SCHED_WAIT_SECONDS
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"forecast scheduler saturated ({reason}), retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    # "acc-1=3,acc-2=0.5"
+    weights = {}
+    for item in spec.split(","):
+        if "=" in item:
+            account, weight = item.split("=", 1)
+            weights[account.strip()] = float(weight)
+    return weights
+
+
+@dataclass
+class Ticket:
+    """A slot (once ``admitted``) held by one run; give it back with ``FairScheduler.release``."""
+    account_id: str
+    products: int
+    interactive: bool
+    start_tag: float
+    finish_tag: float
+    seq: int
+    submitted: float = field(default_factory=time.monotonic)
+    admitted: Optional[float] = None
+    _ready: Optional[asyncio.Future] = None
+
+    @property
+    def priority(self) -> str:
+        return "interactive" if self.interactive else "bulk"
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        slots: int = 4,
+        interactive_slots: int = 1,
+        interactive_products: int = 200,
+        account_concurrency: int = 2,
+        account_rate: float = 0.0,
+        account_burst: int = 10,
+        max_queued: int = 100,
+        account_max_queued: int = 20,
+        max_wait: float = 30.0,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        self.slots = slots
+        self.interactive_slots = min(interactive_slots, slots - 1) if slots > 1 else 0
+        self.interactive_products = interactive_products
+        self.account_concurrency = account_concurrency
+        self.account_rate = account_rate
+        self.account_burst = account_burst
+        self.max_queued = max_queued
+        self.account_max_queued = account_max_queued
+        self.max_wait = max_wait
+        self.weights = weights or {}
+        self.rejected: Counter = Counter()
+        self._waiting: List[Ticket] = []
+        self._running: Counter = Counter()  # account -> slots held
+        self._running_bulk = 0
+        self._vtime = 0.0
+        self._last_finish: Dict[str, float] = defaultdict(float)
+        self._tokens: Dict[str, tuple] = {}  # account -> (tokens, monotonic time)
+        self._seq = 0
+        self._avg_seconds = {"interactive": 1.0, "bulk": 10.0}  # EWMA of slot hold time, for Retry-After
+
+    @classmethod
+    def from_env(cls) -> Optional["FairScheduler"]:
+        if os.getenv("FORECAST_SCHED_ENABLED", "1") != "1":
+            return None
+        return cls(
+            slots=int(os.getenv("FORECAST_SCHED_SLOTS", "4")),
+            interactive_slots=int(os.getenv("FORECAST_SCHED_INTERACTIVE_SLOTS", "1")),
+            interactive_products=int(os.getenv("FORECAST_SCHED_INTERACTIVE_PRODUCTS", "200")),
+            account_concurrency=int(os.getenv("FORECAST_SCHED_ACCOUNT_CONCURRENCY", "2")),
+            account_rate=float(os.getenv("FORECAST_SCHED_ACCOUNT_RATE", "0")),  # runs/s, 0 = unlimited
+            account_burst=int(os.getenv("FORECAST_SCHED_ACCOUNT_BURST", "10")),
+            max_queued=int(os.getenv("FORECAST_SCHED_MAX_QUEUED", "100")),
+            account_max_queued=int(os.getenv("FORECAST_SCHED_ACCOUNT_MAX_QUEUED", "20")),
+            max_wait=float(os.getenv("FORECAST_SCHED_MAX_WAIT", "30")),
+            weights=_parse_weights(os.getenv("FORECAST_SCHED_WEIGHTS", "")),
+        )
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    async def acquire(self, account_id: str, products: int, background: bool = False) -> Ticket:
+        """Wait for a slot. ``background`` work (job chunks) is never rejected nor rate limited."""
+        if not background:
+            self._take_token(account_id)
+        ticket = self._ticket(account_id, products)
+        ticket._ready = asyncio.get_running_loop().create_future()
+        self._waiting.append(ticket)
+        self._dispatch()
+        if not ticket._ready.done():
+            if not background and (len(self._waiting) > self.max_queued or self._queued(account_id) > self.account_max_queued):
+                self._waiting.remove(ticket)
+                raise self._reject("queue_full", ticket)
+            SCHED_QUEUED.labels(ticket.priority).inc()
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket._ready), None if background else self.max_wait)
+            except asyncio.TimeoutError:
+                if not ticket._ready.done():
+                    self._waiting.remove(ticket)
+                    raise self._reject("timeout", ticket)
+            except BaseException:
+                if ticket._ready.done():
+                    self.release(ticket)
+                else:
+                    self._waiting.remove(ticket)
+                raise
+            finally:
+                SCHED_QUEUED.labels(ticket.priority).dec()
+        SCHED_WAIT_SECONDS.labels(ticket.priority).observe(ticket.admitted - ticket.submitted)
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        self._running[ticket.account_id] -= 1
+        if not ticket.interactive:
+            self._running_bulk -= 1
+        SCHED_RUNNING.labels(ticket.priority).dec()
+        held = time.monotonic() - (ticket.admitted or ticket.submitted)
+        self._avg_seconds[ticket.priority] += 0.2 * (held - self._avg_seconds[ticket.priority])
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, account_id: str, products: int, background: bool = False) -> AsyncIterator[Ticket]:
+        ticket = await self.acquire(account_id, products, background=background)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _ticket(self, account_id: str, products: int) -> Ticket:
+        self._seq += 1
+        start = max(self._vtime, self._last_finish[account_id])
+        finish = start + max(products, 1) / self.weights.get(account_id, 1.0)
+        self._last_finish[account_id] = finish
+        return Ticket(account_id, products, products <= self.interactive_products, start, finish, self._seq)
+
+    def _take_token(self, account_id: str) -> None:
+        if self.account_rate <= 0:
+            return
+        now = time.monotonic()
+        tokens, last = self._tokens.get(account_id, (float(self.account_burst), now))
+        tokens = min(float(self.account_burst), tokens + (now - last) * self.account_rate)
+        if tokens < 1.0:
+            self._tokens[account_id] = (tokens, now)
+            self.rejected["rate"] += 1
+            SCHED_REJECTED.labels("rate").inc()
+            raise AdmissionRejected("rate", (1.0 - tokens) / self.account_rate)
+        self._tokens[account_id] = (tokens - 1.0, now)
+
+    def _queued(self, account_id: str) -> int:
+        return sum(1 for t in self._waiting if t.account_id == account_id)
+
+    def _eligible(self, ticket: Ticket) -> bool:
+        if self.running >= self.slots or self._running[ticket.account_id] >= self.account_concurrency:
+            return False
+        return ticket.interactive or self._running_bulk < self.slots - self.interactive_slots
+
+    def _dispatch(self) -> None:
+        # Interactive first, then the smallest virtual finish tag among accounts that may run
+        while self._waiting and self.running < self.slots:
+            ready = [t for t in self._waiting if self._eligible(t)]
+            if not ready:
+                return
+            ticket = min(ready, key=lambda t: (not t.interactive, t.finish_tag, t.seq))
+            self._waiting.remove(ticket)
+            self._vtime = max(self._vtime, ticket.start_tag)
+            self._running[ticket.account_id] += 1
+            if not ticket.interactive:
+                self._running_bulk += 1
+            SCHED_RUNNING.labels(ticket.priority).inc()
+            ticket.admitted = time.monotonic()
+            ticket._ready.set_result(None)
+
+    def _reject(self, reason: str, ticket: Ticket) -> AdmissionRejected:
+        if self._last_finish[ticket.account_id] == ticket.finish_tag:
+            self._last_finish[ticket.account_id] = ticket.start_tag  # it never ran: give the account its share back
+        self.rejected[reason] += 1
+        SCHED_REJECTED.labels(reason).inc()
+        ahead = sum(1 for t in self._waiting if (not t.interactive, t.finish_tag) <= (not ticket.interactive, ticket.finish_tag))
+        usable = self.slots if ticket.interactive else max(self.slots - self.interactive_slots, 1)
+        retry = self._avg_seconds[ticket.priority] * (ahead + 1) / usable
+        return AdmissionRejected(reason, float(min(max(math.ceil(retry), 1), 300)))
+
+    def stats(self) -> Dict[str, object]:
+        accounts = set(self._running) | {t.account_id for t in self._waiting}
+        return {
+            "enabled": True,
+            "slots": self.slots,
+            "interactive_slots": self.interactive_slots,
+            "running": self.running,
+            "running_bulk": self._running_bulk,
+            "queued": len(self._waiting),
+            "rejected": dict(self.rejected),
+            "avg_slot_seconds": dict(self._avg_seconds),
+            "accounts": {
+                a: {"running": self._running[a], "queued": self._queued(a), "weight": self.weights.get(a, 1.0)}
+                for a in sorted(accounts) if self._running[a] or self._queued(a)
+            },
+        }
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from datetime import date, datetime
+from typing import Dict, List, Optional
 
 
 class ForecastRunRequest(BaseModel):
@@ -7,6 +8,10 @@ class ForecastRunRequest(BaseModel):
     product_ids: List[str]
     horizon_days: int = Field(30, ge=1, le=90)
     country: Optional[str] = None
+    max_concurrency: Optional[int] = Field(None, ge=1, le=32)
+    incremental: bool = False
+    decay: Optional[float] = Field(None, gt=0, le=1)
+    triage: Optional[bool] = None  # route dead / intermittent series to cheap models (default: FORECAST_TRIAGE)
 
 
 class ForecastProductSummary(BaseModel):
@@ -20,3 +25,66 @@ class ForecastProductSummary(BaseModel):
 class ForecastRunResponse(BaseModel):
     run_id: str
     products: List[ForecastProductSummary]
+
+
+class ForecastJobStatus(BaseModel):
+    run_id: str
+    status: str
+    total: int
+    processed: int
+    progress: float
+    elapsed_seconds: float
+    products_per_second: float
+    error: Optional[str] = None
+    products: List[ForecastProductSummary] = []
+
+
+class ForecastQueueStatus(BaseModel):
+    run_id: str
+    account_id: str
+    country: Optional[str] = None
+    horizon_days: int
+    status: str  # queued | running | completed
+    total: int
+    done: int
+    failed: int
+    leased: int
+    queued: int
+    progress: float
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    elapsed_seconds: float
+    products_per_second: float
+    errors: Dict[str, str] = {}
+
+
+class HistoryRefreshRequest(BaseModel):
+    account_id: str
+    country: Optional[str] = None
+    full: bool = False  # rebuild from the whole window instead of the rows after the watermark
+
+
+class ForecastPredictRequest(BaseModel):
+    account_id: str
+    product_id: str
+    country: str
+    channel: Optional[str] = None
+    horizon_days: int = Field(30, ge=1, le=365)
+    start_date: Optional[date] = None
+
+
+class ForecastPoint(BaseModel):
+    date: date
+    yhat: float
+    p10: float
+    p90: float
+
+
+class ForecastPredictResponse(BaseModel):
+    product_id: str
+    key: str
+    trained_through: date
+    created_at: datetime
+    sigma: float
+    series: List[ForecastPoint]
@@ -0,0 +1,287 @@
+"""Read side of ``forecast_product_daily``: queries, NDJSON / Arrow rendering and the response cache.
+
+Rows are read in primary key order, so an account export pages with a keyset
+cursor on ``(product_code, date)`` (the last key of the previous page) and never
+with OFFSET. Buffered responses (one product, small export pages) get a content
+ETag and are kept in ``ResponseCache``. Every forecast writer NOTIFYs
+``forecast_written`` on commit (see ``app.model``), and ``ResponseCache.listen``
+drops the cached responses of that account as soon as a run writes, whichever
+replica or run_once.py process wrote it. While the listener is down, nothing is
+served from the cache.
+"""
+from __future__ import annotations
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+
+from .db import connection
+from .model import FORECAST_WRITTEN_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+FORECAST_EXPORT_MAX_ROWS = int(os.getenv("FORECAST_EXPORT_MAX_ROWS", "1000000"))  # largest page
+FORECAST_EXPORT_BUFFER_ROWS = int(os.getenv("FORECAST_EXPORT_BUFFER_ROWS", "5000"))  # pages up to this are cached, larger ones streamed
+
+# (product_code, date, country, yhat, p10, p90, run_id)
+Row = Tuple[str, date, Optional[str], float, Optional[float], Optional[float], Optional[str]]
+
+_COLUMNS = "product_code, date, country, yhat::float8, p10::float8, p90::float8, run_id"
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[str, date]]:
+    """``<product_code>|<YYYY-MM-DD>``: the key of the last row already read."""
+    if not cursor:
+        return None
+    product_code, _, day = cursor.rpartition("|")
+    return product_code, date.fromisoformat(day)
+
+
+def format_cursor(row: Row) -> str:
+    return f"{row[0]}|{row[1].isoformat()}"
+
+
+def _filters(country: Optional[str], start: Optional[date], end: Optional[date]) -> Tuple[str, List[object]]:
+    sql, params = "", []
+    if country is not None:
+        sql += " AND country = %s"
+        params.append(country)
+    if start is not None:
+        sql += " AND date >= %s"
+        params.append(start)
+    if end is not None:
+        sql += " AND date <= %s"
+        params.append(end)
+    return sql, params
+
+
+async def load_product_forecast(conn: psycopg.AsyncConnection, account_id: str, product_id: str, country: Optional[str] = None,
+                                start: Optional[date] = None, end: Optional[date] = None) -> List[Row]:
+    where, params = _filters(country, start, end)
+    async with conn.cursor() as cur:
+        await cur.execute(
+            f"SELECT {_COLUMNS} FROM forecast_product_daily WHERE account_id = %s AND product_code = %s{where} ORDER BY date",
+            [account_id, product_id, *params],
+        )
+        return await cur.fetchall()
+
+
+async def iter_forecast_rows(pool: Optional[AsyncConnectionPool], account_id: str, after: Optional[Tuple[str, date]], limit: int,
+                             country: Optional[str] = None, start: Optional[date] = None, end: Optional[date] = None,
+                             chunk_rows: int = 5000) -> AsyncIterator[List[Row]]:
+    """One keyset page of an account's forecasts in primary key order, ``chunk_rows`` at a time.
+
+    Each chunk is its own keyset query on a connection borrowed for that query, so a
+    slow client streaming a large page never holds a pooled connection (or a
+    transaction) between chunks.
+    """
+    where, params = _filters(country, start, end)
+    while limit > 0:
+        sql = f"SELECT {_COLUMNS} FROM forecast_product_daily WHERE account_id = %s"
+        args: List[object] = [account_id]
+        if after is not None:
+            sql += " AND (product_code, date) > (%s, %s)"
+            args += list(after)
+        sql += f"{where} ORDER BY product_code, date LIMIT %s"
+        n = min(chunk_rows, limit)
+        async with connection(pool) as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(sql, [*args, *params, n])
+                rows = await cur.fetchall()
+        if rows:
+            yield rows
+        if len(rows) < n:
+            return
+        after, limit = (rows[-1][0], rows[-1][1]), limit - n
+
+
+def product_document(account_id: str, product_id: str, rows: List[Row]) -> bytes:
+    return json.dumps({
+        "account_id": account_id,
+        "product_id": product_id,
+        "country": rows[0][2] if rows else None,
+        "run_id": rows[0][6] if rows else None,  # the latest run rewrote the series from its first day
+        "series": [{"date": r[1].isoformat(), "yhat": r[3], "p10": r[4], "p90": r[5]} for r in rows],
+    }, separators=(",", ":")).encode()
+
+
+def ndjson_rows(rows: List[Row]) -> str:
+    return "".join(
+        json.dumps({"product_id": r[0], "date": r[1].isoformat(), "country": r[2], "yhat": r[3], "p10": r[4], "p90": r[5], "run_id": r[6]},
+                   separators=(",", ":")) + "\n"
+        for r in rows
+    )
+
+
+def ndjson_trailer(rows: int, last: Optional[Row], more: bool) -> str:
+    # next_cursor is None on the last page (``more``: a row past this page was read)
+    return json.dumps({"type": "page", "rows": rows, "next_cursor": format_cursor(last) if last is not None and more else None},
+                      separators=(",", ":")) + "\n"
+
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ArrowWriter:
+    """Arrow IPC stream of forecast rows, one record batch per ``write`` (needs pyarrow)."""
+
+    def __init__(self):
+        import pyarrow as pa
+
+        self._pa = pa
+        self.schema = pa.schema([
+            ("product_id", pa.string()), ("date", pa.date32()), ("country", pa.string()),
+            ("yhat", pa.float64()), ("p10", pa.float64()), ("p90", pa.float64()), ("run_id", pa.string()),
+        ])
+        self._sink = io.BytesIO()
+        self._writer = pa.ipc.new_stream(self._sink, self.schema)
+
+    def write(self, rows: List[Row]) -> bytes:
+        columns = list(zip(*rows)) if rows else [[] for _ in self.schema]
+        self._writer.write_batch(self._pa.record_batch([self._pa.array(c, type=f.type) for c, f in zip(columns, self.schema)], schema=self.schema))
+        return self._take()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._take()
+
+    def _take(self) -> bytes:
+        # hand out what was written since the last call and reuse the buffer
+        out = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return out
+
+
+def etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return tag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+
+
+# (kind, account_id, anything else identifying the response)
+CacheKey = Tuple[str, str, Tuple]
+# body, media type, ETag, extra headers
+CachedResponse = Tuple[bytes, str, str, Optional[Dict[str, str]]]
+
+
+class ResponseCache:
+    """LRU of rendered read responses (body, media type, ETag, headers) bounded in bytes, invalidated per account."""
+
+    def __init__(self, max_bytes: int = 64 << 20, max_entry_bytes: int = 1 << 20):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.listening = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0  # bumped by clear()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        if os.getenv("FORECAST_READ_CACHE_ENABLED", "1") != "1":
+            return None
+        return cls(
+            max_bytes=int(os.getenv("FORECAST_READ_CACHE_BYTES", str(64 << 20))),
+            max_entry_bytes=int(os.getenv("FORECAST_READ_CACHE_ENTRY_BYTES", str(1 << 20))),
+        )
+
+    def generation(self, account_id: str) -> Tuple[int, int]:
+        """Read before querying and hand to ``put``: a response read across a write is not cached."""
+        return self._epoch, self._generations.get(account_id, 0)
+
+    def get(self, key: CacheKey) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key) if self.listening else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: CacheKey, generation: Tuple[int, int], body: bytes, media_type: str, tag: str, headers: Optional[Dict[str, str]] = None) -> None:
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if not self.listening or (self._epoch, self._generations.get(key[1], 0)) != generation:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (body, media_type, tag, headers)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[0])
+
+    def invalidate(self, account_id: str) -> None:
+        with self._lock:
+            self._generations[account_id] = self._generations.get(account_id, 0) + 1
+            self.invalidations += 1
+            for key in [k for k in self._entries if k[1] == account_id]:
+                self._bytes -= len(self._entries.pop(key)[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    async def listen(self, dsn: str, retry_seconds: float = 5.0) -> None:
+        """Follow ``forecast_written`` notifications for ever (run as a background task)."""
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {FORECAST_WRITTEN_CHANNEL}")
+                    self.listening = True
+                    async for note in conn.notifies():
+                        self.invalidate(json.loads(note.payload)["account_id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("forecast_written listener failed; response cache off, retrying in %.0fs", retry_seconds)
+            finally:
+                # Writes may be missed while disconnected: start from an empty cache
+                self.listening = False
+                self.clear()
+            await asyncio.sleep(retry_seconds)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "enabled": True,
+                "listening": self.listening,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,212 @@
+"""Series triage: route dead and intermittent histories away from the weekday ridge model.
+
+Long-tail catalogs are mostly series without recent sales or with a sale every few
+weeks; a Gaussian weekday fit on those gives a meaningless ``sigma`` band. One
+vectorized pass over the concatenated histories (as ``forecast_batch`` builds
+them) computes, per series, the number of demand days, the first and last sale
+and the mean inter-demand interval (ADI), and classifies it:
+
+- dead: no sale in the ``dead_days`` before ``as_of`` -> constant zero;
+- intermittent: ADI above ``adi`` (1.32, Syntetos-Boylan) -> Croston with the SBA
+  bias correction, fitted for every intermittent series at once. The exponential
+  smoothing of demand sizes and intervals is unrolled into closed-form weights
+  ``alpha (1 - alpha)^r`` on the r-th most recent demand, so it is a weighted
+  bincount, not a loop over days. Bands are the empirical p10/p90 of the last
+  ``band_days`` daily demands;
+- smooth: everything else -> the existing weekday ridge model.
+
+Zero and SBA forecasts are flat from ``as_of + 1`` and carry bias-only
+coefficients, so the model registry serves them like any other model.
+"""
+from __future__ import annotations
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .model import ForecastResult, History, _concat_histories, _weekday_of, forecast_from_stats, weekday_stats
+
+FORECAST_TRIAGE = os.getenv("FORECAST_TRIAGE", "0") == "1"
+FORECAST_TRIAGE_DEAD_DAYS = int(os.getenv("FORECAST_TRIAGE_DEAD_DAYS", "90"))
+FORECAST_TRIAGE_ADI = float(os.getenv("FORECAST_TRIAGE_ADI", "1.32"))
+FORECAST_TRIAGE_ALPHA = float(os.getenv("FORECAST_TRIAGE_ALPHA", "0.1"))
+FORECAST_TRIAGE_BAND_DAYS = int(os.getenv("FORECAST_TRIAGE_BAND_DAYS", "90"))
+
+DEAD, INTERMITTENT, SMOOTH = 0, 1, 2
+CLASSES = ("dead", "intermittent", "smooth")
+
+
+@dataclass
+class TriageReport:
+    """Series per class and seconds spent on each (``classify`` is the triage pass itself)."""
+    counts: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(CLASSES, 0))
+    seconds: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(("classify",) + CLASSES, 0.0))
+
+    def add(self, other: "TriageReport") -> None:
+        for k, v in other.counts.items():
+            self.counts[k] += v
+        for k, v in other.seconds.items():
+            self.seconds[k] += v
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"counts": dict(self.counts), "seconds": dict(self.seconds)}
+
+
+@dataclass(frozen=True)
+class SeriesProfile:
+    """Per-series demand summary of one triage pass (arrays of length N)."""
+    classes: np.ndarray  # DEAD | INTERMITTENT | SMOOTH
+    demand_days: np.ndarray
+    first_sale: np.ndarray  # datetime64[D], NaT without sales
+    last_sale: np.ndarray
+    adi: np.ndarray  # mean days between demands from the first sale to as_of, inf without sales
+
+
+def default_as_of(last_days: np.ndarray) -> np.datetime64:
+    """Yesterday (the loaders' last full day), or the freshest day of the batch if later.
+
+    Histories stop at their last stored row, so how long a series has been dead
+    cannot be read from the series itself.
+    """
+    yesterday = np.datetime64(datetime.utcnow().date() - timedelta(days=1), "D")
+    return max(yesterday, last_days.max()) if len(last_days) else yesterday
+
+
+def classify(days: np.ndarray, y: np.ndarray, series: np.ndarray, n_series: int, as_of: np.datetime64,
+             dead_days: int = FORECAST_TRIAGE_DEAD_DAYS, adi: float = FORECAST_TRIAGE_ADI) -> SeriesProfile:
+    """Classify N concatenated series in one pass.
+
+    ``series`` is each observation's series index; observations are sorted by series
+    then day, as ``_concat_histories`` lays them out. Only days with demand matter,
+    so only the series index of those is gathered.
+    """
+    at = np.flatnonzero(y > 0)  # NaN compares False
+    k = np.bincount(series[at], minlength=n_series)
+    has = k > 0
+    ends = np.cumsum(k)
+    first = np.zeros(n_series, dtype=np.int64)
+    last = np.zeros(n_series, dtype=np.int64)
+    first[has] = days[at[(ends - k)[has]]].astype(np.int64)
+    last[has] = days[at[ends[has] - 1]].astype(np.int64)
+    end = np.datetime64(as_of, "D").astype(np.int64)
+    mean_interval = np.full(n_series, np.inf)
+    mean_interval[has] = (end - first[has] + 1) / k[has]
+    dead = ~has | (end - last >= dead_days)
+    classes = np.where(dead, DEAD, np.where(mean_interval > adi, INTERMITTENT, SMOOTH))
+    nat = np.datetime64("NaT", "D")
+    return SeriesProfile(
+        classes=classes,
+        demand_days=k,
+        first_sale=np.where(has, first.astype("datetime64[D]"), nat),
+        last_sale=np.where(has, last.astype("datetime64[D]"), nat),
+        adi=mean_interval,
+    )
+
+
+def sba_levels(days: np.ndarray, y: np.ndarray, series: np.ndarray, n_series: int, first_interval: np.ndarray,
+               alpha: float = FORECAST_TRIAGE_ALPHA) -> np.ndarray:
+    """Croston-SBA daily demand rate of N concatenated series, each sorted by day.
+
+    Sizes and intervals are smoothed from the first demand (interval ``first_interval``),
+    so the r-th most recent demand weighs ``alpha (1 - alpha)^r`` and the first one
+    what is left; both smoothed values are one weighted bincount.
+    """
+    sold = y > 0  # NaN compares False
+    owner = series[sold]
+    size = y[sold]
+    day = days[sold].astype(np.int64)
+    k = np.bincount(owner, minlength=n_series)
+    rank = np.arange(len(owner)) - (np.cumsum(k) - k)[owner]
+    age = k[owner] - 1 - rank
+    w = np.where(rank == 0, 1.0, alpha) * np.exp(age * np.log1p(-alpha))
+    interval = np.where(rank == 0, first_interval[owner], np.diff(day, prepend=0))
+    z = np.bincount(owner, weights=w * size, minlength=n_series)
+    p = np.bincount(owner, weights=w * interval, minlength=n_series)
+    return (1.0 - alpha / 2.0) * z / np.maximum(p, 1.0)
+
+
+def recent_demand(days: np.ndarray, y: np.ndarray, series: np.ndarray, n_series: int, as_of: np.datetime64,
+                  band_days: int = FORECAST_TRIAGE_BAND_DAYS) -> np.ndarray:
+    """(N, band_days) daily demand up to ``as_of``; days without a positive row count as no demand."""
+    col = days.astype(np.int64) - (np.datetime64(as_of, "D").astype(np.int64) - band_days + 1)
+    inside = (col >= 0) & (col < band_days)
+    window = np.zeros((n_series, band_days))
+    window[series[inside], col[inside]] = np.nan_to_num(y[inside])
+    return window
+
+
+def _subset(series: np.ndarray, keep: np.ndarray, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Observations (among ``rows``) of the series in ``keep`` (bool, N) and their index among the kept series."""
+    rows = keep[series] if rows is None else keep[series] & rows
+    return rows, (np.cumsum(keep) - 1)[series[rows]]
+
+
+def forecast_triaged(
+    histories: List[History],
+    horizon: int = 30,
+    as_of: Optional[np.datetime64] = None,
+    dead_days: int = FORECAST_TRIAGE_DEAD_DAYS,
+    adi: float = FORECAST_TRIAGE_ADI,
+    alpha: float = FORECAST_TRIAGE_ALPHA,
+    band_days: int = FORECAST_TRIAGE_BAND_DAYS,
+) -> Tuple[List[ForecastResult], TriageReport]:
+    """``forecast_batch`` with dead and intermittent series routed to constant-zero and SBA forecasts."""
+    report = TriageReport()
+    if not histories:
+        return [], report
+    t = time.perf_counter()
+    days, y, series, last_days = _concat_histories(histories)
+    as_of = default_as_of(last_days) if as_of is None else np.datetime64(as_of, "D")
+    profile = classify(days, y, series, len(histories), as_of, dead_days=dead_days, adi=adi)
+    results: List[Optional[ForecastResult]] = [None] * len(histories)
+    future = as_of + 1 + np.arange(horizon)
+    future.flags.writeable = False  # shared by every zero and SBA result
+    now = time.perf_counter()
+    report.seconds["classify"] = now - t
+    t = now
+
+    dead = np.flatnonzero(profile.classes == DEAD)
+    if len(dead):
+        zeros = np.zeros(horizon)
+        zeros.flags.writeable = False
+        coef = np.zeros(8)
+        coef.flags.writeable = False
+        for i in dead:
+            results[i] = ForecastResult(days=future, yhat=zeros, p10=zeros, p90=zeros, sigma=0.0, coef=coef, method="zero")
+    now = time.perf_counter()
+    report.counts["dead"], report.seconds["dead"] = len(dead), now - t
+    t = now
+
+    keep = profile.classes == INTERMITTENT
+    idx = np.flatnonzero(keep)
+    if len(idx):
+        # SBA and the empirical bands only need the demand days
+        rows, local = _subset(series, keep, y > 0)
+        level = sba_levels(days[rows], y[rows], local, len(idx), profile.adi[idx], alpha=alpha)
+        window = recent_demand(days[rows], y[rows], local, len(idx), as_of, band_days=band_days)
+        lo, hi = np.quantile(window, [0.1, 0.9], axis=1)
+        sigma = window.std(axis=1)
+        yhat = np.repeat(level[:, None], horizon, axis=1)
+        p10 = np.repeat(np.minimum(lo, level)[:, None], horizon, axis=1)
+        p90 = np.repeat(np.maximum(hi, level)[:, None], horizon, axis=1)
+        coef = np.zeros((len(idx), 8))
+        coef[:, 0] = level
+        for j, i in enumerate(idx):
+            results[i] = ForecastResult(days=future, yhat=yhat[j], p10=p10[j], p90=p90[j], sigma=float(sigma[j]), coef=coef[j], method="sba")
+    now = time.perf_counter()
+    report.counts["intermittent"], report.seconds["intermittent"] = len(idx), now - t
+    t = now
+
+    keep = profile.classes == SMOOTH
+    idx = np.flatnonzero(keep)
+    if len(idx):
+        # an all-smooth batch fits from the concatenated arrays as they are
+        rows, local = (slice(None), series) if len(idx) == len(histories) else _subset(series, keep)
+        stats = weekday_stats(y[rows], _weekday_of(days[rows]), local, n_series=len(idx))
+        for i, res in zip(idx, forecast_from_stats(stats, last_days[idx], horizon)):
+            results[i] = res
+    report.counts["smooth"], report.seconds["smooth"] = len(idx), time.perf_counter() - t
+    return results, report  # type: ignore[return-value]
@@ -0,0 +1,407 @@
+"""Postgres work queue of forecast tasks shared by every service replica and run_once.py worker.
+
+A queued run is one ``forecast_queue_runs`` row plus one ``forecast_queue_tasks`` row
+per product. Any number of workers, in any number of processes or hosts, claim
+batches of queued tasks with ``FOR UPDATE SKIP LOCKED`` (concurrent claims never
+wait on nor return the same rows) and hold them under a lease:
+
+- the lease is extended by a heartbeat while the worker is alive, for at most
+  ``max_runtime_seconds`` after the claim: a wedged runner stops being covered;
+- a lease that expires (crashed or wedged worker) is put back in the queue by the
+  next claim, or failed once the task used ``max_attempts`` attempts;
+- a worker only completes tasks it still owns, so a task reclaimed from a slow
+  worker is counted once (its forecast rows are upserts, rewriting them is harmless);
+- ``forecast_queue_runs.done/failed`` are bumped in the same transaction as the
+  tasks, and the run turns ``completed`` when every product is accounted for.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import socket
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+
+from .cache import ForecastCache
+from .db import connection, open_connection
+from .history_cube import HistoryCube
+from .metrics import track_run
+from .model import ForecastResult
+from .pipeline import _error_text, iter_pipeline
+from .schemas import ForecastRunRequest
+
+FORECAST_QUEUE_LEASE = float(os.getenv("FORECAST_QUEUE_LEASE", "60"))  # seconds, extended every lease / 3
+FORECAST_QUEUE_CLAIM = int(os.getenv("FORECAST_QUEUE_CLAIM", "200"))  # tasks claimed at once per worker
+FORECAST_QUEUE_MAX_ATTEMPTS = int(os.getenv("FORECAST_QUEUE_MAX_ATTEMPTS", "3"))
+FORECAST_QUEUE_POLL = float(os.getenv("FORECAST_QUEUE_POLL", "1.0"))  # idle wait between empty claims
+FORECAST_QUEUE_WORKERS = int(os.getenv("FORECAST_QUEUE_WORKERS", "0"))  # queue workers per service process
+FORECAST_QUEUE_MAX_RUNTIME = float(os.getenv("FORECAST_QUEUE_MAX_RUNTIME", "1800"))  # seconds a lease is kept alive
+
+
+@dataclass(frozen=True)
+class Lease:
+    """Tasks of one run claimed together by a worker."""
+    run_id: str
+    account_id: str
+    country: Optional[str]
+    horizon_days: int
+    incremental: bool
+    decay: Optional[float]
+    triage: Optional[bool]
+    product_ids: List[str]
+
+
+# lease -> {product_id: error} for the products that failed (empty when all were written)
+LeaseRunner = Callable[[Lease], Awaitable[Dict[str, str]]]
+
+_REAP = """
+WITH expired AS (
+  SELECT task_id FROM forecast_queue_tasks
+  WHERE status = 'leased' AND lease_expires_at < now()
+  FOR UPDATE SKIP LOCKED
+)
+UPDATE forecast_queue_tasks t
+SET status = CASE WHEN t.attempts >= %(max_attempts)s THEN 'failed' ELSE 'queued' END,
+    error = 'lease expired', lease_owner = NULL, lease_expires_at = NULL, updated_at = now()
+FROM expired
+WHERE t.task_id = expired.task_id
+RETURNING t.run_id, t.status
+"""
+
+_CLAIM = """
+WITH picked AS (
+  SELECT task_id FROM forecast_queue_tasks
+  WHERE status = 'queued'
+  ORDER BY task_id
+  LIMIT %(limit)s
+  FOR UPDATE SKIP LOCKED
+)
+UPDATE forecast_queue_tasks t
+SET status = 'leased', attempts = t.attempts + 1, lease_owner = %(owner)s,
+    lease_expires_at = now() + make_interval(secs => %(lease)s), updated_at = now()
+FROM picked
+WHERE t.task_id = picked.task_id
+RETURNING t.task_id, t.run_id, t.product_code
+"""
+
+_BUMP_RUN = """
+UPDATE forecast_queue_runs
+SET done = done + %(done)s, failed = failed + %(failed)s,
+    status = CASE WHEN done + failed + %(done)s + %(failed)s >= total THEN 'completed' ELSE status END,
+    finished_at = CASE WHEN done + failed + %(done)s + %(failed)s >= total THEN now() ELSE finished_at END
+WHERE run_id = %(run_id)s
+"""
+
+
+class WorkQueue:
+    """Queue operations of one worker identity (``worker_id`` owns the leases it claims)."""
+
+    def __init__(
+        self,
+        lease_seconds: float = FORECAST_QUEUE_LEASE,
+        claim_size: int = FORECAST_QUEUE_CLAIM,
+        max_attempts: int = FORECAST_QUEUE_MAX_ATTEMPTS,
+        worker_id: Optional[str] = None,
+        max_runtime_seconds: float = FORECAST_QUEUE_MAX_RUNTIME,
+    ):
+        self.lease_seconds = lease_seconds
+        self.claim_size = claim_size
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.max_runtime_seconds = max_runtime_seconds
+        self.counts: Counter = Counter()  # claimed, done, failed, retried, reclaimed, lost, abandoned
+        self._live: Dict[Tuple[str, str], Tuple[int, float]] = {}  # (run_id, product) -> (task_id, claimed at)
+
+    async def enqueue(self, conn: psycopg.AsyncConnection, request: ForecastRunRequest, run_id: Optional[str] = None) -> str:
+        run_id = run_id or str(uuid.uuid4())
+        product_ids = list(dict.fromkeys(request.product_ids))
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    INSERT INTO forecast_queue_runs(run_id, account_id, country, horizon_days, incremental, decay, triage, total)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    (run_id, request.account_id, request.country, request.horizon_days, request.incremental, request.decay, request.triage, len(product_ids)),
+                )
+                await cur.execute(
+                    "INSERT INTO forecast_queue_tasks(run_id, account_id, product_code) SELECT %s, %s, p FROM unnest(%s::text[]) WITH ORDINALITY AS u(p, i) ORDER BY i",
+                    (run_id, request.account_id, product_ids),
+                )
+                if not product_ids:
+                    await cur.execute(_BUMP_RUN, {"done": 0, "failed": 0, "run_id": run_id})
+        return run_id
+
+    async def claim(self, conn: psycopg.AsyncConnection) -> List[Lease]:
+        """Reap expired leases, then lease up to ``claim_size`` queued tasks, grouped by run."""
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(_REAP, {"max_attempts": self.max_attempts})
+                reaped = await cur.fetchall()
+                for run_id, n in Counter(r[0] for r in reaped if r[1] == "failed").items():
+                    await cur.execute(_BUMP_RUN, {"done": 0, "failed": n, "run_id": run_id})
+                self.counts["reclaimed"] += len(reaped)
+
+                await cur.execute(_CLAIM, {"limit": self.claim_size, "owner": self.worker_id, "lease": self.lease_seconds})
+                tasks = sorted(await cur.fetchall())
+                if not tasks:
+                    return []
+                run_ids = sorted({t[1] for t in tasks})
+                await cur.execute(
+                    "UPDATE forecast_queue_runs SET status = 'running', started_at = now() WHERE run_id = ANY(%s) AND status = 'queued'",
+                    (run_ids,),
+                )
+                await cur.execute(
+                    "SELECT run_id, account_id, country, horizon_days, incremental, decay, triage FROM forecast_queue_runs WHERE run_id = ANY(%s)",
+                    (run_ids,),
+                )
+                runs = {r[0]: r for r in await cur.fetchall()}
+        self.counts["claimed"] += len(tasks)
+        now = time.monotonic()
+        self._live.update(((t[1], t[2]), (t[0], now)) for t in tasks)
+        leases = []
+        for run_id in dict.fromkeys(t[1] for t in tasks):  # runs in queue order
+            _, account_id, country, horizon, incremental, decay, triage = runs[run_id]
+            pids = [t[2] for t in tasks if t[1] == run_id]
+            leases.append(Lease(run_id, account_id, country, horizon, incremental, decay, triage, pids))
+        return leases
+
+    async def heartbeat(self, conn: psycopg.AsyncConnection) -> int:
+        """Extend the leases this worker is still running; returns how many tasks it holds.
+
+        Only tasks claimed less than ``max_runtime_seconds`` ago and not completed yet
+        are extended. Older ones are dropped from the live set and left to expire, so a
+        wedged runner cannot hold its tasks forever; they are reclaimed like those of a
+        crashed worker.
+        """
+        cutoff = time.monotonic() - self.max_runtime_seconds
+        stale = [key for key, (_, claimed_at) in self._live.items() if claimed_at < cutoff]
+        for key in stale:
+            del self._live[key]
+        self.counts["abandoned"] += len(stale)
+        task_ids = [task_id for task_id, _ in self._live.values()]
+        if not task_ids:
+            return 0
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    UPDATE forecast_queue_tasks SET lease_expires_at = now() + make_interval(secs => %s)
+                    WHERE task_id = ANY(%s) AND lease_owner = %s AND status = 'leased'
+                    """,
+                    (self.lease_seconds, task_ids, self.worker_id),
+                )
+                return cur.rowcount
+
+    async def complete(self, conn: psycopg.AsyncConnection, lease: Lease, errors: Optional[Dict[str, str]] = None) -> None:
+        """Mark the lease's products done, except ``errors`` which are retried until ``max_attempts``."""
+        errors = errors or {}
+        for pid in lease.product_ids:
+            self._live.pop((lease.run_id, pid), None)
+        ok = [p for p in lease.product_ids if p not in errors]
+        failed_ids = [p for p in lease.product_ids if p in errors]
+        async with conn.transaction():
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    """
+                    UPDATE forecast_queue_tasks
+                    SET status = 'done', error = NULL, lease_owner = NULL, lease_expires_at = NULL, updated_at = now()
+                    WHERE run_id = %s AND product_code = ANY(%s) AND status = 'leased' AND lease_owner = %s
+                    """,
+                    (lease.run_id, ok, self.worker_id),
+                )
+                done = cur.rowcount
+                statuses: List[str] = []
+                if failed_ids:
+                    await cur.execute(
+                        """
+                        UPDATE forecast_queue_tasks t
+                        SET status = CASE WHEN t.attempts >= %(max_attempts)s THEN 'failed' ELSE 'queued' END,
+                            error = e.error, lease_owner = NULL, lease_expires_at = NULL, updated_at = now()
+                        FROM unnest(%(pids)s::text[], %(errors)s::text[]) AS e(product_code, error)
+                        WHERE t.run_id = %(run_id)s AND t.product_code = e.product_code
+                          AND t.status = 'leased' AND t.lease_owner = %(owner)s
+                        RETURNING t.status
+                        """,
+                        {
+                            "max_attempts": self.max_attempts,
+                            "pids": failed_ids,
+                            "errors": [errors[p] for p in failed_ids],
+                            "run_id": lease.run_id,
+                            "owner": self.worker_id,
+                        },
+                    )
+                    statuses = [r[0] for r in await cur.fetchall()]
+                failed = statuses.count("failed")
+                if done or failed:
+                    await cur.execute(_BUMP_RUN, {"done": done, "failed": failed, "run_id": lease.run_id})
+        self.counts["done"] += done
+        self.counts["failed"] += failed
+        self.counts["retried"] += statuses.count("queued")
+        # Leases that expired and were reclaimed by another worker before we finished
+        self.counts["lost"] += len(lease.product_ids) - done - len(statuses)
+
+    async def status(self, conn: psycopg.AsyncConnection, run_id: str, max_errors: int = 20) -> Optional[Dict[str, object]]:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT r.account_id, r.country, r.horizon_days, r.status, r.total, r.done, r.failed,
+                       (SELECT count(*) FROM forecast_queue_tasks t WHERE t.run_id = r.run_id AND t.status = 'leased'),
+                       r.created_at, r.started_at, r.finished_at,
+                       extract(epoch FROM coalesce(r.finished_at, now()) - r.started_at)
+                FROM forecast_queue_runs r WHERE r.run_id = %s
+                """,
+                (run_id,),
+            )
+            row = await cur.fetchone()
+            if row is None:
+                return None
+            await cur.execute(
+                "SELECT product_code, error FROM forecast_queue_tasks WHERE run_id = %s AND status = 'failed' ORDER BY task_id LIMIT %s",
+                (run_id, max_errors),
+            )
+            failures = dict(await cur.fetchall())
+        account_id, country, horizon, status, total, done, failed, leased, created, started, finished, seconds = row
+        seconds = float(seconds or 0.0)
+        return {
+            "run_id": run_id,
+            "account_id": account_id,
+            "country": country,
+            "horizon_days": horizon,
+            "status": status,
+            "total": total,
+            "done": done,
+            "failed": failed,
+            "leased": leased,
+            "queued": total - done - failed - leased,
+            "progress": (done + failed) / total if total else 1.0,
+            "created_at": created,
+            "started_at": started,
+            "finished_at": finished,
+            "elapsed_seconds": seconds,
+            "products_per_second": done / seconds if seconds > 0 else 0.0,
+            "errors": failures,
+        }
+
+    async def stats(self, conn: psycopg.AsyncConnection) -> Dict[str, object]:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT status, count(*) FROM forecast_queue_tasks WHERE status IN ('queued', 'leased') GROUP BY status")
+            backlog = dict(await cur.fetchall())
+        return {
+            "enabled": True,
+            "worker_id": self.worker_id,
+            "lease_seconds": self.lease_seconds,
+            "claim_size": self.claim_size,
+            "max_attempts": self.max_attempts,
+            "queued": backlog.get("queued", 0),
+            "leased": backlog.get("leased", 0),
+            "max_runtime_seconds": self.max_runtime_seconds,
+            "live": len(self._live),
+            **{k: self.counts[k] for k in ("claimed", "done", "failed", "retried", "reclaimed", "lost", "abandoned")},
+        }
+
+
+class QueueWorkers:
+    """Background asyncio workers draining the shared queue, plus the heartbeat of their leases.
+
+    The workers of one process share a ``WorkQueue`` (one lease owner): a single
+    heartbeat, on a connection outside the pool, keeps all their leases alive, and
+    they all expire together if the process dies.
+    """
+
+    def __init__(self, queue: WorkQueue, runner: LeaseRunner, pool: Optional[AsyncConnectionPool] = None, workers: int = 1, poll_seconds: float = FORECAST_QUEUE_POLL):
+        self.queue = queue
+        self.runner = runner
+        self.pool = pool
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work(drain=False)) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def drain(self) -> None:
+        """Run the workers until a claim comes back empty (run_once.py worker mode)."""
+        beat = asyncio.create_task(self._heartbeat())
+        try:
+            await asyncio.gather(*(self._work(drain=True) for _ in range(self.workers)))
+        finally:
+            beat.cancel()
+            await asyncio.gather(beat, return_exceptions=True)
+
+    async def _heartbeat(self) -> None:
+        # its own connection: a beat never waits behind runs for a pooled one
+        conn: Optional[psycopg.AsyncConnection] = None
+        try:
+            while True:
+                await asyncio.sleep(self.queue.lease_seconds / 3)
+                try:
+                    if conn is None or conn.closed:
+                        conn = await open_connection(self.pool)
+                    await self.queue.heartbeat(conn)
+                except Exception:
+                    # the next beat reconnects and retries; the lease only lapses after lease_seconds
+                    if conn is not None:
+                        await conn.close()
+                        conn = None
+        finally:
+            if conn is not None:
+                await conn.close()
+
+    async def _work(self, drain: bool) -> None:
+        while True:
+            try:
+                async with connection(self.pool) as conn:
+                    leases = await self.queue.claim(conn)
+                for lease in leases:
+                    try:
+                        errors = await self.runner(lease)
+                    except Exception as e:
+                        errors = {pid: _error_text(e) for pid in lease.product_ids}
+                    async with connection(self.pool) as conn:
+                        await self.queue.complete(conn, lease, errors)
+            except Exception:
+                # Queue unreachable: what we hold is reclaimed once the leases expire
+                if drain:
+                    raise
+                leases = []
+            if not leases:
+                if drain:
+                    return
+                await asyncio.sleep(self.poll_seconds)
+
+
+async def forecast_lease(
+    lease: Lease,
+    pool: Optional[AsyncConnectionPool] = None,
+    executor: Optional[Executor] = None,
+    cache: Optional[ForecastCache] = None,
+    history: Optional[HistoryCube] = None,
+    publish: Optional[Callable[[Lease, List[str], List[ForecastResult]], Awaitable[None]]] = None,
+) -> Dict[str, str]:
+    """Default ``LeaseRunner``: the leased products through ``iter_pipeline``, one failing batch or product at a time."""
+    errors: Dict[str, str] = {}
+    with track_run(lease.run_id, "queue", len(lease.product_ids)) as trace:
+        async for out in iter_pipeline(
+            pool, lease.account_id, lease.product_ids, lease.country, lease.horizon_days, lease.run_id,
+            executor=executor, cache=cache, incremental=lease.incremental, decay=lease.decay,
+            trace=trace, isolate_errors=True, history=history, triage=lease.triage,
+        ):
+            errors.update(out.errors)
+            if publish is not None:
+                written = [(pid, res) for pid, res in zip(out.product_ids, out.results) if res is not None]
+                await publish(lease, [p for p, _ in written], [r for _, r in written])
+    return errors
@@ -0,0 +1,82 @@
+"""Synthetic sales catalog for benchmarks: reproducible daily histories per SKU."""
+from __future__ import annotations
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class CatalogSpec:
+    skus: int = 200
+    days: int = 730
+    sparsity: float = 0.3  # share of days without any sale (rows missing from sales_daily)
+    seasonality: float = 0.4  # relative weekly amplitude
+    level: float = 8.0  # mean units per selling day
+    end: Optional[str] = None  # last day of history, default yesterday (inside the loaders' window)
+    seed: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class Catalog:
+    spec: CatalogSpec
+    product_ids: list
+    days: np.ndarray  # (days,) datetime64[D]
+    units: np.ndarray  # (skus, days) float, 0 on days without sales
+    price: np.ndarray  # (skus, days)
+    stock: np.ndarray  # (skus, days)
+
+    def service_frame(self, i: int) -> pd.DataFrame:
+        """`load_sales_daily` shape: rows only on selling days."""
+        sold = self.units[i] > 0
+        return pd.DataFrame({"date": pd.DatetimeIndex(self.days[sold]), "units_sold": self.units[i, sold]})
+
+    def service_series(self, i: int):
+        """`load_sales_daily_many` shape: a gap-filled DailySeries over the whole window."""
+        from app.model import DailySeries
+
+        return DailySeries(self.days[0], self.units[i])
+
+    def trainer_frame(self, i: int) -> pd.DataFrame:
+        """`train.load_from_csv` shape: date, sales, price, stock, sparse like the raw feed."""
+        sold = self.units[i] > 0
+        return pd.DataFrame({
+            "date": pd.DatetimeIndex(self.days[sold]),
+            "sales": self.units[i, sold],
+            "price": self.price[i, sold],
+            "stock": self.stock[i, sold],
+        })
+
+    def sales_daily_rows(self, account_id: str, country: str) -> Iterator[Tuple]:
+        """(date, account_id, product_code, country, units_sold, revenue) rows for COPY into sales_daily."""
+        dates = self.days.astype(object)
+        for i, pid in enumerate(self.product_ids):
+            for j in np.flatnonzero(self.units[i] > 0):
+                yield dates[j], account_id, pid, country, float(self.units[i, j]), float(self.units[i, j] * self.price[i, j])
+
+
+def generate(spec: CatalogSpec) -> Catalog:
+    rng = np.random.default_rng(spec.seed)
+    end = np.datetime64(spec.end, "D") if spec.end else np.datetime64("today", "D") - 1
+    days = np.arange(end - spec.days + 1, end + 1)
+    weekday = (days.astype(np.int64) + 3) % 7
+    profile = 1.0 + spec.seasonality * np.sin(2 * np.pi * (weekday[None, :] + rng.uniform(0, 7, (spec.skus, 1))) / 7)
+    level = spec.level * rng.lognormal(0.0, 0.5, (spec.skus, 1))
+    trend = 1.0 + rng.normal(0, 0.2, (spec.skus, 1)) * np.linspace(0, 1, spec.days)[None, :]
+    units = rng.poisson(np.clip(level * profile * trend, 0.1, None)).astype(float)
+    units[rng.random(units.shape) < spec.sparsity] = 0.0
+    price = np.round(rng.uniform(5, 50, (spec.skus, 1)) * (1 + rng.normal(0, 0.05, units.shape)), 2)
+    stock = rng.integers(0, 500, units.shape).astype(float)
+    return Catalog(spec, [f"SKU{i:06d}" for i in range(spec.skus)], days, units, price, stock)
+
+
+def service_frames(catalog: Catalog) -> Dict[str, pd.DataFrame]:
+    return {pid: catalog.service_frame(i) for i, pid in enumerate(catalog.product_ids)}
+
+
+def service_series(catalog: Catalog) -> dict:
+    return {pid: catalog.service_series(i) for i, pid in enumerate(catalog.product_ids)}
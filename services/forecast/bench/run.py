@@ -0,0 +1,362 @@
+"""Benchmark suite for the forecasting hot paths, with JSON baselines and a regression check.
+
+Run from services/forecast:
+
+    python -m bench.run --skus 200 --days 730 --out bench/results/latest.json
+    python -m bench.run --pgserver --baseline bench/baselines/local.json      # + DB and /forecast/run
+    python -m bench.run --dsn postgresql://... --save-baseline bench/baselines/local.json
+
+CPU benchmarks always run. DB benchmarks (loaders, writers, end-to-end /forecast/run)
+need a disposable Postgres: ``--dsn`` (tables are created in a throwaway schema that
+is dropped afterwards) or ``--pgserver`` (a temporary cluster, requires ``pgserver``).
+Trainer benchmarks import forecasting/train.py from the repository checkout.
+
+With ``--baseline``, every benchmark whose median is more than ``--threshold`` slower
+than the baseline (and by more than ``--min-delta-ms``) is reported as a regression
+and the exit code is 1.
+
+``bench/baselines/local.json`` is the committed reference (default catalog, CPU and
+DB benchmarks, ``meta`` records the commit and machine). It was produced with
+
+    PYTHONPATH=.:../.. python -m bench.run --dsn postgresql://postgres:@/postgres?host=/tmp/pgdata \\
+        --save-baseline bench/baselines/local.json
+
+against a local scratch Postgres 16; re-record it with the same command (your own
+``--dsn`` or ``--pgserver``) on the machine you compare on, since timings only
+compare against a baseline from the same hardware.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .catalog import Catalog, CatalogSpec, generate, service_frames, service_series
+
+SCHEMA = "bench_forecast"
+ACCOUNT = "bench-acc"
+COUNTRY = "FR"
+FORECASTING_DIR = Path(__file__).resolve().parents[3] / "forecasting"
+
+
+def measure(fn: Callable[[], object], repeat: int = 5, warmup: int = 1, items: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    ms = np.array(times)
+    return {
+        "median_ms": float(np.median(ms)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "min_ms": float(ms.min()),
+        "repeat": repeat,
+        "items": items,
+        "per_item_ms": float(np.median(ms)) / max(items, 1),
+    }
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], threshold: float = 0.2, min_delta_ms: float = 0.5) -> List[dict]:
+    """Median vs baseline per benchmark; status is regression / faster / ok / new."""
+    rows = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append({"name": name, "current_ms": cur["median_ms"], "baseline_ms": None, "ratio": None, "status": "new"})
+            continue
+        ratio = cur["median_ms"] / base["median_ms"] if base["median_ms"] > 0 else float("inf")
+        delta = cur["median_ms"] - base["median_ms"]
+        if ratio > 1 + threshold and delta > min_delta_ms:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold) and -delta > min_delta_ms:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append({"name": name, "current_ms": cur["median_ms"], "baseline_ms": base["median_ms"], "ratio": ratio, "status": status})
+    return rows
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# --- CPU benchmarks ---
+def bench_service_cpu(catalog: Catalog, repeat: int) -> Dict[str, dict]:
+    from app.model import forecast_batch, simple_forecast
+    from app.triage import forecast_triaged
+
+    frames = service_frames(catalog)
+    one = next(iter(frames.values()))
+    dfs = list(frames.values())
+    series = list(service_series(catalog).values())
+    return {
+        "simple_forecast": measure(lambda: simple_forecast(one, horizon=30), repeat),
+        "forecast_batch": measure(lambda: forecast_batch(dfs, horizon=30), repeat, items=len(dfs)),
+        # the service path: loaders return DailySeries, not frames
+        "simple_forecast_series": measure(lambda: simple_forecast(series[0], horizon=30), repeat),
+        "forecast_batch_series": measure(lambda: forecast_batch(series, horizon=30), repeat, items=len(series)),
+        "forecast_triaged_series": measure(lambda: forecast_triaged(series, horizon=30), repeat, items=len(series)),
+    }
+
+
+def _import_trainer():
+    if not (FORECASTING_DIR / "train.py").exists():
+        return None
+    if str(FORECASTING_DIR) not in sys.path:
+        sys.path.insert(0, str(FORECASTING_DIR))
+    import train  # script-style module, imports its siblings by name
+
+    return train
+
+
+def bench_trainer_cpu(catalog: Catalog, repeat: int) -> Dict[str, dict]:
+    import warnings
+
+    train = _import_trainer()
+    if train is None:
+        print(f"skip trainer benchmarks: {FORECASTING_DIR / 'train.py'} not found")
+        return {}
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    cfg = train.TrainConfig(country=COUNTRY, horizon=30)
+    raw = catalog.trainer_frame(0)
+    daily = train.add_holiday_dummy(train.ensure_daily_index(raw.copy(), cfg.date_col, cfg.target_col), cfg.date_col, cfg.country)
+    return {
+        "ensure_daily_index": measure(lambda: train.ensure_daily_index(raw.copy(), cfg.date_col, cfg.target_col), repeat),
+        "rolling_backtest_linear": measure(lambda: train.rolling_backtest_linear(daily, cfg, splits=3, horizon=14), repeat),
+        "train_and_forecast": measure(lambda: train.train_and_forecast(raw.copy(), cfg), repeat),
+    }
+
+
+# --- DB benchmarks ---
+@contextlib.contextmanager
+def disposable_postgres(dsn: Optional[str], use_pgserver: bool) -> Iterator[Optional[str]]:
+    """Yield a base DSN for a scratch database, or None when no Postgres is available."""
+    if dsn:
+        yield dsn
+    elif use_pgserver:
+        import pgserver  # optional: pip install pgserver
+
+        with tempfile.TemporaryDirectory(prefix="bench-pg-") as tmp:
+            server = pgserver.get_server(tmp, cleanup_mode="stop")
+            try:
+                yield server.get_uri()
+            finally:
+                server.cleanup()
+    else:
+        yield None
+
+
+def _schema_dsn(dsn: str) -> str:
+    from psycopg.conninfo import make_conninfo
+
+    return make_conninfo(dsn, options=f"-c search_path={SCHEMA}")
+
+
+def seed_service_tables(dsn: str, catalog: Catalog) -> int:
+    import psycopg
+
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        # Same columns and keys as db/migrations, without the account/product foreign keys
+        conn.execute(f"""
+            CREATE TABLE {SCHEMA}.sales_daily (
+              date DATE NOT NULL, account_id TEXT NOT NULL, product_code TEXT NOT NULL, country TEXT,
+              units_sold NUMERIC NOT NULL DEFAULT 0, revenue NUMERIC NOT NULL DEFAULT 0,
+              PRIMARY KEY (account_id, product_code, date))""")
+        conn.execute(f"""
+            CREATE TABLE {SCHEMA}.forecast_product_daily (
+              date DATE NOT NULL, account_id TEXT NOT NULL, product_code TEXT NOT NULL, country TEXT,
+              yhat NUMERIC NOT NULL, p10 NUMERIC, p90 NUMERIC, run_id TEXT,
+              created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+              PRIMARY KEY (account_id, product_code, date))""")
+        rows = 0
+        with conn.cursor() as cur:
+            with cur.copy(f"COPY {SCHEMA}.sales_daily (date, account_id, product_code, country, units_sold, revenue) FROM STDIN") as copy:
+                for row in catalog.sales_daily_rows(ACCOUNT, COUNTRY):
+                    copy.write_row(row)
+                    rows += 1
+        conn.execute(f"ANALYZE {SCHEMA}.sales_daily")
+    return rows
+
+
+def drop_schema(dsn: str) -> None:
+    import psycopg
+
+    with psycopg.connect(dsn, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+
+def bench_service_db(dsn: str, catalog: Catalog, repeat: int) -> Dict[str, dict]:
+    import psycopg
+    from app.model import forecast_batch, load_sales_daily, load_sales_daily_many, write_forecast, write_forecasts_bulk
+
+    pids = catalog.product_ids
+    results = forecast_batch(list(service_frames(catalog).values()), horizon=30)
+    loop = asyncio.new_event_loop()
+    conn = loop.run_until_complete(psycopg.AsyncConnection.connect(_schema_dsn(dsn)))
+    run = loop.run_until_complete
+    try:
+        async def write_one():
+            await write_forecast(conn, ACCOUNT, pids[0], COUNTRY, results[0], "bench")
+
+        out = {
+            "load_sales_daily": measure(lambda: run(load_sales_daily(conn, ACCOUNT, pids[0], COUNTRY)), repeat),
+            "load_sales_daily_many": measure(lambda: run(load_sales_daily_many(conn, ACCOUNT, pids, COUNTRY)), repeat, items=len(pids)),
+            "write_forecast": measure(lambda: run(write_one()), repeat),
+            "write_forecasts_bulk": measure(lambda: run(write_forecasts_bulk(conn, ACCOUNT, COUNTRY, zip(pids, results), "bench")), repeat, items=len(pids)),
+        }
+    finally:
+        run(conn.close())
+        loop.close()
+    return out
+
+
+def bench_trainer_db(dsn: str, catalog: Catalog, repeat: int) -> Dict[str, dict]:
+    train = _import_trainer()
+    try:
+        import psycopg2  # type: ignore
+    except ImportError:
+        train = None
+    if train is None:
+        print("skip trainer loader benchmark: forecasting/train.py or psycopg2 not available")
+        return {}
+    import bench_loader  # forecasting/bench_loader.py: seeds internal_sales in its own schema
+
+    conn = psycopg2.connect(dsn, options=f"-c search_path={bench_loader.SCHEMA},public -c timezone=UTC")
+    end = str(catalog.days[-1])
+    start = str(catalog.days[0])
+    try:
+        bench_loader.seed(conn, products=1, days=len(catalog.days), per_day=5, end=end)
+        cfg = train.TrainConfig(product_id=1, country="FR", channel="AMAZON", dsn=dsn, start_date=start, end_date=end)
+        return {"load_from_db_columnar": measure(lambda: train.load_from_db_columnar(cfg, conn=conn), repeat)}
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"drop schema if exists {bench_loader.SCHEMA} cascade")
+        conn.commit()
+        conn.close()
+
+
+def bench_end_to_end(dsn: str, catalog: Catalog, repeat: int) -> Dict[str, dict]:
+    from fastapi.testclient import TestClient
+
+    overrides = {"DATABASE_URL": _schema_dsn(dsn), "FORECAST_CACHE_ENABLED": "0", "FORECAST_MODEL_STORE": ""}
+    saved = {k: os.environ.get(k) for k in overrides}
+    os.environ.update(overrides)
+    try:
+        from app.main import app
+
+        body = {"account_id": ACCOUNT, "product_ids": catalog.product_ids, "horizon_days": 30, "country": COUNTRY}
+
+        def post():
+            r = client.post("/forecast/run", json=body)
+            r.raise_for_status()
+
+        with TestClient(app) as client:
+            return {"forecast_run": measure(post, repeat, items=len(catalog.product_ids))}
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def run_suite(spec: CatalogSpec, repeat: int, dsn: Optional[str], use_pgserver: bool, only: Optional[List[str]] = None) -> dict:
+    catalog = generate(spec)
+    results: Dict[str, dict] = {}
+    results.update(bench_service_cpu(catalog, repeat))
+    results.update(bench_trainer_cpu(catalog, repeat))
+    with disposable_postgres(dsn, use_pgserver) as base:
+        if base is None:
+            print("skip DB benchmarks: pass --dsn or --pgserver")
+        else:
+            seeded = seed_service_tables(base, catalog)
+            try:
+                results.update(bench_service_db(base, catalog, repeat))
+                results.update(bench_trainer_db(base, catalog, repeat))
+                results.update(bench_end_to_end(base, catalog, repeat))
+            finally:
+                drop_schema(base)
+            print(f"seeded {seeded} sales_daily rows")
+    if only:
+        results = {k: v for k, v in results.items() if k in only}
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "catalog": spec.as_dict(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Forecasting benchmark suite")
+    ap.add_argument("--skus", type=int, default=200)
+    ap.add_argument("--days", type=int, default=730)
+    ap.add_argument("--sparsity", type=float, default=0.3)
+    ap.add_argument("--seasonality", type=float, default=0.4)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--only", type=str, help="comma separated benchmark names")
+    ap.add_argument("--dsn", type=str, default=os.getenv("BENCH_DATABASE_URL"), help="scratch Postgres (a throwaway schema is used)")
+    ap.add_argument("--pgserver", action="store_true", help="start a temporary local Postgres with pgserver")
+    ap.add_argument("--out", type=str, help="write the results JSON here")
+    ap.add_argument("--baseline", type=str, help="compare against this results JSON")
+    ap.add_argument("--save-baseline", type=str, help="also write the results as a new baseline")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown of the median")
+    ap.add_argument("--min-delta-ms", type=float, default=0.5, help="ignore absolute differences below this")
+    args = ap.parse_args(argv)
+
+    spec = CatalogSpec(skus=args.skus, days=args.days, sparsity=args.sparsity, seasonality=args.seasonality, seed=args.seed)
+    only = [s.strip() for s in args.only.split(",")] if args.only else None
+    report = run_suite(spec, args.repeat, args.dsn, args.pgserver, only)
+
+    out = io.StringIO()
+    for name, r in report["results"].items():
+        out.write(f"{name:26s} median {r['median_ms']:10.3f} ms   p95 {r['p95_ms']:10.3f} ms   per item {r['per_item_ms']:9.4f} ms\n")
+    print(out.getvalue(), end="")
+    for path in filter(None, [args.out, args.save_baseline]):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    if not args.baseline:
+        return 0
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    if baseline["meta"].get("catalog") != report["meta"]["catalog"]:
+        print("warning: baseline was recorded with a different catalog spec")
+    rows = compare(report["results"], baseline["results"], args.threshold, args.min_delta_ms)
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}x" if row["ratio"] is not None else "-"
+        print(f"{row['status']:10s} {row['name']:26s} {ratio:>8s}")
+    regressions = [r for r in rows if r["status"] == "regression"]
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,10 @@
 import os
 import sys
 
-# Ensure the project root (this directory) is on sys.path so `import app.*` works
+# Ensure the project root (this directory) is on sys.path so `import app.*` works,
+# and the repository root for the modules shared with the trainer (`import forecasting.*`)
 ROOT = os.path.abspath(os.path.dirname(__file__))
-if ROOT not in sys.path:
-    sys.path.insert(0, ROOT)
+REPO_ROOT = os.path.abspath(os.path.join(ROOT, "..", ".."))
+for path in (REPO_ROOT, ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
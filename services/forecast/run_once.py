@@ -1,22 +1,58 @@
 import asyncio
+import functools
 import sys
 import os
 import uuid
-from app.model import load_sales_daily, simple_forecast, write_forecast, get_dsn
+from app.history_cube import HistoryCube
+from app.model import load_sales_daily_many, forecast_batch, write_forecasts_bulk, get_dsn
+from app.schemas import ForecastRunRequest
+from app.triage import FORECAST_TRIAGE, forecast_triaged
+from app.work_queue import QueueWorkers, WorkQueue, forecast_lease
 import psycopg
 
+async def work_queue():
+    # Claim queued tasks until none are left; start as many of these processes as there are cores
+    queue = WorkQueue()
+    runner = functools.partial(forecast_lease, history=HistoryCube.from_env())
+    workers = QueueWorkers(queue, runner, workers=int(os.getenv('QUEUE_CONCURRENCY', '1')))
+    await workers.drain()
+    print('Worker', queue.worker_id, dict(queue.counts))
+
+
 async def main():
+    if os.getenv('QUEUE_WORKER') == '1':
+        return await work_queue()
     dsn = get_dsn()
     account_id = os.getenv('ACCOUNT_ID', 'acc-1')
-    product_id = os.getenv('PRODUCT_ID', 'SKU1')
-    country = os.getenv('COUNTRY', 'FR')
+    # PRODUCT_IDS (comma separated) runs a whole batch; PRODUCT_ID kept for single SKU runs;
+    # PRODUCT_IDS_FILE (one per line) for shards too large for the environment
+    if os.getenv('PRODUCT_IDS_FILE'):
+        with open(os.environ['PRODUCT_IDS_FILE'], encoding='utf-8') as f:
+            product_ids = [line.strip() for line in f if line.strip()]
+    else:
+        product_ids = [p.strip() for p in os.getenv('PRODUCT_IDS', os.getenv('PRODUCT_ID', 'SKU1')).split(',') if p.strip()]
+    country = os.getenv('COUNTRY', 'FR') or None  # empty: every country
+    horizon = int(os.getenv('HORIZON_DAYS', '7'))
     run_id = str(uuid.uuid4())
+    if os.getenv('ENQUEUE') == '1':
+        # Leave the run to the queue workers (service replicas or QUEUE_WORKER=1 processes)
+        request = ForecastRunRequest(account_id=account_id, product_ids=product_ids, country=country, horizon_days=horizon)
+        async with await psycopg.AsyncConnection.connect(dsn) as conn:
+            await WorkQueue().enqueue(conn, request, run_id)
+        print('Queued', len(product_ids), 'products as run_id', run_id)
+        return
     async with await psycopg.AsyncConnection.connect(dsn) as conn:
-        df = await load_sales_daily(conn, account_id, product_id, country)
-        print('Loaded rows:', len(df))
-        res = simple_forecast(df, horizon=7)
-        await write_forecast(conn, account_id, product_id, country, res, run_id)
-        print('Wrote forecast for run_id', run_id)
+        histories = await load_sales_daily_many(conn, account_id, product_ids, country)
+        print('Loaded rows:', sum(len(histories[pid]) for pid in product_ids))
+        series = [histories[pid] for pid in product_ids]
+        if FORECAST_TRIAGE:
+            # FORECAST_TRIAGE=1: dead and intermittent SKUs skip the weekday model
+            results, report = forecast_triaged(series, horizon=horizon)
+            print('Triage:', report.to_dict())
+        else:
+            results = forecast_batch(series, horizon=horizon)
+        written = await write_forecasts_bulk(conn, account_id, country, zip(product_ids, results), run_id)
+        print('Wrote', written, 'forecast rows for run_id', run_id)
 
 if __name__ == '__main__':
     if sys.platform.startswith('win'):
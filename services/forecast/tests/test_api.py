@@ -8,3 +8,12 @@ def test_sample_endpoint():
     assert r.status_code == 200
     data = r.json()
     assert 'series' in data
+
+
+def test_pool_endpoint_without_database(monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.delenv('ANALYTICS_DATABASE_URL', raising=False)
+    with TestClient(app) as client:
+        r = client.get('/internal/pool')
+    assert r.status_code == 200
+    assert r.json() == {'enabled': False}
@@ -0,0 +1,28 @@
+import numpy as np
+
+from bench.catalog import CatalogSpec, generate
+from bench.run import compare, measure
+
+
+def test_catalog_is_reproducible_and_sparse():
+    spec = CatalogSpec(skus=20, days=100, sparsity=0.5, seed=7)
+    a, b = generate(spec), generate(spec)
+    assert np.array_equal(a.units, b.units)
+    assert a.units.shape == (20, 100)
+    assert 0.4 < (a.units == 0).mean() < 0.7
+    frame = a.service_frame(3)
+    assert len(frame) == int((a.units[3] > 0).sum())
+    assert len(list(a.sales_daily_rows('acc', 'FR'))) == int((a.units > 0).sum())
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    base = {'a': {'median_ms': 10.0}, 'b': {'median_ms': 10.0}, 'c': {'median_ms': 0.1}, 'd': {'median_ms': 10.0}}
+    cur = {'a': {'median_ms': 13.0}, 'b': {'median_ms': 5.0}, 'c': {'median_ms': 0.3}, 'd': {'median_ms': 11.0}, 'e': {'median_ms': 1.0}}
+    status = {r['name']: r['status'] for r in compare(cur, base, threshold=0.2, min_delta_ms=0.5)}
+    # c tripled but stays under the absolute noise floor
+    assert status == {'a': 'regression', 'b': 'faster', 'c': 'ok', 'd': 'ok', 'e': 'new'}
+
+
+def test_measure_reports_per_item_time():
+    r = measure(lambda: None, repeat=3, items=10)
+    assert r['repeat'] == 3 and r['per_item_ms'] == r['median_ms'] / 10
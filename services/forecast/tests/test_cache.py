@@ -0,0 +1,49 @@
+from datetime import date
+
+import pandas as pd
+
+from app.cache import ForecastCache, SeriesFingerprint
+from app.model import simple_forecast
+
+
+def _result():
+    dates = pd.date_range('2025-01-01', periods=30, freq='D')
+    return simple_forecast(pd.DataFrame({'date': dates, 'units_sold': [2.0] * 30}), horizon=7)
+
+
+def _fp(rows=30, checksum=60.0):
+    return SeriesFingerprint(date(2024, 1, 1), date(2025, 1, 30), rows, checksum, 0.0)
+
+
+def test_cache_hits_only_on_same_fingerprint_and_evicts_lru():
+    cache = ForecastCache(max_entries=2)
+    res = _result()
+    cache.put(('acc', 'A', 'FR', 7), _fp(), res)
+    assert cache.get(('acc', 'A', 'FR', 7), _fp()) is res
+    assert cache.get(('acc', 'A', 'FR', 7), _fp(rows=31, checksum=61.0)) is None
+    cache.put(('acc', 'A', 'FR', 7), _fp(), res)
+    cache.put(('acc', 'B', 'FR', 7), _fp(), res)
+    cache.get(('acc', 'A', 'FR', 7), _fp())
+    cache.put(('acc', 'C', 'FR', 7), _fp(), res)
+    assert cache.get(('acc', 'B', 'FR', 7), _fp()) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['size']) == (2, 2, 1, 2)
+
+
+def test_cache_ttl_and_disk_backend(tmp_path):
+    path = str(tmp_path / 'forecast-cache')
+    ForecastCache(path=path).put(('acc', 'A', None, 7), _fp(), _result())
+    warm = ForecastCache(path=path)
+    hit = warm.get(('acc', 'A', None, 7), _fp())
+    assert hit is not None and len(hit.yhat) == 7
+    assert ForecastCache(path=path, ttl_seconds=-1).get(('acc', 'A', None, 7), _fp()) is None
+
+
+def test_disk_backend_is_shared_and_read_in_bulk(tmp_path):
+    path = str(tmp_path / 'forecast-cache.sqlite')
+    writer, reader = ForecastCache(path=path), ForecastCache(path=path)  # e.g. two worker processes
+    res = _result()
+    writer.put_many([(('acc', sku, 'FR', 7), _fp(), res) for sku in ('A', 'B', 'C')])
+    hits = reader.get_many([(('acc', sku, 'FR', 7), _fp()) for sku in ('A', 'X', 'C')] + [(('acc', 'B', 'FR', 7), _fp(rows=2))])
+    assert [h is not None for h in hits] == [True, False, True, False]
+    assert reader.blocking and (reader.stats()['hits'], reader.stats()['misses']) == (2, 2)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from forecasting.calendar_cache import calendar_block, calendar_features
+from app.model import _weekday_of
+
+
+def test_calendar_features_match_direct_encoding():
+    days = np.datetime64('2025-12-20') + np.arange(30).reshape(3, 10)
+    design, weekday, holiday = calendar_features('FR', days)
+    assert design.shape == (3, 10, 8)
+    assert np.array_equal(weekday, _weekday_of(days))
+    onehot = np.zeros((3, 10, 8))
+    onehot[..., 0] = 1.0  # bias, then Monday..Sunday
+    np.put_along_axis(onehot, _weekday_of(days)[..., None] + 1, 1.0, axis=-1)
+    assert np.array_equal(design, onehot)
+    flagged = set(days[holiday == 1.0].astype(str))
+    assert flagged == {'2025-12-25', '2026-01-01'}
+
+
+def test_calendar_block_is_shared_and_read_only():
+    a = calendar_block('fr', '2025-03-01', '2025-04-01')
+    b = calendar_block('FR', '2025-01-01', '2025-12-31')
+    assert a is b
+    assert not a.design.flags.writeable
+    design, _, _ = a.window('2025-06-02', 7)  # a Monday
+    assert np.array_equal(design[:, 1:], np.eye(7))
@@ -0,0 +1,90 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+import numpy as np
+
+from app.history_cube import HistoryCube
+from app.model import _split_daily
+
+
+class _FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql, params):
+        if 'advisory' in sql:
+            self.result = [(not self.conn.locked,)]
+        else:
+            since = date.fromisoformat(params['since'])
+            self.conn.reads.append(since)
+            self.result = [r for r in self.conn.rows if r[1] >= since]
+
+    async def fetchone(self):
+        return self.result[0]
+
+    async def fetchall(self):
+        return list(self.result)
+
+
+class _FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = []
+        self.locked = False
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+def _rows(today, skus=('SKU1', 'SKU2'), days=60):
+    # SKU2 sells every other day; zero rows are kept apart from missing ones
+    return [(sku, today - timedelta(days=i), float((i * (k + 2)) % 5)) for k, sku in enumerate(skus) for i in range(0, days, 1 + k)]
+
+
+def _assert_same(cube, rows, pids):
+    got = cube.series_many('acc-1', pids, 'FR')
+    ref = _split_daily(rows, pids)
+    for pid in pids:
+        assert got[pid].start == ref[pid].start and np.array_equal(got[pid].units, ref[pid].units), pid
+
+
+def test_cube_matches_loader_and_refreshes_incrementally(tmp_path):
+    today = date.today()
+    conn = _FakeConn(_rows(today - timedelta(days=1)))
+    cube = HistoryCube(str(tmp_path), poll_seconds=0, overlap_days=3)
+    assert cube.series_many('acc-1', ['SKU1'], 'FR') is None  # nothing built yet: callers read Postgres
+
+    first = asyncio.run(cube.refresh(conn, 'acc-1', 'FR'))
+    assert first['mode'] == 'full' and first['skus'] == 2
+    _assert_same(cube, conn.rows, ['SKU1', 'SKU2', 'SKU3'])
+
+    # the ETL restates yesterday, removes a row inside the overlap, adds today and a new product
+    conn.rows = [r for r in conn.rows if r != ('SKU2', today - timedelta(days=1), 0.0)]
+    conn.rows = [(s, d, u + 10 if d == today - timedelta(days=1) else u) for s, d, u in conn.rows]
+    conn.rows += [('SKU1', today, 4.0), ('SKU3', today, 2.0)]
+    second = asyncio.run(cube.refresh(conn, 'acc-1', 'FR'))
+    assert second['mode'] == 'incremental' and conn.reads[-1] == today - timedelta(days=3)
+    assert second['rows_read'] < first['rows_read']
+    _assert_same(cube, conn.rows, ['SKU1', 'SKU2', 'SKU3'])
+    assert len(list(tmp_path.glob('*/units-*.npy'))) == 2  # current + previous generation
+
+
+def test_cube_stale_or_busy(tmp_path):
+    conn = _FakeConn(_rows(date.today()))
+    cube = HistoryCube(str(tmp_path), poll_seconds=0, max_age_seconds=0)
+    asyncio.run(cube.refresh(conn, 'acc-1', 'FR'))
+    assert cube.series('acc-1', 'SKU1', 'FR') is None and cube.fallbacks == 1
+    conn.locked = True
+    assert asyncio.run(cube.refresh(conn, 'acc-1', 'FR')) == {'status': 'busy'}
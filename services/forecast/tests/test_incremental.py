@@ -0,0 +1,96 @@
+import asyncio
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import psycopg
+import pytest
+from psycopg.conninfo import make_conninfo
+
+from app.incremental import close_day, forecast_states, load_states, save_states, state_from_history, update_states
+from app.model import simple_forecast
+
+MIGRATION = Path(__file__).resolve().parents[3] / 'db' / 'migrations' / '202610181200_add_forecast_model_state.sql'
+
+
+@pytest.fixture
+def dsn():
+    base = os.getenv('DATABASE_URL')
+    if not base:
+        pytest.skip('DATABASE_URL not set')
+    schema = f'state_test_{uuid.uuid4().hex[:8]}'
+    with psycopg.connect(base, autocommit=True) as conn:
+        conn.execute(f'CREATE SCHEMA {schema}')
+        conn.execute(f'SET search_path TO {schema}')
+        conn.execute('CREATE TABLE account(id TEXT PRIMARY KEY)')
+        conn.execute('CREATE TABLE product(account_id TEXT, product_code TEXT, PRIMARY KEY (account_id, product_code))')
+        conn.execute("INSERT INTO account VALUES ('acc-1'); INSERT INTO product VALUES ('acc-1', 'SKU1')")
+        conn.execute(MIGRATION.read_text(encoding='utf-8').replace('public.', '').replace("'public'", 'current_schema()'))
+    try:
+        yield make_conninfo(base, options=f'-csearch_path={schema}')
+    finally:
+        with psycopg.connect(base, autocommit=True) as conn:
+            conn.execute(f'DROP SCHEMA {schema} CASCADE')
+
+
+def _history(n, start='2025-01-01', seed=3):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'date': pd.date_range(start, periods=n, freq='D'), 'units_sold': rng.poisson(6, n).astype(float)})
+
+
+def _tail(df, after):
+    part = df[df['date'] > after]
+    part = part[part['units_sold'] > 0]  # sparse rows: zero days are gap-filled by the update
+    return np.asarray(part['date'].values, dtype='datetime64[D]'), part['units_sold'].to_numpy()
+
+
+def test_incremental_update_matches_full_refit():
+    full = _history(120)
+    head = full.iloc[:100]
+    state = state_from_history(head)
+    [updated] = update_states([state], [_tail(full, head['date'].max())])
+    [inc] = forecast_states([updated], horizon=14)
+    ref = simple_forecast(full, horizon=14)
+    assert inc.dates == ref.dates
+    assert np.allclose(inc.yhat, ref.yhat) and np.isclose(inc.sigma, ref.sigma)
+
+
+def test_incremental_update_without_new_rows_and_with_forgetting():
+    full = _history(90)
+    head = full.iloc[:60]
+    [same] = update_states([state_from_history(head)], [(np.array([], dtype='datetime64[D]'), np.array([]))])
+    assert same.watermark == head['date'].max().date()
+    [inc] = update_states([state_from_history(head, decay=0.98)], [_tail(full, head['date'].max())])
+    ref = state_from_history(full, decay=0.98)
+    assert np.allclose(inc.stats.counts, ref.stats.counts) and np.allclose(inc.stats.sumsq, ref.stats.sumsq)
+
+
+def test_closed_state_rereads_a_partial_last_day():
+    full = _history(120)
+    partial = full.iloc[:100].copy()
+    partial.loc[99, 'units_sold'] = 1.0  # the hourly ETL has only loaded part of day 100 so far
+    for decay in (1.0, 0.98):
+        closed = close_day(state_from_history(partial, decay), 1.0)
+        assert closed.watermark == partial['date'].iloc[98].date()
+        [updated] = update_states([closed], [_tail(full, partial['date'].iloc[98])])
+        ref = state_from_history(full, decay)
+        assert np.allclose(updated.stats.counts, ref.stats.counts) and np.allclose(updated.stats.sums, ref.stats.sums)
+        assert np.allclose(updated.stats.sumsq, ref.stats.sumsq)
+
+
+def test_states_are_kept_per_country(dsn):
+    de, every = state_from_history(_history(60, seed=1)), state_from_history(_history(90, seed=2))
+
+    async def scenario():
+        async with await psycopg.AsyncConnection.connect(dsn) as conn:
+            await save_states(conn, 'acc-1', 'DE', {'SKU1': de}, 'run-de')
+            await save_states(conn, 'acc-1', None, {'SKU1': every}, 'run-all')
+            await save_states(conn, 'acc-1', None, {'SKU1': every}, 'run-all-2')  # upserted, not duplicated
+            return [await load_states(conn, 'acc-1', ['SKU1'], c) for c in ('FR', 'DE', None)]
+
+    fr, got_de, got_all = asyncio.run(scenario())
+    assert fr == {}
+    assert got_de['SKU1'].watermark == de.watermark and np.allclose(got_de['SKU1'].stats.sums, de.stats.sums)
+    assert got_all['SKU1'].watermark == every.watermark and np.allclose(got_all['SKU1'].stats.sums, every.stats.sums)
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.jobs import JobManager
+from app.schemas import ForecastProductSummary, ForecastRunRequest
+
+
+def test_job_cancel_and_resume_processes_every_product_once():
+    seen = []
+
+    async def runner(job, chunk):
+        await asyncio.sleep(0.01)
+        seen.extend(chunk)
+        return [ForecastProductSummary(product_id=p, horizon_days=7, mean=1.0, p10=0.0, p90=2.0) for p in chunk]
+
+    async def scenario():
+        jobs = JobManager(runner, chunk_size=2, workers=1)
+        jobs.start()
+        job = jobs.submit(ForecastRunRequest(account_id='acc-1', product_ids=[f'SKU{i}' for i in range(7)], horizon_days=7))
+        while job.processed < 2:
+            await asyncio.sleep(0.001)
+        jobs.cancel(job.run_id)
+        while job.status != 'cancelled':
+            await asyncio.sleep(0.001)
+        partial = job.to_status()
+        jobs.resume(job.run_id)
+        while job.status != 'completed':
+            await asyncio.sleep(0.001)
+        await jobs.stop()
+        return partial, job.to_status(offset=5)
+
+    partial, final = asyncio.run(scenario())
+    assert 2 <= partial.processed < 7 and partial.progress < 1.0
+    assert final.processed == 7 and final.progress == 1.0
+    assert [p.product_id for p in final.products] == ['SKU5', 'SKU6']
+    assert final.products_per_second > 0
+    assert seen == [f'SKU{i}' for i in range(7)]
+
+
+def test_finished_jobs_are_evicted_by_count_and_ttl():
+    async def runner(job, chunk):
+        return []
+
+    async def scenario():
+        jobs = JobManager(runner, workers=1, ttl=60, keep=2)
+        jobs.start()
+        done = [jobs.submit(ForecastRunRequest(account_id='acc-1', product_ids=['SKU1'], horizon_days=7)) for _ in range(4)]
+        while any(j.status != 'completed' for j in done):
+            await asyncio.sleep(0.001)
+        by_count = set(jobs.jobs)
+        jobs.ttl = 0
+        queued = jobs.cancel(jobs.submit(ForecastRunRequest(account_id='acc-1', product_ids=['SKU1'], horizon_days=7)).run_id)
+        await jobs.stop()
+        return done, by_count, queued, jobs
+
+    done, by_count, queued, jobs = asyncio.run(scenario())
+    assert by_count == {done[2].run_id, done[3].run_id}
+    assert jobs.evict() == 1 and not jobs.jobs
+    with pytest.raises(KeyError):
+        jobs.get(queued.run_id)
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.main import app
+
+
+def _sample(name, labels=None):
+    return metrics.REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def test_track_run_records_stages_and_outcome():
+    before = _sample('forecast_db_seconds_total', {'stage': 'load'})
+    with metrics.track_run('run-ok', 'run', 3) as trace:
+        with trace.stage('load', batch=0, products=3):
+            time.sleep(0.002)
+        with trace.stage('fit', batch=0, products=3):
+            pass
+        trace.add_fit_cpu(0.003, 3)
+    assert metrics.find_trace('run-ok') is trace
+    d = trace.to_dict()
+    assert d['outcome'] == 'ok' and [s['name'] for s in d['spans']] == ['load', 'fit']
+    assert d['db_seconds'] >= 0.002 and d['fit_cpu_seconds'] == pytest.approx(0.003)
+    assert _sample('forecast_db_seconds_total', {'stage': 'load'}) - before >= 0.002
+
+
+def test_failed_run_counts_products_as_failed():
+    before = _sample('forecast_products_total', {'outcome': 'failed'})
+    with pytest.raises(RuntimeError):
+        with metrics.track_run('run-bad', 'run', 4):
+            raise RuntimeError('boom')
+    assert metrics.find_trace('run-bad').error == 'boom'
+    assert _sample('forecast_products_total', {'outcome': 'failed'}) - before == 4
+    assert _sample('forecast_runs_total', {'mode': 'run', 'outcome': 'error'}) >= 1
+
+
+def test_slow_runs_are_profiled(monkeypatch):
+    seen = []
+    monkeypatch.setattr(metrics, 'FORECAST_PROFILE_SLOW_SECONDS', 0.01)
+    monkeypatch.setattr(metrics, 'SLOW_RUN_HOOKS', [seen.append])
+    with metrics.track_run('run-slow', 'run', 1):
+        end = time.perf_counter() + 0.05
+        while time.perf_counter() < end:
+            pass
+    assert seen and seen[0].run_id == 'run-slow'
+    assert seen[0].profile and any('test_slow_runs_are_profiled' in stack for stack, _ in seen[0].profile)
+
+
+def test_concurrent_runs_share_one_sampler(monkeypatch):
+    import threading
+
+    seen = []
+    monkeypatch.setattr(metrics, 'FORECAST_PROFILE_SLOW_SECONDS', 0.01)
+    monkeypatch.setattr(metrics, 'SLOW_RUN_HOOKS', [seen.append])
+    with metrics.track_run('run-outer', 'run', 1), metrics.track_run('run-inner', 'run', 1):
+        end = time.perf_counter() + 0.05
+        while time.perf_counter() < end:
+            pass
+    assert sorted(t.run_id for t in seen) == ['run-inner', 'run-outer'] and all(t.profile for t in seen)
+    assert sum(t.name == 'forecast-profiler' for t in threading.enumerate()) == 1
+
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    with metrics.track_run('run-endpoint', 'run', 1):
+        pass
+    with TestClient(app) as client:
+        r = client.get('/metrics')
+        trace = client.get('/internal/traces/run-endpoint')
+    assert r.status_code == 200 and r.headers['content-type'].startswith('text/plain')
+    assert 'forecast_runs_total{mode="run",outcome="ok"}' in r.text
+    assert trace.json()['run_id'] == 'run-endpoint'
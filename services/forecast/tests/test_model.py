@@ -10,3 +10,127 @@ def test_simple_forecast_shapes():
     assert len(res.yhat) == 10
     assert len(res.p10) == 10
     assert len(res.p90) == 10
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self.params = params
+
+    def fetchall(self):
+        pids = self.params.get("product_ids") or [self.params["product_id"]]
+        return [r for r in self.rows if r[0] in pids]
+
+    def __iter__(self):
+        return iter([r[1:] for r in self.fetchall()])
+
+
+class _FakeConn:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return _FakeCursor(self.rows)
+
+
+def test_bulk_loader_matches_per_sku():
+    import numpy as np
+    from datetime import date, timedelta
+    from app.model import load_sales_daily_sync, load_sales_daily_many_sync
+
+    start = date.today() - timedelta(days=90)
+    rows = []
+    for k, sku in enumerate(['SKU2', 'SKU1']):
+        for i in range(0, 80, 1 + k):  # SKU1 has gaps
+            rows.append((sku, start + timedelta(days=i + k), float((i * (k + 3)) % 7)))
+    conn = _FakeConn(rows)
+    bulk = load_sales_daily_many_sync(conn, 'acc-1', ['SKU1', 'SKU2', 'SKU3'])
+    for sku in ['SKU1', 'SKU2', 'SKU3']:
+        single = load_sales_daily_sync(conn, 'acc-1', sku)
+        pd.testing.assert_frame_equal(bulk[sku], single)
+        a, b = simple_forecast(bulk[sku], horizon=7), simple_forecast(single, horizon=7)
+        assert np.array_equal(a.yhat, b.yhat) and a.sigma == b.sigma
+
+
+def _onehot(weekday):
+    import numpy as np
+    X = np.zeros((len(weekday), 8))
+    X[:, 0] = 1.0
+    X[np.arange(len(weekday)), weekday + 1] = 1.0
+    return X
+
+
+def _ridge_fit(weekday, y, l2=1e-3):
+    # reference: bias + weekday one-hot design, normal equations solved directly
+    import numpy as np
+    X = _onehot(weekday)
+    coef = np.linalg.solve(X.T @ X + l2 * np.eye(8), X.T @ y)
+    return coef, float((y - X @ coef).std())
+
+
+def test_forecast_batch_matches_single_series():
+    import numpy as np
+    from app.model import forecast_batch
+
+    frames = [
+        pd.DataFrame({'date': pd.date_range(start, periods=n, freq='D'), 'units_sold': [float((i * k) % 9) for i in range(n)]})
+        for k, (start, n) in enumerate([('2025-01-01', 60), ('2025-02-10', 14), ('2024-12-30', 200)], start=2)
+    ]
+    batch = forecast_batch(frames, horizon=10)
+    for df, res in zip(frames, batch):
+        # reference: one explicit design-matrix ridge fit per series
+        days = np.asarray(df['date'].values, dtype='datetime64[D]')
+        coef, sigma = _ridge_fit((days.astype(np.int64) + 3) % 7, df['units_sold'].to_numpy())
+        future = days[-1] + 1 + np.arange(10)
+        yhat = _onehot((future.astype(np.int64) + 3) % 7) @ coef
+        assert np.array_equal(res.days, future)
+        assert np.allclose(res.yhat, yhat) and np.isclose(res.sigma, sigma)
+        assert np.allclose(res.p10, yhat - 1.2816 * sigma) and np.allclose(res.p90, yhat + 1.2816 * sigma)
+
+
+def test_weekday_stats_fit_matches_design_matrix_fit():
+    import numpy as np
+    from app.model import weekday_stats, fit_weekday_stats
+
+    rng = np.random.default_rng(7)
+    weekday = np.arange(3, 3 + 150) % 7
+    y = rng.poisson(5, 150).astype(float) + 3 * (weekday == 5)
+    coef_ref, sigma_ref = _ridge_fit(weekday, y)
+    coef, sigma = fit_weekday_stats(weekday_stats(y, weekday))
+    assert np.allclose(coef[0], coef_ref)
+    assert np.isclose(sigma[0], sigma_ref)
+
+
+def test_bulk_writer_chunks_rows_by_size_and_repeated_products():
+    from app.model import _row_chunks
+
+    dates = pd.date_range('2025-01-01', periods=60, freq='D')
+    res = simple_forecast(pd.DataFrame({'date': dates, 'units_sold': [1.0] * 60}), horizon=5)
+    items = [('A', res), ('B', res), ('C', res), ('C', res)]
+    chunks = list(_row_chunks('acc-1', 'FR', items, 'run-1', chunk_rows=10))
+    assert [len(c) for c in chunks] == [10, 5, 5]
+    assert {r[2] for r in chunks[1]} == {'C'} and {r[2] for r in chunks[2]} == {'C'}
+    assert chunks[0][0][1:4] == ('acc-1', 'A', 'FR') and chunks[0][0][-1] == 'run-1'
+
+
+def test_daily_series_matches_frame_path():
+    import numpy as np
+    from app.model import DailySeries, _split_daily, forecast_batch
+
+    rows = [('A', date_, float(i % 4)) for i, date_ in enumerate(pd.date_range('2025-01-01', periods=40, freq='2D').date)]
+    series = _split_daily(rows, ['A'])['A']
+    assert isinstance(series, DailySeries) and len(series) == 79
+    frame = series.to_frame()
+    assert frame['date'].iloc[0] == pd.Timestamp('2025-01-01') and frame['units_sold'].sum() == sum(r[2] for r in rows)
+    a, b = forecast_batch([series], horizon=7)[0], simple_forecast(frame, horizon=7)
+    assert a.dates == b.dates and a.days.dtype == np.dtype('datetime64[D]')
+    assert np.allclose(a.yhat, b.yhat)
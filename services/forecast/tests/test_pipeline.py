@@ -0,0 +1,271 @@
+import asyncio
+import random
+from contextlib import asynccontextmanager
+
+import pandas as pd
+import pytest
+
+from app import pipeline
+
+
+def test_pipeline_keeps_product_order_and_bounds_concurrency(monkeypatch):
+    active = {'now': 0, 'max': 0}
+    written = []
+
+    @asynccontextmanager
+    async def fake_connection(pool):
+        yield object()
+
+    async def fake_load(conn, account_id, pids, country):
+        active['now'] += 1
+        active['max'] = max(active['max'], active['now'])
+        await asyncio.sleep(random.random() / 100)
+        active['now'] -= 1
+        dates = pd.date_range('2025-01-01', periods=28, freq='D')
+        return {pid: pd.DataFrame({'date': dates, 'units_sold': [float(int(pid[3:]))] * 28}) for pid in pids}
+
+    async def fake_write(conn, account_id, country, items, run_id):
+        written.extend(pid for pid, _ in items)
+
+    monkeypatch.setattr(pipeline, 'connection', fake_connection)
+    monkeypatch.setattr(pipeline, 'load_sales_daily_many', fake_load)
+    monkeypatch.setattr(pipeline, 'write_forecasts_bulk', fake_write)
+
+    pids = [f'SKU{i}' for i in range(23)]
+    results = asyncio.run(pipeline.run_pipeline(None, 'acc-1', pids, 'FR', 5, 'run-1', max_concurrency=2, batch_size=4))
+    assert [round(float(r.yhat.mean())) for r in results] == list(range(23))
+    assert sorted(written) == sorted(pids)
+    assert active['max'] <= 2
+
+
+def test_pipeline_bounds_batches_held_for_a_slow_writer(monkeypatch):
+    seen = {'loaded': 0, 'written': 0, 'held': 0}
+
+    @asynccontextmanager
+    async def fake_connection(pool):
+        yield object()
+
+    async def fake_load(conn, account_id, pids, country):
+        seen['loaded'] += 1
+        seen['held'] = max(seen['held'], seen['loaded'] - seen['written'])
+        dates = pd.date_range('2025-01-01', periods=28, freq='D')
+        return {pid: pd.DataFrame({'date': dates, 'units_sold': [1.0] * 28}) for pid in pids}
+
+    async def slow_write(conn, account_id, country, items, run_id):
+        await asyncio.sleep(0.005)
+        seen['written'] += 1
+
+    monkeypatch.setattr(pipeline, 'connection', fake_connection)
+    monkeypatch.setattr(pipeline, 'load_sales_daily_many', fake_load)
+    monkeypatch.setattr(pipeline, 'write_forecasts_bulk', slow_write)
+
+    pids = [f'SKU{i}' for i in range(40)]
+    results = asyncio.run(pipeline.run_pipeline(None, 'acc-1', pids, 'FR', 5, 'run-1', max_concurrency=3, batch_size=1))
+    assert len(results) == 40 and seen['written'] == 40
+    assert seen['held'] <= 3
+
+
+def test_pipeline_serves_unchanged_series_from_cache(monkeypatch):
+    from datetime import date
+    from app.cache import ForecastCache, SeriesFingerprint
+
+    loaded = []
+
+    @asynccontextmanager
+    async def fake_connection(pool):
+        yield object()
+
+    async def fake_fingerprints(conn, account_id, pids, country):
+        return {pid: SeriesFingerprint(date(2024, 1, 1), date(2025, 1, 28), 28, 1.0, 0.0) for pid in pids}
+
+    async def fake_load(conn, account_id, pids, country):
+        loaded.extend(pids)
+        dates = pd.date_range('2025-01-01', periods=28, freq='D')
+        return {pid: pd.DataFrame({'date': dates, 'units_sold': [1.0] * 28}) for pid in pids}
+
+    async def fake_write(conn, account_id, country, items, run_id):
+        pass
+
+    monkeypatch.setattr(pipeline, 'connection', fake_connection)
+    monkeypatch.setattr(pipeline, 'load_fingerprints_many', fake_fingerprints)
+    monkeypatch.setattr(pipeline, 'load_sales_daily_many', fake_load)
+    monkeypatch.setattr(pipeline, 'write_forecasts_bulk', fake_write)
+
+    cache = ForecastCache()
+    pids = ['A', 'B', 'C']
+    first = asyncio.run(pipeline.run_pipeline(None, 'acc-1', pids, 'FR', 5, 'run-1', cache=cache))
+    second = asyncio.run(pipeline.run_pipeline(None, 'acc-1', pids, 'FR', 5, 'run-2', cache=cache))
+    assert loaded == pids
+    assert all(a is b for a, b in zip(first, second))
+    assert cache.stats()['hits'] == 3
+
+
+def test_pipeline_reads_history_cube_and_falls_back_to_postgres(monkeypatch):
+    import numpy as np
+    from app.model import DailySeries
+
+    loaded = []
+
+    class _Cube:
+        fresh = True
+
+        def series_many(self, account_id, pids, country):
+            return {pid: DailySeries(np.datetime64('2025-01-01'), np.full(28, 2.0)) for pid in pids} if self.fresh else None
+
+    @asynccontextmanager
+    async def fake_connection(pool):
+        yield object()
+
+    async def fake_load(conn, account_id, pids, country):
+        loaded.extend(pids)
+        return {pid: DailySeries(np.datetime64('2025-01-01'), np.full(28, 1.0)) for pid in pids}
+
+    async def fake_write(conn, account_id, country, items, run_id):
+        pass
+
+    monkeypatch.setattr(pipeline, 'connection', fake_connection)
+    monkeypatch.setattr(pipeline, 'load_sales_daily_many', fake_load)
+    monkeypatch.setattr(pipeline, 'write_forecasts_bulk', fake_write)
+
+    cube = _Cube()
+    results = asyncio.run(pipeline.run_pipeline(None, 'acc-1', ['A', 'B'], 'FR', 5, 'run-1', history=cube))
+    assert loaded == [] and [round(float(r.yhat.mean())) for r in results] == [2, 2]
+    cube.fresh = False
+    results = asyncio.run(pipeline.run_pipeline(None, 'acc-1', ['A', 'B'], 'FR', 5, 'run-2', history=cube))
+    assert loaded == ['A', 'B'] and [round(float(r.yhat.mean())) for r in results] == [1, 1]
+
+
+class _FakeConn:
+    def transaction(self):
+        @asynccontextmanager
+        async def tx():
+            yield
+        return tx()
+
+
+def _patch_io(monkeypatch, written, bad_write=()):
+    @asynccontextmanager
+    async def fake_connection(pool):
+        yield _FakeConn()
+
+    async def fake_load(conn, account_id, pids, country):
+        dates = pd.date_range('2025-01-01', periods=28, freq='D')
+        # a frame without units_sold makes the batch fit fail
+        return {pid: pd.DataFrame({'date': dates}) if pid.startswith('BADFIT') else pd.DataFrame({'date': dates, 'units_sold': [1.0] * 28}) for pid in pids}
+
+    async def fake_write(conn, account_id, country, items, run_id):
+        items = list(items)
+        if any(pid in bad_write for pid, _ in items):
+            raise RuntimeError('write failed')
+        written.extend(pid for pid, _ in items)
+
+    monkeypatch.setattr(pipeline, 'connection', fake_connection)
+    monkeypatch.setattr(pipeline, 'load_sales_daily_many', fake_load)
+    monkeypatch.setattr(pipeline, 'write_forecasts_bulk', fake_write)
+
+
+def test_isolated_pipeline_reports_failures_inline(monkeypatch):
+    written = []
+    _patch_io(monkeypatch, written, bad_write={'BADWRITE'})
+    pids = ['A', 'BADFIT', 'B', 'C', 'BADWRITE', 'D']
+
+    async def collect():
+        return [out async for out in pipeline.iter_pipeline(None, 'acc-1', pids, 'FR', 5, 'run-1', batch_size=2, isolate_errors=True)]
+
+    outcomes = asyncio.run(collect())
+    assert sorted(o.start for o in outcomes) == [0, 2, 4]
+    errors = {pid: msg for o in outcomes for pid, msg in o.errors.items()}
+    assert set(errors) == {'BADFIT', 'BADWRITE', 'D'}  # D shares the failed write batch
+    assert errors['BADWRITE'] == 'write failed'
+    assert sorted(written) == ['A', 'B', 'C']
+    ok = {pid for o in outcomes for pid, res in zip(o.product_ids, o.results) if res is not None}
+    assert ok == {'A', 'B', 'C'}
+
+
+def test_pipeline_without_isolation_aborts_on_first_error(monkeypatch):
+    _patch_io(monkeypatch, [])
+    try:
+        asyncio.run(pipeline.run_pipeline(None, 'acc-1', ['A', 'BADFIT'], 'FR', 5, 'run-1'))
+    except KeyError:
+        pass
+    else:
+        raise AssertionError('expected the run to fail')
+
+
+def test_cache_only_keeps_committed_forecasts(monkeypatch):
+    from datetime import date
+    from app.cache import ForecastCache, SeriesFingerprint
+
+    written = []
+    _patch_io(monkeypatch, written, bad_write={'BADWRITE'})
+    fp = SeriesFingerprint(date(2024, 1, 1), date(2025, 1, 28), 28, 1.0, 0.0)
+
+    async def fake_fingerprints(conn, account_id, pids, country):
+        return {pid: fp for pid in pids}
+
+    monkeypatch.setattr(pipeline, 'load_fingerprints_many', fake_fingerprints)
+
+    def cached(cache, pids):
+        return [pid for pid, hit in zip(pids, cache.get_many([(('acc-1', pid, 'FR', 5), fp) for pid in pids])) if hit is not None]
+
+    isolated = ForecastCache(skip_write=True)
+
+    async def drain():
+        async for _ in pipeline.iter_pipeline(None, 'acc-1', ['A', 'BADWRITE'], 'FR', 5, 'run-1', batch_size=1, cache=isolated, isolate_errors=True):
+            pass
+
+    asyncio.run(drain())
+    assert cached(isolated, ['A', 'BADWRITE']) == ['A']  # the failed batch is fitted again next run
+
+    aborted = ForecastCache(skip_write=True)
+    with pytest.raises(RuntimeError):
+        asyncio.run(pipeline.run_pipeline(None, 'acc-1', ['A', 'BADWRITE'], 'FR', 5, 'run-2', batch_size=1, cache=aborted))
+    assert cached(aborted, ['A', 'BADWRITE']) == []  # A was written, but its transaction rolled back
+
+
+def test_failed_batch_cancels_the_other_batches(monkeypatch):
+    loads = []
+
+    @asynccontextmanager
+    async def fake_connection(pool):
+        yield _FakeConn()
+
+    async def fake_load(conn, account_id, pids, country):
+        loads.append(pids[0])
+        if pids == ['SKU0']:
+            await asyncio.sleep(0.01)
+            raise RuntimeError('load failed')
+        await asyncio.Event().wait()  # never returns unless cancelled
+
+    monkeypatch.setattr(pipeline, 'connection', fake_connection)
+    monkeypatch.setattr(pipeline, 'load_sales_daily_many', fake_load)
+
+    async def scenario():
+        try:
+            await pipeline.run_pipeline(None, 'acc-1', [f'SKU{i}' for i in range(6)], 'FR', 5, 'run-1', max_concurrency=3, batch_size=1)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError('expected the run to fail')
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(scenario()) == []
+    assert loads == ['SKU0', 'SKU1', 'SKU2']  # the batches still waiting for a slot never started
+
+
+def test_run_endpoint_streams_ndjson(monkeypatch):
+    import json
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    written = []
+    _patch_io(monkeypatch, written)
+    monkeypatch.setenv('FORECAST_CACHE_ENABLED', '0')
+    body = {'account_id': 'acc-1', 'product_ids': ['A', 'BADFIT', 'B'], 'country': 'FR', 'horizon_days': 5}
+    with TestClient(app) as client:
+        r = client.post('/forecast/run?stream=1', json=body)
+    assert r.headers['content-type'].startswith('application/x-ndjson')
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert lines[0]['type'] == 'run' and lines[0]['products'] == 3
+    assert {(l['type'], l['product_id']) for l in lines[1:-1]} == {('product', 'A'), ('error', 'BADFIT'), ('product', 'B')}
+    assert lines[-1] == {**lines[-1], 'type': 'summary', 'status': 'completed', 'ok': 2, 'failed': 1, 'missing': 0}
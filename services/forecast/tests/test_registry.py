@@ -0,0 +1,132 @@
+import asyncio
+import threading
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+from forecasting.artifact_store import ArtifactRecord, ArtifactStore
+from app.main import app
+from app.model import forecast_batch
+from app.registry import ModelPublisher, ModelRegistry, model_key
+
+
+def _history(n=120, seed=5):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'date': pd.date_range('2025-01-01', periods=n, freq='D'), 'units_sold': rng.poisson(6, n).astype(float)})
+
+
+def test_published_model_predicts_like_the_fit(tmp_path):
+    registry = ModelRegistry(str(tmp_path), poll_seconds=0)
+    [res] = forecast_batch([_history()], horizon=21)
+    assert registry.publish('acc-1', 'FR', [('SKU1', res)], run_id='r1') == 1
+    pred = registry.get(model_key('SKU1', 'FR', account_id='acc-1')).predict(horizon=21)
+    assert pred.dates == res.dates
+    assert np.allclose(pred.yhat, res.yhat) and np.allclose(pred.p90, res.p90)
+
+
+def test_sba_model_keeps_its_stored_band(tmp_path):
+    from app.triage import forecast_triaged
+
+    units = np.zeros(200)
+    units[::9] = [1, 4, 2, 7, 1, 3, 9, 2, 1, 5, 2, 6, 1, 8, 2, 3, 1, 4, 2, 5, 1, 2, 6]
+    hist = pd.DataFrame({'date': pd.date_range('2026-01-01', periods=200, freq='D'), 'units_sold': units})
+    [res], _ = forecast_triaged([hist], horizon=7, as_of=np.datetime64('2026-07-19'))
+    assert res.method == 'sba' and res.yhat[0] - 1.2816 * res.sigma < 0  # a Gaussian band would go negative
+    registry = ModelRegistry(str(tmp_path), poll_seconds=0)
+    registry.publish('acc-1', 'FR', [('SKU1', res)], run_id='r1')
+    pred = registry.get(model_key('SKU1', 'FR', account_id='acc-1')).predict(horizon=7)
+    assert pred.method == 'sba' and (pred.p10 >= 0).all()
+    assert np.allclose(pred.yhat, res.yhat) and np.allclose(pred.p10, res.p10) and np.allclose(pred.p90, res.p90)
+
+
+def test_trainer_style_model_with_exog_and_holidays(tmp_path):
+    features = ['bias'] + [f'wd_{d}' for d in range(7)] + ['exog_holiday', 'price']
+    coef = np.array([5.0, 1, 2, 3, 4, 5, 6, 7, -4.0, 0.5])
+    store = ArtifactStore(tmp_path)
+    store.commit([store.write_segment([ArtifactRecord(
+        key='p7_FR_AMAZON', features=features, coef=coef, last_x=np.r_[np.ones(8), 0.0, 10.0], sigma=1.0,
+        last_date=np.datetime64('2025-12-20'), forecast=np.zeros((0, 3)), metrics={}, endog_len=100,
+        meta={'config': {'country': 'FR'}},
+    )])])
+    model = ModelRegistry(str(tmp_path)).find('acc-9', '7', 'FR', 'AMAZON')  # trainer models serve every account
+    assert model.key == 'p7_FR_AMAZON'
+    days, yhat = model.evaluate(horizon=7)
+    wd = (days.astype(np.int64) + 3) % 7
+    expected = 5.0 + coef[1 + wd] + 0.5 * 10.0 - 4.0 * (days == np.datetime64('2025-12-25'))
+    assert np.allclose(yhat, expected)
+
+    [res] = forecast_batch([_history()], horizon=7)
+    registry = ModelRegistry(str(tmp_path))
+    registry.publish('acc-9', 'FR', [('7', res)], run_id='r1')
+    assert registry.find('acc-9', '7', 'FR', 'AMAZON').key == 'p7_FR_AMAZON'  # the channel's model first
+    assert registry.find('acc-9', '7', 'FR', 'EBAY').key == 'aacc-9/p7_FR_GLOBAL'
+
+
+def test_registry_hot_reloads_new_artifacts(tmp_path):
+    registry = ModelRegistry(str(tmp_path), poll_seconds=0)
+    assert registry.get('aacc-1/pSKU1_FR_GLOBAL') is None
+    [res] = forecast_batch([_history()], horizon=7)
+    ModelRegistry(str(tmp_path)).publish('acc-1', 'FR', [('SKU1', res)], run_id='r1')  # another writer
+    assert registry.get('aacc-1/pSKU1_FR_GLOBAL') is not None
+
+
+def test_concurrent_commits_keep_every_key(tmp_path):
+    [res] = forecast_batch([_history()], horizon=7)
+    barrier = threading.Barrier(8)
+
+    def writer(w):
+        store = ArtifactStore(tmp_path)  # one store object per writer, as separate processes would have
+        records = ModelRegistry(str(tmp_path)).records(f'acc-{w}', 'FR', [(f'SKU{i}', res) for i in range(5)], run_id='r')
+        seg = store.write_segment(records, tag=f'w{w}')
+        barrier.wait()
+        store.commit([seg])
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(ArtifactStore(tmp_path).keys()) == 40
+
+
+def test_publisher_coalesces_and_compacts(tmp_path):
+    [res] = forecast_batch([_history()], horizon=7)
+    registry = ModelRegistry(str(tmp_path), poll_seconds=0)
+    for run in range(4):  # small segments of earlier publishes
+        registry.publish('acc-1', 'FR', [(f'SKU{run}', res)], run_id=f'r{run}')
+    before = {k: registry.store.load(k) for k in registry.store.keys()}
+
+    async def run():
+        publisher = ModelPublisher(registry, max_delay=60, max_segments=2, prune_seconds=0)
+        publisher.start()
+        for batch in range(3):
+            assert publisher.submit('acc-2', 'FR', [(f'SKU{batch}', res)], run_id='r9') == 1
+        await publisher.stop()
+        return publisher.stats()
+
+    stats = asyncio.run(run())
+    assert stats['flushes'] == 1 and stats['published'] == 3 and stats['compactions'] == 1
+    store = ArtifactStore(tmp_path)
+    assert len(store._segment_ids()) == 1 and len(store.keys()) == 7
+    for key, row in before.items():
+        after = store.load(key)
+        assert np.array_equal(after['coef'], row['coef']) and after['created'] == row['created'] and after['meta'] == row['meta']
+    assert registry.get(model_key('SKU2', 'FR', account_id='acc-2')) is not None
+
+
+def test_predict_endpoint(tmp_path, monkeypatch):
+    [res] = forecast_batch([_history()], horizon=7)
+    ModelRegistry(str(tmp_path)).publish('acc-1', 'FR', [('SKU1', res)], run_id='r1')
+    monkeypatch.setenv('FORECAST_MODEL_STORE', str(tmp_path))
+    with TestClient(app) as client:
+        r = client.post('/forecast/predict', json={'account_id': 'acc-1', 'product_id': 'SKU1', 'country': 'FR', 'horizon_days': 7})
+        missing = client.post('/forecast/predict', json={'account_id': 'acc-1', 'product_id': 'SKU2', 'country': 'FR'})
+        other_tenant = client.post('/forecast/predict', json={'account_id': 'acc-2', 'product_id': 'SKU1', 'country': 'FR'})
+        by_channel = client.post('/forecast/predict', json={'account_id': 'acc-1', 'product_id': 'SKU1', 'country': 'FR', 'channel': 'AMAZON', 'horizon_days': 7})
+    assert r.status_code == 200 and missing.status_code == 404 and other_tenant.status_code == 404
+    data = r.json()
+    assert data['key'] == 'aacc-1/pSKU1_FR_GLOBAL'
+    assert by_channel.status_code == 200 and by_channel.json()['key'] == 'aacc-1/pSKU1_FR_GLOBAL'  # no channel model: GLOBAL
+    assert [p['date'] for p in data['series']] == [d.date().isoformat() for d in res.dates]
+    assert np.allclose([p['yhat'] for p in data['series']], res.yhat)
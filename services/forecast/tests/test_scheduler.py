@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.scheduler import AdmissionRejected, FairScheduler
+
+
+def test_interactive_runs_skip_bulk_backlog_and_accounts_share_fairly():
+    order = []
+
+    async def run(sched, account, products, hold):
+        async with sched.admit(account, products):
+            order.append((account, products))
+            await hold.wait()
+
+    async def scenario():
+        sched = FairScheduler(slots=2, interactive_slots=1, interactive_products=50, account_concurrency=2)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(run(sched, 'big', 50_000, release)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert sched.stats()['running_bulk'] == 1 and sched.stats()['queued'] == 2  # one bulk slot only
+        tasks.append(asyncio.create_task(run(sched, 'small', 20, release)))
+        tasks.append(asyncio.create_task(run(sched, 'other', 5_000, release)))
+        await asyncio.sleep(0)
+        assert order == [('big', 50_000), ('small', 20)]  # the interactive run took the reserved slot at once
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    # 'other' was queued after big's backlog but its finish tag is far smaller
+    assert order[2:] == [('other', 5_000), ('big', 50_000), ('big', 50_000)]
+
+
+def test_saturation_is_rejected_with_retry_after():
+    async def scenario():
+        sched = FairScheduler(slots=1, interactive_slots=0, account_concurrency=1, max_queued=1, max_wait=0.05)
+        held = await sched.acquire('a', 10)
+        waiting = asyncio.create_task(sched.acquire('a', 10))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            await sched.acquire('b', 10)
+        with pytest.raises(AdmissionRejected) as late:
+            await waiting
+        sched.release(held)
+        background = await asyncio.wait_for(sched.acquire('b', 10, background=True), 1)  # never rejected
+        sched.release(background)
+        return full.value, late.value, sched.stats()
+
+    full, late, stats = asyncio.run(scenario())
+    assert (full.reason, late.reason) == ('queue_full', 'timeout') and full.retry_after >= 1
+    assert stats['rejected'] == {'queue_full': 1, 'timeout': 1} and stats['running'] == stats['queued'] == 0
+
+
+def test_rate_limited_run_gets_429():
+    with TestClient(app) as client:
+        app.state.scheduler = FairScheduler(account_rate=0.5, account_burst=1)
+        body = {'account_id': 'acc-1', 'product_ids': ['SKU1'], 'horizon_days': 7}
+        app.state.scheduler._take_token('acc-1')  # burst used up
+        r = client.post('/forecast/run', json=body)
+        assert r.status_code == 429 and r.json()['reason'] == 'rate'
+        assert 1 <= int(r.headers['Retry-After']) <= 2
+        assert client.get('/internal/scheduler').json()['rejected'] == {'rate': 1}
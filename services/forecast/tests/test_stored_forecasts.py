@@ -0,0 +1,107 @@
+from contextlib import asynccontextmanager
+from datetime import date
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.stored_forecasts import ResponseCache, format_cursor, ndjson_trailer, parse_cursor
+
+
+def test_cache_drops_account_on_write_and_never_stores_a_read_that_raced_one():
+    cache = ResponseCache(max_bytes=10)
+    cache.listening = True
+    gen = cache.generation('acc-1')
+    cache.put(('product', 'acc-1', ('SKU1',)), gen, b'abcd', 'application/json', '"t1"')
+    cache.put(('product', 'acc-2', ('SKU1',)), cache.generation('acc-2'), b'efgh', 'application/json', '"t2"')
+    assert cache.get(('product', 'acc-1', ('SKU1',)))[2] == '"t1"'
+
+    cache.invalidate('acc-1')  # a run wrote acc-1
+    assert cache.get(('product', 'acc-1', ('SKU1',))) is None and cache.get(('product', 'acc-2', ('SKU1',))) is not None
+    cache.put(('product', 'acc-1', ('SKU2',)), gen, b'old', 'application/json', '"t3"')  # read before the write
+    assert cache.get(('product', 'acc-1', ('SKU2',))) is None
+
+    cache.put(('product', 'acc-3', ('SKU1',)), cache.generation('acc-3'), b'ijklmnop', 'application/json', '"t4"')
+    assert cache.stats()['bytes'] <= 10 and cache.get(('product', 'acc-2', ('SKU1',))) is None  # LRU by bytes
+    cache.listening = False  # listener down: notifications may be missed
+    assert cache.get(('product', 'acc-3', ('SKU1',))) is None
+
+
+def test_keyset_cursor_round_trip():
+    row = ('SKU|7', date(2026, 11, 3), 'FR', 1.0, 0.5, 1.5, 'run')
+    assert parse_cursor(format_cursor(row)) == ('SKU|7', date(2026, 11, 3))
+    assert parse_cursor(None) is None
+    assert '"next_cursor":"SKU|7|2026-11-03"' in ndjson_trailer(10, row, more=True)
+    assert '"next_cursor":null' in ndjson_trailer(10, row, more=False)
+
+
+def test_export_last_page_has_no_next_cursor(monkeypatch):
+    import json
+
+    table = [(f'SKU{i}', date(2026, 11, 1), 'FR', 1.0, 0.5, 1.5, 'run') for i in range(6)]
+
+    async def rows(pool, account_id, after, limit, country, start, end, chunk_rows=4):
+        todo = [r for r in table if after is None or (r[0], r[1]) > after][:limit]
+        for i in range(0, len(todo), chunk_rows):
+            yield todo[i:i + chunk_rows]
+
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.delenv('ANALYTICS_DATABASE_URL', raising=False)
+    monkeypatch.setattr(main, 'iter_forecast_rows', rows)
+
+    def trailer(r):
+        return json.loads(r.text.splitlines()[-1])
+
+    with TestClient(main.app) as client:
+        first = client.get('/forecast/stored/acc-1', params={'limit': 3})
+        last = client.get('/forecast/stored/acc-1', params={'limit': 3, 'cursor': trailer(first)['next_cursor']})
+        assert trailer(first) == {'type': 'page', 'rows': 3, 'next_cursor': 'SKU2|2026-11-01'} and first.headers['X-Next-Cursor'] == 'SKU2|2026-11-01'
+        assert trailer(last) == {'type': 'page', 'rows': 3, 'next_cursor': None} and 'X-Next-Cursor' not in last.headers
+
+        monkeypatch.setattr(main, 'FORECAST_EXPORT_BUFFER_ROWS', 1)  # streamed pages
+        streamed = [trailer(client.get('/forecast/stored/acc-1', params={'limit': n})) for n in (4, 6)]
+    assert streamed == [{'type': 'page', 'rows': 4, 'next_cursor': 'SKU3|2026-11-01'}, {'type': 'page', 'rows': 6, 'next_cursor': None}]
+
+
+def test_listener_failures_are_logged(caplog):
+    import asyncio
+
+    async def scenario():
+        cache = ResponseCache()
+        task = asyncio.create_task(cache.listen('postgresql://nobody@/nodb?host=/nonexistent', retry_seconds=0.01))
+        while not caplog.records:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return cache
+
+    with caplog.at_level('ERROR', logger='app.stored_forecasts'):
+        cache = asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert not cache.listening and 'listener failed' in caplog.records[0].getMessage()
+
+
+def test_stored_forecast_etag_and_cache(monkeypatch):
+    reads = []
+
+    @asynccontextmanager
+    async def connection(pool):
+        yield None
+
+    async def load(conn, account_id, product_id, country, start, end):
+        reads.append(product_id)
+        return [(product_id, date(2026, 11, 1), 'FR', 3.0, 2.0, 4.0, 'run-1')]
+
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.delenv('ANALYTICS_DATABASE_URL', raising=False)
+    monkeypatch.setattr(main, 'connection', connection)
+    monkeypatch.setattr(main, 'load_product_forecast', load)
+    with TestClient(main.app) as client:
+        main.app.state.read_cache.listening = True
+        r = client.get('/forecast/stored/acc-1/SKU1')
+        assert r.status_code == 200 and r.json()['run_id'] == 'run-1' and r.json()['series'][0]['yhat'] == 3.0
+        again = client.get('/forecast/stored/acc-1/SKU1', headers={'If-None-Match': r.headers['ETag']})
+        assert again.status_code == 304 and again.headers['ETag'] == r.headers['ETag']
+        assert reads == ['SKU1']  # second answer came from the cache
+
+        main.app.state.read_cache.invalidate('acc-1')
+        assert client.get('/forecast/stored/acc-1/SKU1', headers={'If-None-Match': r.headers['ETag']}).status_code == 304
+        assert reads == ['SKU1', 'SKU1']  # re-read, same content, same ETag
@@ -0,0 +1,43 @@
+import numpy as np
+
+from app.model import DailySeries, forecast_batch
+from app.triage import forecast_triaged
+
+AS_OF = np.datetime64('2026-06-30')
+
+
+def _series(units, end=AS_OF):
+    units = np.asarray(units, dtype=float)
+    return DailySeries(end - len(units) + 1, units)
+
+
+def _croston_sba(days, sizes, first_interval, alpha):
+    # textbook recursion, one demand at a time
+    z, p = sizes[0], first_interval
+    for prev, day, size in zip(days, days[1:], sizes[1:]):
+        z += alpha * (size - z)
+        p += alpha * (day - prev - p)
+    return (1 - alpha / 2) * z / p
+
+
+def test_triage_routes_each_class_and_keeps_order():
+    rng = np.random.default_rng(3)
+    smooth = rng.poisson(6, 200)
+    intermittent = np.zeros(200)
+    demand_days = np.sort(rng.choice(200, 25, replace=False))
+    intermittent[demand_days] = rng.integers(1, 6, 25)
+    stale = np.r_[np.ones(50), np.zeros(5)]  # history stops 145 days before AS_OF
+    histories = [_series(smooth), _series(intermittent), _series(stale, end=AS_OF - 145), _series(np.zeros(30))]
+
+    results, report = forecast_triaged(histories, horizon=7, as_of=AS_OF, alpha=0.2)
+    assert [r.method for r in results] == ['weekday', 'sba', 'zero', 'zero']
+    assert report.counts == {'dead': 2, 'intermittent': 1, 'smooth': 1}
+    assert set(report.seconds) == {'classify', 'dead', 'intermittent', 'smooth'}
+
+    weekday = forecast_batch(histories[:1], horizon=7)[0]
+    assert np.allclose(results[0].yhat, weekday.yhat) and results[0].sigma == weekday.sigma
+    expected = _croston_sba(demand_days, intermittent[demand_days], (200 - demand_days[0]) / 25, 0.2)
+    assert np.allclose(results[1].yhat, expected) and results[1].p10[0] <= expected <= results[1].p90[0]
+    for res in results[1:]:
+        assert res.days[0] == AS_OF + 1 and len(res.days) == 7
+    assert not results[2].yhat.any() and results[2].coef[0] == 0.0
@@ -0,0 +1,145 @@
+"""Shared work queue against a scratch Postgres (DATABASE_URL), in a throwaway schema."""
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from pathlib import Path
+
+import psycopg
+import pytest
+from psycopg.conninfo import make_conninfo
+
+from app.db import create_pool
+from app.schemas import ForecastRunRequest
+from app.work_queue import QueueWorkers, WorkQueue
+
+MIGRATION = Path(__file__).resolve().parents[3] / 'db' / 'migrations' / '202610181400_add_forecast_queue.sql'
+
+
+@pytest.fixture
+def dsn():
+    base = os.getenv('DATABASE_URL')
+    if not base:
+        pytest.skip('DATABASE_URL not set')
+    schema = f'queue_test_{uuid.uuid4().hex[:8]}'
+    with psycopg.connect(base, autocommit=True) as conn:
+        conn.execute(f'CREATE SCHEMA {schema}')
+        conn.execute(f'SET search_path TO {schema}')
+        conn.execute(MIGRATION.read_text(encoding='utf-8').replace('public.', '').replace("'public'", 'current_schema()'))
+    try:
+        yield make_conninfo(base, options=f'-csearch_path={schema}')
+    finally:
+        with psycopg.connect(base, autocommit=True) as conn:
+            conn.execute(f'DROP SCHEMA {schema} CASCADE')
+
+
+def _request(n):
+    return ForecastRunRequest(account_id='acc-1', product_ids=[f'SKU{i}' for i in range(n)], horizon_days=7, country='FR')
+
+
+async def _conn(dsn):
+    return await psycopg.AsyncConnection.connect(dsn)
+
+
+def test_lease_carries_the_run_options(dsn):
+    async def scenario():
+        async with await _conn(dsn) as conn:
+            queue = WorkQueue(claim_size=10)
+            triaged = _request(2).model_copy(update={'triage': True, 'incremental': True, 'decay': 0.99})
+            await queue.enqueue(conn, triaged)
+            await queue.enqueue(conn, _request(1))
+            return await queue.claim(conn)
+
+    first, second = asyncio.run(scenario())
+    assert (first.triage, first.incremental, first.decay) == (True, True, 0.99)
+    assert (second.triage, second.incremental, second.decay) == (None, False, None)
+
+
+def test_expired_lease_is_reclaimed_and_counted_once(dsn):
+    async def scenario():
+        async with await _conn(dsn) as conn:
+            crashed = WorkQueue(lease_seconds=0.2, claim_size=3)
+            alive = WorkQueue(lease_seconds=30, claim_size=10, max_attempts=2)
+            run_id = await crashed.enqueue(conn, _request(5))
+            [lost] = await crashed.claim(conn)
+            assert lost.product_ids == ['SKU0', 'SKU1', 'SKU2']
+
+            [rest] = await alive.claim(conn)  # skips the leased rows
+            assert rest.product_ids == ['SKU3', 'SKU4']
+            await alive.complete(conn, rest, {'SKU4': 'boom'})  # retried: attempt 1 of 2
+            await asyncio.sleep(0.3)
+
+            [again] = await alive.claim(conn)
+            assert again.product_ids == ['SKU0', 'SKU1', 'SKU2', 'SKU4'] and alive.counts['reclaimed'] == 3
+            await crashed.complete(conn, lost)  # too late: its tasks belong to `alive` now
+            assert crashed.counts['lost'] == 3 and crashed.counts['done'] == 0
+            await alive.complete(conn, again, {'SKU4': 'boom again'})
+            return await alive.status(conn, run_id)
+
+    status = asyncio.run(scenario())
+    assert status['status'] == 'completed' and (status['done'], status['failed'], status['queued']) == (4, 1, 0)
+    assert status['errors'] == {'SKU4': 'boom again'}
+
+
+def test_heartbeat_stops_covering_a_wedged_lease(dsn):
+    async def scenario():
+        async with await _conn(dsn) as conn:
+            queue = WorkQueue(lease_seconds=30, claim_size=2, max_runtime_seconds=0.2)
+            await queue.enqueue(conn, _request(3))
+            [first] = await queue.claim(conn)
+            assert await queue.heartbeat(conn) == 2
+            await asyncio.sleep(0.3)  # the runner of `first` is wedged past max_runtime_seconds
+            [second] = await queue.claim(conn)
+            assert await queue.heartbeat(conn) == 1 and queue.counts['abandoned'] == 2
+            await queue.complete(conn, second)
+            return await queue.heartbeat(conn)
+
+    assert asyncio.run(scenario()) == 0
+
+
+def _worker(dsn, ready, go, results, per_product):
+    async def runner(lease):
+        await asyncio.sleep(per_product * len(lease.product_ids))  # stands in for load + fit + write
+        return {}
+
+    async def main():
+        queue = WorkQueue(claim_size=25)
+        async with create_pool(dsn) as pool:
+            await pool.wait()
+            ready.put(True)
+            go.wait()
+            await QueueWorkers(queue, runner, pool).drain()
+        return queue.counts['done']
+
+    results.put(asyncio.run(main()))
+
+
+def _drain(dsn, processes, products, per_product=0.01):
+    asyncio.run(_enqueue(dsn, products))
+    ctx = multiprocessing.get_context('spawn')
+    ready, go, results = ctx.Queue(), ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(dsn, ready, go, results, per_product)) for _ in range(processes)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.get(timeout=60)  # interpreters up, pools connected
+    t0 = time.perf_counter()
+    go.set()
+    done = [results.get(timeout=60) for _ in procs]
+    seconds = time.perf_counter() - t0
+    for p in procs:
+        p.join()
+    return seconds, done
+
+
+async def _enqueue(dsn, products):
+    async with await _conn(dsn) as conn:
+        await WorkQueue().enqueue(conn, _request(products))
+
+
+def test_throughput_scales_with_worker_processes(dsn):
+    one, [done] = _drain(dsn, 1, 200)
+    four, shares = _drain(dsn, 4, 200)
+    assert done == 200 and sum(shares) == 200 and min(shares) > 0  # every task once, all workers took a share
+    assert one / four > 3.2, (one, four)